@@ -1,16 +1,22 @@
 # CSI 106 S25
 # Hunter Schieding 5/7/25
 # Independent Study Spring 2025
-from src.sbox import compute_forward_sbox, compute_inverse_sbox
-from src.tk_window import RijndaelGui
+# For headless use (no GUI), see src/cli.py: python -m src --help
+from src.sbox import forward_sbox, inverse_sbox
 from src.byte_matrix import ByteMatrix16
-from ctypes import windll
+
+try:
+    from ctypes import windll # Windows only
+except ImportError:
+    windll = None
 
 if __name__ == "__main__":
     # EXTRA SETTINGS
     ByteMatrix16._debug_show_chars = False # Set to true to show character representations in debug text
-    windll.shcore.SetProcessDpiAwareness(1) # Fixes blurriness of Tkinter window on high-res monitors; however sometimes
-        # causes window to be too small.
+    if windll is not None:
+        windll.shcore.SetProcessDpiAwareness(1) # Fixes blurriness of Tkinter window on high-res monitors; however sometimes
+            # causes window to be too small.
 
-    # GUI
-    RijndaelGui(sbox=compute_forward_sbox(), i_sbox=compute_inverse_sbox())
\ No newline at end of file
+    # GUI; imported here so the rest of the package works without tkinter
+    from src.tk_window import RijndaelGui
+    RijndaelGui(sbox=forward_sbox(), i_sbox=inverse_sbox())
\ No newline at end of file
@@ -0,0 +1,447 @@
+# Reproducible benchmark suite. Run with: python -m src.bench [run|compare] --help
+# Every measurement is recorded as a result row; results can be written to JSON and compared between runs
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from src.rijndael import Rijndael, StateEngine, ENGINES
+from src.key_schedule import KeySchedule, _KEY_ROUND_SIZES
+from src.modes import MODES
+from src.sbox import compute_forward_sbox, compute_inverse_sbox, forward_sbox, inverse_sbox, affine_transform
+from src.galois_math import g_mul, g_mul_fast, find_galois_inverse, g_inverse
+from src.state import State, MIX_FORWARD, _mix_column
+from src.parallel import MIN_SEGMENT_SIZE, default_workers
+from src.gcm import GCM, ghash, ghash_tables
+from src.numpy_engine import NUMPY_AVAILABLE
+from src.cli import parse_size
+
+BENCH_KEY = bytearray(range(16))
+BENCH_IV = bytes(range(16, 32))
+SEED = 197 # Input data is generated from a fixed seed so runs are comparable
+DEFAULT_SIZES = (16, 1024, 64 * 1024, 1024 * 1024)
+FULL_SIZES = (16, 1024, 64 * 1024, 1024 * 1024, 16 * 1024 * 1024, 256 * 1024 * 1024, 1024 * 1024 * 1024)
+DEFAULT_BUDGET = 5.0 # Seconds; larger sizes are skipped once a measurement is predicted to take longer
+DEFAULT_THRESHOLD = 0.10 # Relative change counted as a regression by compare
+STARTUP_RUNS = 5
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Child process for the startup benchmark: prints a line as soon as the first ciphertext block exists
+_FIRST_BLOCK = ('import sys\n'
+                'from src.rijndael import Rijndael\n'
+                'Rijndael(bytes(range(16)), engine=sys.argv[1]).encrypt(bytes(16), add_padding=False)\n'
+                'print(flush=True)\n')
+
+def _data(size: int) -> bytes:
+    return random.Random(SEED).randbytes(size)
+
+def _result(name: str, params: dict, value: float, unit: str, higher_is_better: bool) -> dict:
+    return {'name': name, 'params': params, 'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+
+def _result_id(result: dict) -> str:
+    return result['name'] + ''.join(f' {k}={v}' for k, v in sorted(result['params'].items()))
+
+def machine_info() -> dict:
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    return {
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': sys.version.split()[0],
+        'implementation': platform.python_implementation(),
+        'numpy': numpy_version,
+    }
+
+# Times fn() and returns the best per-call time in microseconds
+def _best_us(fn, number: int, repeat: int=3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best / number * 1_000_000
+
+# Key expansion for each key size in _KEY_ROUND_SIZES
+def bench_key_expansion() -> list[dict]:
+    sbox = forward_sbox()
+    return [_result('key_expansion', {'key_size': size * 8},
+                    _best_us(lambda: KeySchedule(bytearray(range(size)), sbox), 200), 'us', False)
+            for size in _KEY_ROUND_SIZES]
+
+def bench_sbox() -> list[dict]:
+    return [_result('sbox_generation', {'table': 'forward'}, _best_us(compute_forward_sbox, 5), 'us', False),
+            _result('sbox_generation', {'table': 'inverse'}, _best_us(compute_inverse_sbox, 5), 'us', False)]
+
+# Reference (bit-serial / brute force) GF(2^8) arithmetic against the table-backed versions
+def galois_micro() -> list[tuple[str, float, float]]:
+    pairs = [(a, b) for a in range(0, 256, 5) for b in range(0, 256, 7)]
+    col = bytearray(b'\xdb\x13\x53\x45')
+    return [
+        ('multiply x1900', _best_us(lambda: [g_mul(a, b) for a, b in pairs], 20),
+                           _best_us(lambda: [g_mul_fast(a, b) for a, b in pairs], 20)),
+        ('inverse x255', _best_us(lambda: [find_galois_inverse(a) for a in range(1, 256)], 5),
+                         _best_us(lambda: [g_inverse(a) for a in range(1, 256)], 5)),
+        ('forward sbox', _best_us(_reference_forward_sbox, 3), _best_us(compute_forward_sbox, 3)),
+        ('mix column', _best_us(lambda: _reference_mix_column(col), 2000), _best_us(lambda: _mix_column(col), 2000)),
+    ]
+
+def _reference_forward_sbox() -> list:
+    return [0x63] + [affine_transform(find_galois_inverse(i)) for i in range(1, 256)]
+
+def _reference_mix_column(col: bytearray) -> bytearray:
+    new = bytearray(4)
+    for mix_row in range(4):
+        res = 0
+        for mix_col in range(4):
+            res ^= g_mul(col[mix_col], MIX_FORWARD[mix_row][mix_col])
+        new[mix_row] = res
+    return new
+
+def bench_galois() -> list[dict]:
+    results = []
+    for name, ref, fast in galois_micro():
+        results.append(_result('galois', {'op': name, 'impl': 'reference'}, ref, 'us', False))
+        results.append(_result('galois', {'op': name, 'impl': 'tables'}, fast, 'us', False))
+    return results
+
+# Memory traced while the state engine encrypts: (peak bytes for one block's rounds, bytes per block
+# allocated by a 256 block engine call and still alive when its output is returned)
+def state_memory(sbox_f: list, sbox_i: list, blocks: int=256) -> tuple[float, float]:
+    engine = StateEngine(KeySchedule(BENCH_KEY, sbox_f), sbox_f, sbox_i)
+    block = bytearray(os.urandom(16))
+    data = bytearray(os.urandom(16 * blocks))
+    engine.encrypt_blocks(block) # Warm up caches so one-time allocations are not counted
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        engine.encrypt_blocks(block)
+        single_peak = tracemalloc.get_traced_memory()[1] - base
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        out = engine.encrypt_blocks(data)
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    del out
+    return single_peak, peak / blocks
+
+# State engine figures before the in-place State operations, measured with state_memory and state_allocations
+# at that commit (AES-128). AddRoundKey then built a new State per call, leaving 4 memory blocks (155 bytes)
+# allocated per call, 11 calls per block; the other steps left nothing behind
+BASELINE_STATE_MEMORY = {
+    'single_block_peak': 1537,
+    'per_block_peak': 329,
+    'allocations_per_block': 44,
+    'allocated_bytes_per_block': 1705,
+}
+
+# AES-128 encryption steps of one block on a State, with how many times each runs per block
+def _state_steps(sbox_f: list) -> list[tuple[str, int, object]]:
+    round_key = KeySchedule(BENCH_KEY, sbox_f)[1]
+    return [
+        ('add_round_key', 11, lambda state: state.ixor_round_key(round_key)),
+        ('sub_bytes', 10, lambda state: state.sub_bytes(sbox_f)),
+        ('shift_rows', 10, lambda state: state.shift_rows()),
+        ('mix_columns', 9, lambda state: state.mix_columns()),
+    ]
+
+# Memory blocks (and bytes) each State step allocates and leaves behind per call, from tracemalloc snapshots
+# taken around `calls` calls whose return values are all kept. Returns {step: (blocks, bytes)} plus the per block
+# total under 'block'. Temporaries freed within a step show up in the peak figures of state_memory instead
+def state_allocations(sbox_f: list, calls: int=1000) -> dict[str, tuple[float, float]]:
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    out = {}
+    block_count = block_size = 0
+    for step, per_block, op in _state_steps(sbox_f):
+        states = [State(bytearray(os.urandom(16))) for _ in range(calls)]
+        results = [None] * calls
+        op(State()) # Warm up so one-time allocations are not counted
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            for idx in range(calls):
+                results[idx] = op(states[idx])
+            after = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'lineno')
+        count = sum(max(stat.count_diff, 0) for stat in stats) / calls
+        size = sum(max(stat.size_diff, 0) for stat in stats) / calls
+        out[step] = (count, size)
+        block_count += count * per_block
+        block_size += size * per_block
+    out['block'] = (block_count, block_size)
+    return out
+
+def bench_memory() -> list[dict]:
+    single, per_block = state_memory(forward_sbox(), inverse_sbox())
+    allocations, allocated = state_allocations(forward_sbox())['block']
+    current = {'single_block_peak': single, 'per_block_peak': per_block,
+               'allocations_per_block': allocations, 'allocated_bytes_per_block': allocated}
+    units = {'allocations_per_block': 'blocks'}
+    results = []
+    for measure, value in current.items():
+        unit = units.get(measure, 'B')
+        results.append(_result('state_memory', {'measure': measure}, value, unit, False))
+        results.append(_result('state_memory', {'measure': measure, 'code': 'baseline'},
+                               BASELINE_STATE_MEMORY[measure], unit, False))
+    return results
+
+# Latency of encrypting one block with each engine
+def bench_latency(engines) -> list[dict]:
+    block = _data(16)
+    results = []
+    for engine in engines:
+        r = Rijndael(BENCH_KEY, engine=engine)
+        results.append(_result('block_latency', {'engine': engine},
+                               _best_us(lambda: r.encrypt(block, add_padding=False), 50), 'us', False))
+    return results
+
+# Returns (seconds to encrypt, seconds to decrypt) `data`, best of `repeat`
+def _time_round_trip(r: Rijndael, data: bytes, repeat: int) -> tuple[float, float]:
+    best_e = best_d = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ciphertext = r.encrypt(data)
+        best_e = min(best_e, time.perf_counter() - start)
+        start = time.perf_counter()
+        plaintext = r.decrypt(ciphertext)
+        best_d = min(best_d, time.perf_counter() - start)
+    if plaintext != data:
+        raise RuntimeError(f'{r.engine}/{r.mode}: decrypted output does not match input')
+    return best_e, best_d
+
+# Returns MB/s for encrypting then decrypting `size` bytes with the given engine and mode
+def throughput(engine: str, size: int, mode: str='ecb', repeat: int=3) -> tuple[float, float]:
+    r = Rijndael(BENCH_KEY, engine=engine, mode=mode, iv=BENCH_IV if mode != 'ecb' else None)
+    enc, dec = _time_round_trip(r, _data(size), repeat)
+    mb = size / 1_000_000
+    return mb / enc, mb / dec
+
+# Bulk throughput for every engine, mode and size. Once a size is predicted (linearly from the previous
+# size) to take longer than `budget` seconds, the remaining sizes for that engine/mode are skipped
+def bench_throughput(engines, modes, sizes, budget: float=DEFAULT_BUDGET, repeat: int=3) -> list[dict]:
+    results = []
+    for engine in engines:
+        for mode in modes:
+            r = Rijndael(BENCH_KEY, engine=engine, mode=mode, iv=BENCH_IV if mode != 'ecb' else None)
+            prev_size = prev_time = None
+            for size in sizes:
+                if prev_time is not None and prev_time * size / prev_size * repeat > budget:
+                    break
+                enc, dec = _time_round_trip(r, _data(size), repeat)
+                prev_size, prev_time = size, enc + dec
+                mb = size / 1_000_000
+                params = {'engine': engine, 'mode': mode, 'size': size}
+                results.append(_result('throughput', {**params, 'op': 'encrypt'}, mb / enc, 'MB/s', True))
+                results.append(_result('throughput', {**params, 'op': 'decrypt'}, mb / dec, 'MB/s', True))
+    return results
+
+# GHASH table construction and hashing speed, then GCM encryption and decryption throughput per engine and size
+# (skipped past `budget` like bench_throughput)
+def bench_gcm(engines, sizes, budget: float=DEFAULT_BUDGET, repeat: int=3) -> list[dict]:
+    h = int.from_bytes(_data(16))
+    tables = ghash_tables(h)
+    ghash_data = _data(64 * 1024)
+    results = [_result('ghash_tables', {}, _best_us(lambda: ghash_tables(h), 5), 'us', False),
+               _result('ghash', {'size': len(ghash_data)},
+                       len(ghash_data) / _best_us(lambda: ghash(tables, 0, ghash_data), 1, repeat), 'MB/s', True)]
+    nonce, aad = BENCH_IV[:12], _data(32)
+    for engine in engines:
+        gcm = GCM(BENCH_KEY, engine=engine)
+        prev_size = prev_time = None
+        for size in sizes:
+            if prev_time is not None and prev_time * size / prev_size * repeat > budget:
+                break
+            data = _data(size)
+            best_e = best_d = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                ciphertext, tag = gcm.encrypt(nonce, data, aad)
+                best_e = min(best_e, time.perf_counter() - start)
+                start = time.perf_counter()
+                plaintext = gcm.decrypt(nonce, ciphertext, tag, aad)
+                best_d = min(best_d, time.perf_counter() - start)
+            if plaintext != data:
+                raise RuntimeError(f'{engine}/gcm: decrypted output does not match input')
+            prev_size, prev_time = size, best_e + best_d
+            mb = size / 1_000_000
+            params = {'engine': engine, 'size': size}
+            results.append(_result('gcm_throughput', {**params, 'op': 'encrypt'}, mb / best_e, 'MB/s', True))
+            results.append(_result('gcm_throughput', {**params, 'op': 'decrypt'}, mb / best_d, 'MB/s', True))
+    return results
+
+# Records per second for many small records with their own keys: a Rijndael instance per record against one
+# BatchCipher call for all of them
+def bench_multikey(records: int=10000, size: int=32, mode: str='cbc') -> list[dict]:
+    from src.multikey import BatchCipher
+    rng = random.Random(SEED)
+    keys = [rng.randbytes(16) for _ in range(records)]
+    messages = [rng.randbytes(size) for _ in range(records)]
+    ivs = [rng.randbytes(16) for _ in range(records)]
+    sample = max(1, records // 20) # The per-record loop is timed on a sample
+    start = time.perf_counter()
+    for key, message, iv in zip(keys[:sample], messages[:sample], ivs[:sample]):
+        Rijndael(key, engine='ttable', mode=mode, iv=iv).encrypt(message)
+    per_record = sample / (time.perf_counter() - start)
+    batch = BatchCipher(mode)
+    start = time.perf_counter()
+    batch.encrypt(keys, messages, ivs=ivs)
+    batched = records / (time.perf_counter() - start)
+    params = {'mode': mode, 'records': records, 'size': size}
+    return [_result('multikey', {**params, 'api': 'rijndael_per_record'}, per_record, 'records/s', True),
+            _result('multikey', {**params, 'api': 'batch'}, batched, 'records/s', True)]
+
+# Returns encryption MB/s for the process pool with the given worker count
+def parallel_throughput(workers: int, size: int, engine: str='ttable', mode: str='ctr') -> float:
+    data = _data(size)
+    with Rijndael(BENCH_KEY, engine=engine, mode=mode, iv=BENCH_IV, workers=workers) as r:
+        r.encrypt(data[:2 * MIN_SEGMENT_SIZE]) # Start worker processes outside the timed run
+        start = time.perf_counter()
+        r.encrypt(data)
+        elapsed = time.perf_counter() - start
+    return size / 1_000_000 / elapsed
+
+def bench_parallel(size: int, max_workers: int) -> list[dict]:
+    return [_result('parallel', {'engine': 'ttable', 'mode': 'ctr', 'size': size, 'workers': workers},
+                    parallel_throughput(workers, size), 'MB/s', True)
+            for workers in range(1, max_workers + 1)]
+
+# Milliseconds from starting a fresh interpreter until it prints its first line, best of `runs`
+def _startup_ms(args: list[str], runs: int, stdin: bytes=None) -> float:
+    env = {**os.environ, 'PYTHONPATH': _PACKAGE_ROOT}
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        with subprocess.Popen([sys.executable, *args], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, cwd=_PACKAGE_ROOT, env=env) as proc:
+            if stdin is not None:
+                proc.stdin.write(stdin)
+            proc.stdin.close()
+            proc.stdout.read(1)
+            best = min(best, time.perf_counter() - start)
+        if proc.returncode:
+            raise RuntimeError(f'{" ".join(args)}: exited with status {proc.returncode}')
+    return best * 1000
+
+# Time from process start to the first ciphertext block: a bare interpreter for reference, the library with
+# each engine, and the command line tool encrypting one block from stdin
+def bench_startup(engines, runs: int=STARTUP_RUNS) -> list[dict]:
+    results = [_result('startup', {'target': 'python'}, _startup_ms(['-c', 'print(flush=True)'], runs), 'ms', False)]
+    for engine in engines:
+        results.append(_result('startup', {'target': 'first_block', 'engine': engine},
+                               _startup_ms(['-c', _FIRST_BLOCK, engine], runs), 'ms', False))
+    cli = ['-m', 'src', 'encrypt', '-x', BENCH_KEY.hex(), '-q', '--no-padding']
+    results.append(_result('startup', {'target': 'cli'}, _startup_ms(cli, runs, stdin=_data(16)), 'ms', False))
+    return results
+
+def print_results(results: list[dict]) -> None:
+    for result in results:
+        print(f'{_result_id(result):<72}{result["value"]:>14.3f} {result["unit"]}')
+
+def run(args) -> list[dict]:
+    engines = args.engines or list(ENGINES)
+    modes = args.modes or list(MODES)
+    sizes = args.sizes or (FULL_SIZES if args.full else DEFAULT_SIZES)
+    unknown = [e for e in engines if e not in ENGINES]
+    if unknown:
+        raise SystemExit(f'Unknown or unavailable engine(s): {", ".join(unknown)}')
+    sections = [
+        ('startup', lambda: bench_startup(engines)),
+        ('key expansion', bench_key_expansion),
+        ('S-Box generation', bench_sbox),
+        ('GF(2^8) arithmetic', bench_galois),
+        ('state engine memory', bench_memory),
+        ('single block latency', lambda: bench_latency(engines)),
+        ('bulk throughput', lambda: bench_throughput(engines, modes, sizes, args.budget)),
+        ('GCM', lambda: bench_gcm(engines, sizes, args.budget)),
+    ]
+    if NUMPY_AVAILABLE:
+        sections.append(('multi-key batch', bench_multikey))
+    if args.parallel:
+        max_workers = max(2, args.workers or default_workers())
+        sections.append(('parallel scaling', lambda: bench_parallel(args.parallel_size, max_workers)))
+    results = []
+    for title, func in sections:
+        print(f'== {title}')
+        section = func()
+        print_results(section)
+        results += section
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'machine': machine_info(), 'timestamp': time.time(), 'seed': SEED, 'results': results},
+                      f, indent=2)
+        print(f'Results written to {args.output}')
+    return results
+
+# Compares two result files; returns the rows that got worse by more than threshold
+def compare(old: dict, new: dict, threshold: float=DEFAULT_THRESHOLD) -> list[tuple[str, float, float, float]]:
+    old_results = {_result_id(r): r for r in old['results']}
+    regressions = []
+    for result in new['results']:
+        before = old_results.get(_result_id(result))
+        if before is None or not before['value'] or not result['value']:
+            continue
+        # Positive change is always an improvement, whichever direction the unit goes
+        change = result['value'] / before['value'] - 1
+        if not result['higher_is_better']:
+            change = before['value'] / result['value'] - 1
+        flag = 'REGRESSION' if change < -threshold else ''
+        print(f'{_result_id(result):<72}{before["value"]:>12.3f}{result["value"]:>12.3f}{change:>+9.1%} {flag}')
+        if flag:
+            regressions.append((_result_id(result), before['value'], result['value'], change))
+    return regressions
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m src.bench', description='Rijndael benchmark suite')
+    sub = parser.add_subparsers(dest='command')
+    run_p = sub.add_parser('run', help='run benchmarks (default)')
+    run_p.add_argument('-o', '--output', help='write results as JSON to this file')
+    run_p.add_argument('--engines', nargs='+', help=f'engines to run (default: all available: {", ".join(ENGINES)})')
+    run_p.add_argument('--modes', nargs='+', choices=MODES, help='modes to run (default: all)')
+    run_p.add_argument('--sizes', nargs='+', type=parse_size, help='input sizes, e.g. 16 1k 64k 1m 1g')
+    run_p.add_argument('--full', action='store_true', help='input sizes from 16 B up to 1 GiB')
+    run_p.add_argument('--budget', type=float, default=DEFAULT_BUDGET,
+                       help='seconds per measurement before larger sizes are skipped')
+    run_p.add_argument('--parallel', action='store_true', help='include process pool scaling')
+    run_p.add_argument('--parallel-size', type=parse_size, default=4 * 1024 * 1024)
+    run_p.add_argument('--workers', type=int, help='maximum workers for the scaling run (default: all cores)')
+    startup_p = sub.add_parser('startup', help='only measure time from process start to the first ciphertext block')
+    startup_p.add_argument('--engines', nargs='+', help='engines to run (default: all available)')
+    startup_p.add_argument('--runs', type=int, default=STARTUP_RUNS, help='runs per target; the best is reported')
+    cmp_p = sub.add_parser('compare', help='compare two result files and flag regressions')
+    cmp_p.add_argument('old')
+    cmp_p.add_argument('new')
+    cmp_p.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                       help='relative slowdown counted as a regression (default 0.10)')
+
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in ('run', 'startup', 'compare', '-h', '--help'):
+        argv = ['run'] + argv
+    args = parser.parse_args(argv)
+    if args.command == 'compare':
+        with open(args.old) as f_old, open(args.new) as f_new:
+            regressions = compare(json.load(f_old), json.load(f_new), args.threshold)
+        print(f'{len(regressions)} regression(s) beyond {args.threshold:.0%}')
+        return 1 if regressions else 0
+    if args.command == 'startup':
+        engines = args.engines or list(ENGINES)
+        unknown = [e for e in engines if e not in ENGINES]
+        if unknown:
+            raise SystemExit(f'Unknown or unavailable engine(s): {", ".join(unknown)}')
+        print_results(bench_startup(engines, args.runs))
+        return 0
+    run(args)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
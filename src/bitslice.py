@@ -0,0 +1,209 @@
+# Bitsliced engine: a batch of blocks is transposed into 8 bit planes, one Python int per bit of the byte. Plane b
+# has one 8 bit lane per byte position of a block group; bit k of a lane is bit b of that byte in the k-th of 8
+# equal groups of blocks, so every bit of every plane is in use. Each AES step is a fixed sequence of
+# XOR/AND/shift operations on whole planes, with no data-dependent table lookups or branches:
+#   SubBytes     x^254 in GF(2^8) (the inversion used by sbox.py) as bitsliced multiplies and squarings,
+#                followed by the affine transform
+#   ShiftRows    byte permutation done with lane shifts and masks
+#   MixColumns   column rotations and xtime on the planes
+# Python ints drop leading zero digits, so timing can still vary slightly with the data; this removes lookups,
+# not every side channel. Only the standard S-Box can be computed this way
+from src.galois_math import g_mul_fast
+from src.key_schedule import KeySchedule
+from src.sbox import forward_sbox, inverse_sbox
+from src.state import SHIFT_ROWS, SHIFT_ROWS_INV
+
+GROUPS = 8 # Block groups packed into the bits of each lane
+# Source byte in the column for the MixColumns row rotations: new[4c + r] = old[4c + (r + k) % 4]
+_ROT1 = [4 * c + (r + 1) % 4 for c in range(4) for r in range(4)]
+_ROT2 = [4 * c + (r + 2) % 4 for c in range(4) for r in range(4)]
+# For each output bit of a squaring, the input bits XORed into it (squaring is linear in GF(2^8))
+_SQUARE_TERMS = [[i for i in range(8) if g_mul_fast(1 << i, 1 << i) >> j & 1] for j in range(8)]
+
+# Blocks per group for a batch of n_blocks; the batch is padded with zero blocks up to GROUPS times this
+def group_size(n_blocks: int) -> int:
+    return -(-n_blocks // GROUPS)
+
+# Transposes GROUPS * group_blocks blocks into bit planes. Bit b of every byte is moved to bit 0 with a shift and
+# a mask rather than a lookup table, so no memory access depends on the data
+def to_planes(data: bytes | bytearray, group_blocks: int) -> list[int]:
+    size = 16 * group_blocks
+    low_bits = int.from_bytes(b'\x01' * size, 'little')
+    groups = [int.from_bytes(data[k * size : (k + 1) * size], 'little') for k in range(GROUPS)]
+    planes = []
+    for b in range(8):
+        plane = 0
+        for k, group in enumerate(groups):
+            plane |= ((group >> b) & low_bits) << k
+        planes.append(plane)
+    return planes
+
+def from_planes(planes: list[int], group_blocks: int) -> bytearray:
+    size = 16 * group_blocks
+    low_bits = int.from_bytes(b'\x01' * size, 'little')
+    out = bytearray(GROUPS * size)
+    for k in range(GROUPS):
+        group = 0
+        for b, plane in enumerate(planes):
+            group |= ((plane >> k) & low_bits) << b
+        out[k * size : (k + 1) * size] = group.to_bytes(size, 'little')
+    return out
+
+# (bit shift, mask) pairs that apply a 16 byte permutation (dest k <- src perm[k]) to every block of a group
+def _permutation(perm: list[int], group_blocks: int) -> list[tuple[int, int]]:
+    groups: dict[int, bytearray] = {}
+    for dest, src in enumerate(perm):
+        groups.setdefault(src - dest, bytearray(16))[dest] = 0xFF
+    return [(delta * 8, int.from_bytes(bytes(pattern) * group_blocks, 'little')) for delta, pattern in groups.items()]
+
+def _permute(plane: int, ops: list[tuple[int, int]]) -> int:
+    out = 0
+    for shift, mask in ops:
+        if shift > 0:
+            out |= (plane >> shift) & mask
+        elif shift < 0:
+            out |= (plane << -shift) & mask
+        else:
+            out |= plane & mask
+    return out
+
+# Product of two bitsliced GF(2^8) elements: schoolbook multiply, then reduction with x^8 = x^4 + x^3 + x + 1
+def _gf_mul(a: list[int], b: list[int]) -> list[int]:
+    p = [0] * 15
+    for i in range(8):
+        ai = a[i]
+        for j in range(8):
+            p[i + j] ^= ai & b[j]
+    for k in range(14, 7, -1):
+        pk = p[k]
+        p[k - 4] ^= pk
+        p[k - 5] ^= pk
+        p[k - 7] ^= pk
+        p[k - 8] ^= pk
+    return p[:8]
+
+def _gf_square(a: list[int]) -> list[int]:
+    out = []
+    for terms in _SQUARE_TERMS:
+        x = 0
+        for i in terms:
+            x ^= a[i]
+        out.append(x)
+    return out
+
+# x^254 = x^-1 (and 0 for 0): x^2, x^3, x^12, x^15, x^240, x^252, x^254
+def _gf_inverse(x: list[int]) -> list[int]:
+    x2 = _gf_square(x)
+    x3 = _gf_mul(x2, x)
+    x12 = _gf_square(_gf_square(x3))
+    x15 = _gf_mul(x12, x3)
+    x240 = _gf_square(_gf_square(_gf_square(_gf_square(x15))))
+    x252 = _gf_mul(x240, x12)
+    return _gf_mul(x252, x2)
+
+# Multiplication by x (xtime) with reduction by 0x1b
+def _xtime(a: list[int]) -> list[int]:
+    a7 = a[7]
+    return [a7, a[0] ^ a7, a[1], a[2] ^ a7, a[3] ^ a7, a[4], a[5], a[6]]
+
+# Masks and round key planes for one group size
+class _BatchLayout:
+    __slots__ = ('group_blocks', 'ones', 'shift_rows', 'shift_rows_inv', 'rot1', 'rot2', 'keys', 'dec_keys')
+
+    def __init__(self, round_keys: KeySchedule, group_blocks: int):
+        self.group_blocks = group_blocks
+        self.ones = int.from_bytes(b'\xff' * (16 * group_blocks), 'little')
+        self.shift_rows = _permutation(SHIFT_ROWS, group_blocks)
+        self.shift_rows_inv = _permutation(SHIFT_ROWS_INV, group_blocks)
+        self.rot1 = _permutation(_ROT1, group_blocks)
+        self.rot2 = _permutation(_ROT2, group_blocks)
+        self.keys = self._key_planes(round_keys.flat, group_blocks)
+        self.dec_keys = self._key_planes(round_keys.dec_flat, group_blocks)
+
+    # Same key for every group: each 0/1 lane becomes 0x00/0xFF
+    @staticmethod
+    def _key_planes(flat: bytes, group_blocks: int) -> list[list[int]]:
+        low_bits = int.from_bytes(b'\x01' * (16 * group_blocks), 'little')
+        keys = [int.from_bytes(flat[idx : idx + 16] * group_blocks, 'little') for idx in range(0, len(flat), 16)]
+        return [[((key >> b) & low_bits) * 0xFF for b in range(8)] for key in keys]
+
+class BitsliceEngine:
+    def __init__(self, round_keys: KeySchedule, sbox_f: list, sbox_i: list):
+        if tuple(sbox_f) != forward_sbox() or tuple(sbox_i) != inverse_sbox():
+            raise ValueError(f'{type(self).__name__}: Only the standard Rijndael S-Box can be bitsliced')
+        self._round_keys = round_keys
+        self._layout = None # Layout for the last batch size used
+
+    def _get_layout(self, group_blocks: int) -> _BatchLayout:
+        layout = self._layout
+        if layout is None or layout.group_blocks != group_blocks:
+            layout = self._layout = _BatchLayout(self._round_keys, group_blocks)
+        return layout
+
+    # Pads data to a whole number of groups and returns it with the layout for that group size
+    def _prepare(self, data) -> tuple[bytes, _BatchLayout]:
+        group_blocks = group_size(len(data) // 16)
+        padding = 16 * GROUPS * group_blocks - len(data)
+        return bytes(data) + bytes(padding), self._get_layout(group_blocks)
+
+    def _sub_bytes(self, s: list[int], ones: int) -> list[int]:
+        x = _gf_inverse(s)
+        # Affine transform: bit i ^ bits i-1 .. i-4 (cyclic), then ^ 0x63
+        out = [x[i] ^ x[i - 1] ^ x[i - 2] ^ x[i - 3] ^ x[i - 4] for i in range(8)]
+        for i in (0, 1, 5, 6):
+            out[i] ^= ones
+        return out
+
+    def _sub_bytes_inv(self, s: list[int], ones: int) -> list[int]:
+        # Inverse affine transform: bits i+2, i+5, i+7 (cyclic), then ^ 0x05
+        x = [s[(i + 2) % 8] ^ s[(i + 5) % 8] ^ s[(i + 7) % 8] for i in range(8)]
+        x[0] ^= ones
+        x[2] ^= ones
+        return _gf_inverse(x)
+
+    # out_r = 2a_r ^ 3a_r+1 ^ a_r+2 ^ a_r+3 = xtime(t_r) ^ a_r+1 ^ t_r+2 with t_r = a_r ^ a_r+1
+    @staticmethod
+    def _mix_columns(s: list[int], layout: _BatchLayout) -> list[int]:
+        rot1, rot2 = layout.rot1, layout.rot2
+        a1 = [_permute(p, rot1) for p in s]
+        t = [p ^ q for p, q in zip(s, a1)]
+        xt = _xtime(t)
+        return [x ^ q ^ _permute(p, rot2) for x, q, p in zip(xt, a1, t)]
+
+    # InvMixColumns = MixColumns after a_r ^= 4(a_r ^ a_r+2)
+    @classmethod
+    def _mix_columns_inv(cls, s: list[int], layout: _BatchLayout) -> list[int]:
+        rot2 = layout.rot2
+        w = _xtime(_xtime([p ^ _permute(p, rot2) for p in s]))
+        return cls._mix_columns([p ^ q for p, q in zip(s, w)], layout)
+
+    # Encrypts data made of whole 16 byte blocks
+    def encrypt_blocks(self, data: bytes | bytearray) -> bytearray:
+        if not data:
+            return bytearray()
+        padded, layout = self._prepare(data)
+        keys, ones = layout.keys, layout.ones
+        s = [p ^ k for p, k in zip(to_planes(padded, layout.group_blocks), keys[0])]
+        for key_idx in range(1, len(keys)):
+            s = self._sub_bytes(s, ones)
+            s = [_permute(p, layout.shift_rows) for p in s]
+            if key_idx != len(keys) - 1:
+                s = self._mix_columns(s, layout)
+            s = [p ^ k for p, k in zip(s, keys[key_idx])]
+        return from_planes(s, layout.group_blocks)[:len(data)]
+
+    # Decrypts data made of whole 16 byte blocks with the equivalent inverse cipher, which has the same round
+    # structure as encryption
+    def decrypt_blocks(self, data: bytes | bytearray) -> bytearray:
+        if not data:
+            return bytearray()
+        padded, layout = self._prepare(data)
+        keys, ones = layout.dec_keys, layout.ones
+        s = [p ^ k for p, k in zip(to_planes(padded, layout.group_blocks), keys[0])]
+        for key_idx in range(1, len(keys)):
+            s = self._sub_bytes_inv(s, ones)
+            s = [_permute(p, layout.shift_rows_inv) for p in s]
+            if key_idx != len(keys) - 1:
+                s = self._mix_columns_inv(s, layout)
+            s = [p ^ k for p, k in zip(s, keys[key_idx])]
+        return from_planes(s, layout.group_blocks)[:len(data)]
@@ -0,0 +1,74 @@
+from src.state import State
+
+# Length of the PKCS#7 padding at the end of data (any buffer); raises ValueError unless the last byte is 1-16,
+# no more than len(data), and every padding byte holds that value
+def pkcs7_padding_length(data) -> int:
+    pad = data[-1] if len(data) else 0
+    if not 1 <= pad <= min(16, len(data)) or data[len(data) - pad:] != pad.to_bytes(1) * pad:
+        raise ValueError('Invalid PKCS#7 padding')
+    return pad
+
+# Whole 16 byte blocks stored back to back in one bytearray. Blocks are addressed by offset instead of being
+# split into separate objects, and padding is only ever written to or trimmed from the tail, so packing a
+# message costs one buffer (the output) whatever its size
+class BlockView:
+    __slots__ = ('buffer',)
+
+    def __init__(self, buffer: bytearray):
+        if len(buffer) % 16:
+            raise ValueError(f'{type(self).__name__}: Buffer must hold whole 16 byte blocks ({len(buffer)} bytes)')
+        self.buffer = buffer
+
+    # Copies data into a new buffer allocated at its final size. With padding, PKCS#7 padding is written to
+    # the tail (always 1-16 bytes); without it a final partial block is filled with null bytes like State does
+    @classmethod
+    def from_data(cls, data, padding: bool=False) -> 'BlockView':
+        length = len(data)
+        if padding:
+            size = (length // 16 + 1) * 16
+        else:
+            size = -(-length // 16) * 16
+        buffer = bytearray(size)
+        buffer[:length] = data
+        if padding:
+            pad = size - length
+            buffer[length:] = pad.to_bytes(1) * pad
+        return cls(buffer)
+
+    def __len__(self):
+        return len(self.buffer) // 16
+
+    def __getitem__(self, idx: int) -> memoryview:
+        offset = self.offsets()[idx]
+        return memoryview(self.buffer)[offset : offset + 16]
+
+    def __repr__(self):
+        return f"{type(self)}, blocks={len(self)}"
+
+    def offsets(self) -> range:
+        return range(0, len(self.buffer), 16)
+
+    # Lazily yields each block as a State. A single State is reused: it is loaded with the block before being
+    # yielded and its data is written back to the buffer when the next block is requested, so the loop must
+    # run to the end for the last block to be stored
+    def states(self):
+        state = State()
+        for offset in self.offsets():
+            self.load_state(state, offset)
+            yield state
+            self.store_state(state, offset)
+
+    # Copies the block at offset into state (packing)
+    def load_state(self, state: State, offset: int) -> None:
+        state.data[:] = self.buffer[offset : offset + 16]
+
+    # Writes state back to the block at offset (unpacking)
+    def store_state(self, state: State, offset: int) -> None:
+        self.buffer[offset : offset + 16] = state.data
+
+    # Removes PKCS#7 padding by trimming the buffer tail in place; returns the buffer. Raises ValueError if the
+    # padding is invalid
+    def unpad(self) -> bytearray:
+        if self.buffer:
+            del self.buffer[len(self.buffer) - pkcs7_padding_length(self.buffer):]
+        return self.buffer
@@ -14,10 +14,12 @@ class ByteMatrix16:
     This does have an effect on how some AES functions operate in Python, so row/column based
     functions have to be "backwards" to accommodate this behavior.
     """
+    __slots__ = ('data',)
     _debug_show_chars = False
 
-    def __init__(self, text_bytes:bytearray=bytearray(16)):
-        self.data = text_bytes
+    def __init__(self, text_bytes:bytearray=None):
+        # New buffer per instance; a shared default would be modified by in-place operations
+        self.data = bytearray(16) if text_bytes is None else text_bytes
         # Ensure text is 16 bytes
         bytes_len = len(self.data)
         if bytes_len > 16:
@@ -34,10 +36,17 @@ class ByteMatrix16:
         self.set_row(key[0], new_row)
 
     def __xor__(self, other):
-        res = bytearray(0)
-        for i, n in enumerate(self.data):
-            res.append(n ^ other.data[i])
-        return ByteMatrix16(res)
+        return type(self)(bytearray(a ^ b for a, b in zip(self.data, other.data)))
+
+    def __ixor__(self, other):
+        self.ixor(other)
+        return self
+
+    # XOR with another matrix in place, without allocating
+    def ixor(self, other) -> None:
+        data, other_data = self.data, other.data
+        for i in range(16):
+            data[i] ^= other_data[i]
 
     def __repr__(self) -> str:
         out = self.data.decode(errors='replace') if self._debug_show_chars else self.data.hex(' ', 4)
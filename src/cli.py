@@ -0,0 +1,225 @@
+# Headless command-line interface. Run with: python -m src encrypt|decrypt --help
+#     python -m src encrypt -x 000102030405060708090a0b0c0d0e0f -m cbc < notes.txt > notes.txt.enc
+#     python -m src decrypt -k "sixteen byte key" -m ctr -d plain/ secret/
+# Without --iv, CBC and CTR outputs start with a random 16 byte IV that decryption reads back.
+# Files are processed concurrently by a process pool; the key is expanded once, in this process, and the
+# cipher is handed to every worker through the pool initializer
+import argparse
+import contextlib
+import os
+import sys
+import time
+from src.rijndael import Rijndael, ENGINES, _check_distinct_files
+from src.modes import MODES, IV_MODES
+from src.parallel import default_workers
+
+CLI_CHUNK_SIZE = 1024 * 1024 # Read size for files and pipes. Must be divisible by 16
+IV_SIZE = 16
+ENCRYPTED_EXT = '.enc'
+DECRYPTED_EXT = '.dec'
+
+# Cipher for the current worker process, set by _init_worker
+_worker_cipher = None
+
+def _init_worker(cipher: Rijndael) -> None:
+    global _worker_cipher
+    _worker_cipher = cipher
+
+def parse_key(text: str | None, hex_text: str | None) -> bytearray:
+    if hex_text is not None:
+        try:
+            return bytearray.fromhex(hex_text)
+        except ValueError:
+            raise ValueError(f'Key is not valid hex ({hex_text})') from None
+    return bytearray(text, 'utf-8')
+
+# Parses sizes like 16, 64k, 1m, 1g (binary units)
+def parse_size(text: str) -> int:
+    units = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+    text = text.strip().lower().rstrip('b')
+    if text and text[-1] in units:
+        return int(text[:-1]) * units[text[-1]]
+    return int(text)
+
+# Encrypts reader into writer; without a fixed IV a random one is generated and written first.
+# Returns (bytes read, bytes written)
+def encrypt_io(cipher: Rijndael, reader, writer, add_padding=True, iv: bytes=None) -> tuple[int, int]:
+    prefix = 0
+    if cipher.mode in IV_MODES and iv is None:
+        iv = os.urandom(IV_SIZE)
+        writer.write(iv)
+        prefix = IV_SIZE
+    counter = _CountingReader(reader)
+    written = cipher.encrypt_stream(counter, writer, CLI_CHUNK_SIZE, add_padding, iv)
+    return counter.count, written + prefix
+
+# Counterpart of encrypt_io; without a fixed IV it is read from the start of the input
+def decrypt_io(cipher: Rijndael, reader, writer, remove_padding=True, iv: bytes=None) -> tuple[int, int]:
+    prefix = 0
+    if cipher.mode in IV_MODES and iv is None:
+        iv = reader.read(IV_SIZE)
+        if len(iv) != IV_SIZE:
+            raise ValueError(f'Input too short to hold an IV ({len(iv)} bytes)')
+        prefix = IV_SIZE
+    counter = _CountingReader(reader)
+    written = cipher.decrypt_stream(counter, writer, CLI_CHUNK_SIZE, remove_padding, iv)
+    return counter.count + prefix, written
+
+class _CountingReader:
+    def __init__(self, reader):
+        self._reader = reader
+        self.count = 0
+
+    def read(self, size: int) -> bytes:
+        data = self._reader.read(size)
+        self.count += len(data)
+        return data
+
+# Output file, or stdout for '-'
+def _open_output(path: str | None):
+    if path is None or path == '-':
+        return contextlib.nullcontext(sys.stdout.buffer)
+    dst_dir = os.path.dirname(path)
+    if dst_dir:
+        os.makedirs(dst_dir, exist_ok=True)
+    return open(path, 'wb')
+
+def _process_file(cipher: Rijndael, decrypt: bool, padding: bool, iv: bytes | None,
+                  src_path: str, dst_path: str) -> tuple[int, int]:
+    if dst_path != '-':
+        _check_distinct_files(src_path, dst_path)
+    with open(src_path, 'rb') as f_in, _open_output(dst_path) as f_out:
+        if decrypt:
+            return decrypt_io(cipher, f_in, f_out, padding, iv)
+        return encrypt_io(cipher, f_in, f_out, padding, iv)
+
+def _worker_process_file(*args) -> tuple[int, int]:
+    return _process_file(_worker_cipher, *args)
+
+# Default output name: encrypting appends .enc; decrypting removes it, or appends .dec if it isn't there
+def output_name(path: str, decrypt: bool) -> str:
+    if not decrypt:
+        return path + ENCRYPTED_EXT
+    if path.endswith(ENCRYPTED_EXT) and len(path) > len(ENCRYPTED_EXT):
+        return path[:-len(ENCRYPTED_EXT)]
+    return path + DECRYPTED_EXT
+
+# (input, output) path pairs; directories are walked recursively and mirrored under out_dir when given
+def collect_jobs(inputs: list[str], decrypt: bool, out_dir: str=None) -> list[tuple[str, str]]:
+    jobs = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    src = os.path.join(root, name)
+                    rel = os.path.relpath(src, path)
+                    base = os.path.join(out_dir, os.path.basename(os.path.abspath(path)), rel) if out_dir else src
+                    jobs.append((src, output_name(base, decrypt)))
+        elif os.path.isfile(path):
+            base = os.path.join(out_dir, os.path.basename(path)) if out_dir else path
+            jobs.append((path, output_name(base, decrypt)))
+        else:
+            raise FileNotFoundError(f'No such file or directory ({path})')
+    return jobs
+
+def _format_rate(size: int, seconds: float) -> str:
+    return f'{size / 1e6 / seconds:.2f} MB/s' if seconds > 0 else 'n/a'
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m src', description='Rijndael (AES) file and pipe encryption')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for command in ('encrypt', 'decrypt'):
+        p = commands.add_parser(command, help=f'{command} files, directories or stdin')
+        p.add_argument('inputs', nargs='*', help='files or directories; stdin when omitted or "-"')
+        key = p.add_mutually_exclusive_group(required=True)
+        key.add_argument('-k', '--key', help='key as UTF-8 text (16, 24 or 32 bytes)')
+        key.add_argument('-x', '--key-hex', help='key as hex (32, 48 or 64 digits)')
+        p.add_argument('-m', '--mode', choices=MODES, default='ecb', help='mode of operation (default: ecb)')
+        p.add_argument('--iv', help='IV / CTR nonce as hex; when omitted a random IV is stored at the start of '
+                                    'each output (CBC and CTR only)')
+        p.add_argument('--no-padding', action='store_true', help='do not add or remove PKCS#7 padding')
+        p.add_argument('-e', '--engine', choices=list(ENGINES), default='ttable', help='engine (default: ttable)')
+        p.add_argument('-o', '--output', help='output file for stdin or a single input file, "-" for stdout '
+                                              f'(default: stdout for stdin, otherwise the input name with '
+                                              f'{ENCRYPTED_EXT} added or removed)')
+        p.add_argument('-d', '--out-dir', help='directory for outputs of file and directory inputs')
+        p.add_argument('-j', '--jobs', type=int, default=default_workers(),
+                       help='files processed at once, or worker processes for a single input (default: all cores)')
+        p.add_argument('-q', '--quiet', action='store_true', help='do not report throughput')
+    return parser
+
+def main(argv=None) -> int:
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+    decrypt = args.command == 'decrypt'
+    padding = not args.no_padding
+    if args.jobs < 1:
+        parser.error(f'--jobs must be at least 1 ({args.jobs})')
+    try:
+        key = parse_key(args.key, args.key_hex)
+        iv = None
+        if args.iv is not None:
+            if args.mode not in IV_MODES:
+                parser.error(f'--iv is not used in {args.mode.upper()} mode')
+            iv = bytes.fromhex(args.iv)
+        stdin = not args.inputs or args.inputs == ['-']
+        jobs = [] if stdin else collect_jobs(args.inputs, decrypt, args.out_dir)
+        if args.output is not None:
+            if len(jobs) > 1:
+                parser.error('--output needs a single input file; use --out-dir for several')
+            if jobs:
+                jobs = [(jobs[0][0], args.output)]
+        if iv is not None and len(jobs) > 1:
+            # Reusing an IV across files leaks plaintext relations (and the keystream itself in CTR mode)
+            parser.error('--iv can only be used with a single input; omit it to store a random IV per file')
+        single = stdin or len(jobs) == 1
+        # One key expansion for every file; a single input uses the workers for block-level parallelism instead
+        cipher = Rijndael(key, engine=args.engine, mode=args.mode, iv=iv,
+                          workers=args.jobs if single else 1)
+    except (OSError, ValueError) as e:
+        print(f'error: {e}', file=sys.stderr)
+        return 2
+
+    start = time.perf_counter()
+    total_in = total_out = 0
+    failed = 0
+    with cipher:
+        if stdin:
+            try:
+                with _open_output(args.output) as writer:
+                    action = decrypt_io if decrypt else encrypt_io
+                    total_in, total_out = action(cipher, sys.stdin.buffer, writer, padding, iv)
+            except (OSError, ValueError) as e:
+                print(f'error: {e}', file=sys.stderr)
+                failed = 1
+        elif single or args.jobs == 1:
+            for src, dst in jobs:
+                try:
+                    n_in, n_out = _process_file(cipher, decrypt, padding, iv, src, dst)
+                    total_in += n_in
+                    total_out += n_out
+                except (OSError, ValueError) as e:
+                    print(f'error: {src}: {e}', file=sys.stderr)
+                    failed += 1
+        else:
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+            with ProcessPoolExecutor(max_workers=min(args.jobs, len(jobs)), initializer=_init_worker,
+                                     initargs=(cipher,)) as executor:
+                futures = {executor.submit(_worker_process_file, decrypt, padding, iv, src, dst): src
+                           for src, dst in jobs}
+                for future in as_completed(futures):
+                    try:
+                        n_in, n_out = future.result()
+                        total_in += n_in
+                        total_out += n_out
+                    except (OSError, ValueError) as e:
+                        print(f'error: {futures[future]}: {e}', file=sys.stderr)
+                        failed += 1
+    elapsed = time.perf_counter() - start
+
+    if not args.quiet:
+        files = 'stdin' if stdin else f'{len(jobs) - failed}/{len(jobs)} files'
+        print(f'{args.command}ed {files}: {total_in} bytes in, {total_out} bytes out, {elapsed:.3f} s, '
+              f'{_format_rate(total_in, elapsed)}', file=sys.stderr)
+    return 1 if failed else 0
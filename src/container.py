@@ -0,0 +1,177 @@
+# Chunked container format. A fixed header is followed by the file's chunks, each encrypted independently, so
+# chunks can be written in parallel and any one of them decrypted without touching the rest:
+#     magic 'RJC1' | version | key size | mode index (into MODES) | reserved | IV (16) | chunk size | length
+# Chunk i holds plaintext bytes [i * chunk_size, (i + 1) * chunk_size) and starts at
+# HEADER.size + i * chunk_size; only the last chunk may be shorter. Chunk IVs:
+#     ECB  none
+#     CBC  E_K(IV xor i), so no two chunks share an IV
+#     CTR  the counter continues across chunks (IV + i * chunk_size / 16), as if the file were one CTR stream
+# The original length is stored in the header, so no padding is added: the last chunk is filled to a whole block
+# with null bytes (ECB and CBC) and trimmed on decryption. Chunks are not authenticated
+import os
+import struct
+from src.rijndael import Rijndael, _check_distinct_files
+from src.modes import MODES
+
+MAGIC = b'RJC1'
+VERSION = 1
+# magic, version, key size in bytes, mode index, reserved, IV, chunk size, original length
+HEADER = struct.Struct('>4sBBBB16sIQ')
+IV_SIZE = 16
+DEFAULT_CHUNK_SIZE = 1024 * 1024 # Must be divisible by 16
+CONTAINER_EXT = '.rjc'
+
+class ContainerError(ValueError):
+    pass
+
+class ContainerHeader:
+    def __init__(self, key_size: int, mode: str, iv: bytes, chunk_size: int, length: int):
+        if mode not in MODES:
+            raise ContainerError(f'{type(self).__name__}: Unknown mode ({mode})')
+        if chunk_size <= 0 or chunk_size % 16:
+            raise ContainerError(f'{type(self).__name__}: Chunk size must be a positive multiple of 16 ({chunk_size})')
+        if len(iv) != IV_SIZE:
+            raise ContainerError(f'{type(self).__name__}: IV must be {IV_SIZE} bytes ({len(iv)})')
+        self.key_size = key_size
+        self.mode = mode
+        self.iv = bytes(iv)
+        self.chunk_size = chunk_size
+        self.length = length
+
+    def __repr__(self):
+        return f"{type(self)}, {self.key_size=}, {self.mode=}, {self.chunk_size=}, {self.length=}"
+
+    def __eq__(self, other):
+        return isinstance(other, ContainerHeader) and self.pack() == other.pack()
+
+    def pack(self) -> bytes:
+        return HEADER.pack(MAGIC, VERSION, self.key_size, MODES.index(self.mode), 0, self.iv, self.chunk_size,
+                           self.length)
+
+    @classmethod
+    def unpack(cls, data: bytes) -> 'ContainerHeader':
+        if len(data) < HEADER.size:
+            raise ContainerError(f'{cls.__name__}: Too short for a container header ({len(data)} bytes)')
+        magic, version, key_size, mode_idx, _, iv, chunk_size, length = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ContainerError(f'{cls.__name__}: Not a container (bad magic)')
+        if version != VERSION:
+            raise ContainerError(f'{cls.__name__}: Unsupported container version ({version})')
+        if mode_idx >= len(MODES):
+            raise ContainerError(f'{cls.__name__}: Unknown mode index ({mode_idx})')
+        return cls(key_size, MODES[mode_idx], iv, chunk_size, length)
+
+    @classmethod
+    def read(cls, f) -> 'ContainerHeader':
+        f.seek(0)
+        return cls.unpack(f.read(HEADER.size))
+
+    def chunk_count(self) -> int:
+        return -(-self.length // self.chunk_size)
+
+    # Plaintext length of chunk idx
+    def plain_size(self, idx: int) -> int:
+        self._check_index(idx)
+        return min(self.chunk_size, self.length - idx * self.chunk_size)
+
+    # Encrypted length of chunk idx; ECB and CBC round the last chunk up to a whole block
+    def cipher_size(self, idx: int) -> int:
+        size = self.plain_size(idx)
+        return size if self.mode == 'ctr' else -(-size // 16) * 16
+
+    # Offset of chunk idx in the container file
+    def offset(self, idx: int) -> int:
+        self._check_index(idx)
+        return HEADER.size + idx * self.chunk_size
+
+    def container_size(self) -> int:
+        count = self.chunk_count()
+        return HEADER.size if not count else self.offset(count - 1) + self.cipher_size(count - 1)
+
+    def _check_index(self, idx: int) -> None:
+        if not 0 <= idx < self.chunk_count():
+            raise IndexError(f'{type(self).__name__}: Chunk index out of range ({idx} of {self.chunk_count()})')
+
+# New header for a file of `length` bytes encrypted with cipher, with a random IV
+def new_header(cipher: Rijndael, length: int, chunk_size: int=DEFAULT_CHUNK_SIZE) -> ContainerHeader:
+    return ContainerHeader(len(cipher.key), cipher.mode, os.urandom(IV_SIZE), chunk_size, length)
+
+# Raises ContainerError if cipher doesn't use the key size and mode the container was written with
+def check_cipher(cipher: Rijndael, header: ContainerHeader) -> None:
+    if cipher.mode != header.mode or len(cipher.key) != header.key_size:
+        raise ContainerError(f'Container was written with {header.key_size * 8}-bit {header.mode.upper()}, '
+                             f'cipher is {len(cipher.key) * 8}-bit {cipher.mode.upper()}')
+
+# E_K(block) in any mode: one block of CBC with a zero IV, of ECB, or of CTR (counter = block) XORed with zeros
+# for an all-zero block is a single block encryption
+def _encrypt_block(cipher: Rijndael, block: bytes) -> bytes:
+    if cipher.mode == 'ctr':
+        return bytes(cipher.encrypt(bytes(16), add_padding=False, iv=block))
+    return bytes(cipher.encrypt(block, add_padding=False, iv=bytes(16)))
+
+# Key check value: the first 8 bytes of E_K(0), as hex. Identifies the key without revealing it, so a job can
+# tell whether output written earlier used the same key
+def key_check_value(cipher: Rijndael) -> str:
+    return _encrypt_block(cipher, bytes(16))[:8].hex()
+
+# IV for chunk idx, see the format description above
+def chunk_iv(cipher: Rijndael, header: ContainerHeader, idx: int) -> bytes | None:
+    if header.mode == 'cbc':
+        return _encrypt_block(cipher, (int.from_bytes(header.iv) ^ idx).to_bytes(16))
+    if header.mode == 'ctr':
+        counter = (int.from_bytes(header.iv) + idx * (header.chunk_size // 16)) % (1 << 128)
+        return counter.to_bytes(16)
+    return None
+
+def encrypt_chunk(cipher: Rijndael, header: ContainerHeader, idx: int, data) -> bytearray:
+    check_cipher(cipher, header)
+    if len(data) != header.plain_size(idx):
+        raise ContainerError(f'Chunk {idx} must be {header.plain_size(idx)} bytes ({len(data)})')
+    return cipher.encrypt(data, add_padding=False, iv=chunk_iv(cipher, header, idx))
+
+def decrypt_chunk(cipher: Rijndael, header: ContainerHeader, idx: int, data) -> bytearray:
+    check_cipher(cipher, header)
+    if len(data) != header.cipher_size(idx):
+        raise ContainerError(f'Chunk {idx} must be {header.cipher_size(idx)} bytes ({len(data)})')
+    out = cipher.decrypt(data, remove_padding=False, iv=chunk_iv(cipher, header, idx))
+    del out[header.plain_size(idx):]
+    return out
+
+# Random access: decrypts only chunk idx of the container at path
+def read_chunk(cipher: Rijndael, path: str, idx: int) -> bytearray:
+    with open(path, 'rb') as f:
+        header = ContainerHeader.read(f)
+        f.seek(header.offset(idx))
+        data = f.read(header.cipher_size(idx))
+    return decrypt_chunk(cipher, header, idx, data)
+
+# Decrypts plaintext bytes [start, start + size) by reading only the chunks that hold them
+def read_range(cipher: Rijndael, path: str, start: int, size: int) -> bytearray:
+    with open(path, 'rb') as f:
+        header = ContainerHeader.read(f)
+        end = min(start + size, header.length)
+        out = bytearray()
+        for idx in range(start // header.chunk_size, -(-end // header.chunk_size)):
+            f.seek(header.offset(idx))
+            chunk = decrypt_chunk(cipher, header, idx, f.read(header.cipher_size(idx)))
+            chunk_start = idx * header.chunk_size
+            out += chunk[max(start - chunk_start, 0) : end - chunk_start]
+    return out
+
+# Sequential conversions of one file; the job runner in jobs.py does the same chunk by chunk in parallel
+def encrypt_file(cipher: Rijndael, src_path: str, dst_path: str, chunk_size: int=DEFAULT_CHUNK_SIZE) -> ContainerHeader:
+    _check_distinct_files(src_path, dst_path)
+    with open(src_path, 'rb') as f_in, open(dst_path, 'wb') as f_out:
+        header = new_header(cipher, os.fstat(f_in.fileno()).st_size, chunk_size)
+        f_out.write(header.pack())
+        for idx in range(header.chunk_count()):
+            f_out.write(encrypt_chunk(cipher, header, idx, f_in.read(header.plain_size(idx))))
+    return header
+
+def decrypt_file(cipher: Rijndael, src_path: str, dst_path: str) -> ContainerHeader:
+    _check_distinct_files(src_path, dst_path)
+    with open(src_path, 'rb') as f_in, open(dst_path, 'wb') as f_out:
+        header = ContainerHeader.read(f_in)
+        for idx in range(header.chunk_count()):
+            f_out.write(decrypt_chunk(cipher, header, idx, f_in.read(header.cipher_size(idx))))
+    return header
@@ -21,4 +21,47 @@ def find_galois_inverse(a: int) -> int: # Brute force method, checks every eleme
         if g_mul(a, i) == 1:
             return i
     # If there is no return, a is either 0 or outside GF(2^8).
-    raise ValueError(f"{find_galois_inverse.__name__}: '{a}' out of range (1 - 255)")
\ No newline at end of file
+    raise ValueError(f"{find_galois_inverse.__name__}: '{a}' out of range (1 - 255)")
+
+# Key expansion round constants x^(i - 1) for rounds i = 1..count
+def compute_rcon(count: int=10) -> list:
+    rcon = [1]
+    for _ in range(count - 1):
+        rcon.append(g_mul(rcon[-1], 2))
+    return rcon
+
+# Table-backed arithmetic. The functions above are kept as the reference implementation
+# Log/antilog tables with generator 3: a * b = 3^(log(a) + log(b))
+def _build_log_tables() -> tuple[list, list]:
+    exp = [0] * 510 # Doubled so exponent sums (max 508) need no modulo
+    log = [0] * 256
+    x = 1
+    for i in range(255):
+        exp[i] = exp[i + 255] = x
+        log[x] = i
+        x = g_mul(x, 3)
+    return exp, log
+
+GF_EXP, GF_LOG = _build_log_tables()
+# Multiplicative inverses; 0 has none and maps to 0, as the S-Box construction expects
+GF_INVERSE = [0] + [GF_EXP[255 - GF_LOG[a]] for a in range(1, 256)]
+
+def g_mul_fast(a: int, b: int) -> int:
+    a &= 0xFF
+    b &= 0xFF
+    if a and b:
+        return GF_EXP[GF_LOG[a] + GF_LOG[b]]
+    return 0
+
+def g_inverse(a: int) -> int:
+    if not 0 < a < 256:
+        raise ValueError(f"{g_inverse.__name__}: '{a}' out of range (1 - 255)")
+    return GF_INVERSE[a]
+
+_MUL_TABLES = {}
+
+# 256 entry table of x * n for a constant n, e.g. the MixColumns coefficients
+def mul_table(n: int) -> tuple:
+    if n not in _MUL_TABLES:
+        _MUL_TABLES[n] = tuple(g_mul_fast(a, n) for a in range(256))
+    return _MUL_TABLES[n]
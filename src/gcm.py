@@ -0,0 +1,263 @@
+# AES-GCM (NIST SP 800-38D): CTR encryption plus a GHASH authentication tag, built on any engine's encrypt_blocks.
+# GHASH multiplies by the hash key H = E_K(0^128) in GF(2^128). That is done with 8-bit tables: for each of the 16
+# byte positions, the product of H with all 256 values of that byte, so one multiply is 16 lookups and XORs.
+# The tables (4096 ints, a few hundred KB) are built once per key and cached on the KeySchedule, so a
+# KeyScheduleCache shares them between GCM instances.
+#     gcm = GCM(key, engine='ttable')
+#     ciphertext, tag = gcm.encrypt(nonce, plaintext, aad)
+#     plaintext = gcm.decrypt(nonce, ciphertext, tag, aad)  # raises InvalidTag
+# encryptor()/decryptor() and the *_stream methods process associated data and payload incrementally.
+# Payload and associated data may be str (encoded as UTF-8, as Rijndael does) or any bytes-like object.
+# Never reuse a nonce with the same key: it reveals the XOR of the plaintexts and lets tags be forged
+import hmac
+from src.key_schedule import KeySchedule, KeyScheduleCache
+from src.sbox import forward_sbox, inverse_sbox
+from src.modes import xor_bytes
+from src.rijndael import ENGINES, STREAM_CHUNK_SIZE, _byte_view, _check_chunk_size, _read_chunks
+
+TAG_LENGTHS = (4, 8, 12, 13, 14, 15, 16) # Allowed tag lengths in bytes; 4 and 8 only for short messages
+MAX_PAYLOAD = (2 ** 32 - 2) * 16 # The 32-bit block counter must not wrap back to J0
+_GHASH_TABLES = 'ghash_tables' # Name of the tables in KeySchedule.derived
+_R = 0xE1 << 120 # Reduction polynomial x^128 + x^7 + x^2 + x + 1 in GCM's reflected bit order
+_LOW32 = 0xFFFFFFFF
+
+class InvalidTag(ValueError):
+    pass
+
+# Multiplication tables for hash key h: tables[j][b] = (b at byte position j) * h.
+# GCM bit order puts x^0 in the most significant bit, so multiplying by x is a right shift
+def ghash_tables(h: int) -> list[list[int]]:
+    powers = [h] # powers[i] = h * x^i
+    for _ in range(127):
+        v = powers[-1]
+        powers.append((v >> 1) ^ _R if v & 1 else v >> 1)
+    tables = []
+    for j in range(16):
+        table = [0] * 256
+        for k in range(8):
+            m = 1 << k
+            p = powers[8 * j + 7 - k] # Bit k of byte j is the coefficient of x^(8j + 7 - k)
+            for b in range(m):
+                table[m + b] = p ^ table[b]
+        tables.append(table)
+    return tables
+
+# Folds whole 16 byte blocks of data into the GHASH state y
+def ghash(tables: list[list[int]], y: int, data: bytes | bytearray) -> int:
+    t0, t1, t2, t3, t4, t5, t6, t7, t8, t9, t10, t11, t12, t13, t14, t15 = tables
+    from_bytes = int.from_bytes
+    for idx in range(0, len(data), 16):
+        b = (y ^ from_bytes(data[idx : idx + 16])).to_bytes(16)
+        y = (t0[b[0]] ^ t1[b[1]] ^ t2[b[2]] ^ t3[b[3]] ^ t4[b[4]] ^ t5[b[5]] ^ t6[b[6]] ^ t7[b[7]] ^
+             t8[b[8]] ^ t9[b[9]] ^ t10[b[10]] ^ t11[b[11]] ^ t12[b[12]] ^ t13[b[13]] ^ t14[b[14]] ^ t15[b[15]])
+    return y
+
+def _pad16(data: bytes | bytearray) -> bytes:
+    return bytes(data) + bytes(-len(data) % 16)
+
+# Counter blocks [start, start + count) after j0; only the low 32 bits are incremented (inc32)
+def _counter_blocks(j0: int, start: int, count: int) -> bytes:
+    prefix, counter = j0 & ~_LOW32, j0 & _LOW32
+    return b''.join((prefix | ((counter + n) & _LOW32)).to_bytes(16) for n in range(start, start + count))
+
+class GCM:
+    # engine: any name in rijndael.ENGINES. key_cache: optional KeyScheduleCache; the GHASH tables are cached with
+    # the schedule. tag_length: bytes of tag produced and expected, one of TAG_LENGTHS
+    def __init__(self, key: str | bytearray, engine: str='ttable', key_cache: KeyScheduleCache=None,
+                 tag_length: int=16):
+        if engine not in ENGINES:
+            raise ValueError(f'{type(self).__name__}: Unknown engine ({engine})')
+        if tag_length not in TAG_LENGTHS:
+            raise ValueError(f'{type(self).__name__}: Unsupported tag length ({tag_length} bytes)')
+        self.engine = engine
+        self.tag_length = tag_length
+        self.key_cache = key_cache
+        self.key = bytearray(key, 'utf-8') if isinstance(key, str) else key
+        self._load_key()
+
+    # Returns (ciphertext, tag)
+    def encrypt(self, nonce: bytes | bytearray, plaintext, aad=b'') -> tuple[bytes, bytes]:
+        enc = self.encryptor(nonce)
+        enc.update_aad(aad)
+        ciphertext = enc.update(plaintext)
+        ciphertext += enc.finalize()
+        return ciphertext, enc.tag
+
+    # The tag is checked before any decryption, so nothing is returned for a forged message
+    def decrypt(self, nonce: bytes | bytearray, ciphertext, tag: bytes | bytearray, aad=b'') -> bytearray:
+        with _byte_view(ciphertext) as ciphertext, _byte_view(aad) as aad:
+            if len(ciphertext) > MAX_PAYLOAD:
+                raise ValueError(f'{type(self).__name__}: Message too long ({len(ciphertext)} bytes)')
+            self._check_schedule()
+            j0 = self._j0(nonce)
+            y = ghash(self._tables, 0, _pad16(aad))
+            y = ghash(self._tables, y, ciphertext[:len(ciphertext) - len(ciphertext) % 16])
+            y = ghash(self._tables, y, _pad16(ciphertext[len(ciphertext) - len(ciphertext) % 16:]))
+            self._verify(self._tag(j0, y, len(aad), len(ciphertext)), tag)
+            return bytearray(self._crypt(j0, ciphertext, 0))
+
+    def encryptor(self, nonce: bytes | bytearray) -> 'GCMEncryptor':
+        self._check_schedule()
+        return GCMEncryptor(self, self._j0(nonce))
+
+    def decryptor(self, nonce: bytes | bytearray) -> 'GCMDecryptor':
+        self._check_schedule()
+        return GCMDecryptor(self, self._j0(nonce))
+
+    # Encrypts everything read from reader into writer, holding about one chunk in memory; returns the tag
+    def encrypt_stream(self, nonce: bytes | bytearray, reader, writer, aad=b'',
+                       chunk_size: int=STREAM_CHUNK_SIZE, progress=None, cancel=None) -> bytes:
+        _check_chunk_size(chunk_size)
+        enc = self.encryptor(nonce)
+        enc.update_aad(aad)
+        for chunk in _read_chunks(reader, chunk_size, progress, cancel):
+            writer.write(enc.update(chunk))
+        writer.write(enc.finalize())
+        return enc.tag
+
+    # Decrypts everything read from reader into writer and raises InvalidTag at the end if the tag doesn't match.
+    # Plaintext is written before the tag can be checked: discard the output if InvalidTag is raised
+    def decrypt_stream(self, nonce: bytes | bytearray, reader, writer, tag: bytes | bytearray, aad=b'',
+                       chunk_size: int=STREAM_CHUNK_SIZE, progress=None, cancel=None) -> int:
+        _check_chunk_size(chunk_size)
+        dec = self.decryptor(nonce)
+        dec.update_aad(aad)
+        written = 0
+        for chunk in _read_chunks(reader, chunk_size, progress, cancel):
+            out = dec.update(chunk)
+            writer.write(out)
+            written += len(out)
+        out = dec.finalize(tag)
+        writer.write(out)
+        return written + len(out)
+
+    def _load_key(self) -> None:
+        if self.key_cache is not None:
+            self.round_keys = self.key_cache.get(self.key)
+        else:
+            self.round_keys = KeySchedule(self.key)
+        self._engine = ENGINES[self.engine](self.round_keys, forward_sbox(), inverse_sbox())
+        self._tables = self.round_keys.derived(
+            _GHASH_TABLES, lambda: ghash_tables(int.from_bytes(self._engine.encrypt_blocks(bytes(16)))))
+
+    # A cached schedule may have been evicted (and zeroized) since this instance fetched it
+    def _check_schedule(self) -> None:
+        if self.round_keys.zeroized:
+            self._load_key()
+
+    # Pre-counter block: nonce || 0^31 || 1 for 96-bit nonces, otherwise GHASH of the padded nonce and its length
+    def _j0(self, nonce: bytes | bytearray) -> int:
+        if not nonce:
+            raise ValueError(f'{type(self).__name__}: Nonce must not be empty')
+        if len(nonce) == 12:
+            return (int.from_bytes(nonce) << 32) | 1
+        return ghash(self._tables, 0, _pad16(nonce) + (8 * len(nonce)).to_bytes(16))
+
+    # CTR over data starting at payload block `start`; data need not be whole blocks
+    def _crypt(self, j0: int, data, start: int) -> bytes:
+        if not data:
+            return b''
+        keystream = self._engine.encrypt_blocks(_counter_blocks(j0, start + 1, (len(data) + 15) // 16))
+        return xor_bytes(data, keystream[:len(data)])
+
+    # E_K(J0) XOR GHASH(A, C, len(A) || len(C)), truncated to tag_length
+    def _tag(self, j0: int, y: int, aad_length: int, length: int) -> bytes:
+        y = ghash(self._tables, y, (8 * aad_length).to_bytes(8) + (8 * length).to_bytes(8))
+        mask = self._engine.encrypt_blocks(j0.to_bytes(16))
+        return xor_bytes(y.to_bytes(16), mask)[:self.tag_length]
+
+    def _verify(self, expected: bytes, tag: bytes | bytearray) -> None:
+        if len(tag) != self.tag_length or not hmac.compare_digest(expected, bytes(tag)):
+            raise InvalidTag(f'{type(self).__name__}: Authentication tag does not match')
+
+# Incremental encryption or decryption of one message. All associated data must be passed to update_aad()
+# before the first update(); update() returns output for whole blocks and holds back the rest (under 16 bytes)
+class _GCMContext:
+    def __init__(self, gcm: GCM, j0: int):
+        self._gcm = gcm
+        self._j0 = j0
+        self._y = 0 # GHASH state
+        self._aad = bytearray() # Associated data not yet hashed (partial block)
+        self._aad_length = 0
+        self._pending = bytearray() # Payload not yet processed (partial block)
+        self._length = 0 # Payload bytes processed
+        self._started = False
+        self._finalized = False
+
+    def update_aad(self, data) -> None:
+        self._check_open()
+        if self._started:
+            raise ValueError(f'{type(self).__name__}: Associated data must come before the payload')
+        with _byte_view(data) as data:
+            self._aad += data
+            self._aad_length += len(data)
+        whole = len(self._aad) - len(self._aad) % 16
+        if whole:
+            self._y = ghash(self._gcm._tables, self._y, self._aad[:whole])
+            del self._aad[:whole]
+
+    def update(self, data) -> bytes:
+        self._check_open()
+        self._start()
+        with _byte_view(data) as data:
+            self._pending += data
+        whole = len(self._pending) - len(self._pending) % 16
+        if not whole:
+            return b''
+        if self._length + len(self._pending) > MAX_PAYLOAD:
+            raise ValueError(f'{type(self).__name__}: Message too long')
+        out = self._process(self._pending[:whole])
+        del self._pending[:whole]
+        return out
+
+    # Processes the remaining partial block and returns (output, computed tag)
+    def _finish(self) -> tuple[bytes, bytes]:
+        self._check_open()
+        self._start()
+        if self._length + len(self._pending) > MAX_PAYLOAD:
+            raise ValueError(f'{type(self).__name__}: Message too long')
+        out = self._process(self._pending)
+        self._pending.clear()
+        self._finalized = True
+        return out, self._gcm._tag(self._j0, self._y, self._aad_length, self._length)
+
+    # Hashes any partial block of associated data, zero-padded, once the payload starts
+    def _start(self) -> None:
+        if not self._started:
+            self._started = True
+            if self._aad:
+                self._y = ghash(self._gcm._tables, self._y, _pad16(self._aad))
+                self._aad.clear()
+
+    def _check_open(self) -> None:
+        if self._finalized:
+            raise ValueError(f'{type(self).__name__}: Already finalized')
+
+    def _crypt(self, data) -> bytes:
+        out = self._gcm._crypt(self._j0, data, self._length // 16)
+        self._length += len(data)
+        return out
+
+class GCMEncryptor(_GCMContext):
+    tag = None # Set by finalize()
+
+    def _process(self, data) -> bytes:
+        out = self._crypt(data)
+        self._y = ghash(self._gcm._tables, self._y, _pad16(out))
+        return out
+
+    def finalize(self) -> bytes:
+        out, self.tag = self._finish()
+        return out
+
+# update() returns plaintext before the tag has been checked; it must not be used until finalize() succeeds
+class GCMDecryptor(_GCMContext):
+    def _process(self, data) -> bytes:
+        self._y = ghash(self._gcm._tables, self._y, _pad16(data))
+        return self._crypt(data)
+
+    # Returns the last plaintext bytes; raises InvalidTag if tag doesn't match
+    def finalize(self, tag: bytes | bytearray) -> bytes:
+        out, expected = self._finish()
+        self._gcm._verify(expected, tag)
+        return out
@@ -0,0 +1,34 @@
+# Generates src/constants.py from the reference functions, so importing the cipher doesn't have to compute the
+# S-Boxes. Run with: python -m src.gen_constants (rewrites the file); python -m src.verify checks it is current
+import os
+import sys
+from src.sbox import compute_forward_sbox, compute_inverse_sbox
+from src.galois_math import compute_rcon
+
+CONSTANTS_PATH = os.path.join(os.path.dirname(__file__), 'constants.py')
+_PER_LINE = 16
+
+def _format_table(name: str, values) -> str:
+    lines = [f'{name} = (']
+    for idx in range(0, len(values), _PER_LINE):
+        lines.append('    ' + ' '.join(f'0x{v:02x},' for v in values[idx : idx + _PER_LINE]))
+    lines.append(')')
+    return '\n'.join(lines)
+
+# Source text of the constants module
+def render() -> str:
+    return '\n\n'.join([
+        '# Generated by python -m src.gen_constants from the functions in sbox.py and galois_math.py; do not edit',
+        '# Rijndael S-Box\n' + _format_table('SBOX', compute_forward_sbox()),
+        '# Inverse S-Box\n' + _format_table('INV_SBOX', compute_inverse_sbox()),
+        '# Round constants: x^(i - 1) in GF(2^8) for key expansion round i\n' + _format_table('RCON', compute_rcon()),
+    ]) + '\n'
+
+def main() -> int:
+    with open(CONSTANTS_PATH, 'w') as f:
+        f.write(render())
+    print(f'Wrote {CONSTANTS_PATH}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
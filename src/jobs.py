@@ -0,0 +1,293 @@
+# Directory job runner: encrypts every file of a tree into chunked containers (see container.py), or decrypts
+# them back, with the chunks of all files spread over a process pool. Workers read their chunk from the input
+# and write it at its final offset in the preallocated output, so chunks finish in any order.
+# Completed chunks are appended to a manifest in the output directory; if a job is interrupted, running it again
+# with the same arguments and key skips them. A file is started over instead if its input has changed (size or
+# modification time) or the key differs. The manifest is removed once every file has been completed.
+#     python -m src.jobs encrypt -x 000102030405060708090a0b0c0d0e0f -m ctr photos/ vault/
+#     python -m src.jobs decrypt -x 000102030405060708090a0b0c0d0e0f -m ctr vault/ restored/
+import argparse
+import json
+import os
+import sys
+import time
+from src.rijndael import Rijndael, ENGINES
+from src.modes import MODES
+from src.parallel import default_workers
+from src.cli import parse_key, parse_size
+from src.container import (ContainerHeader, CONTAINER_EXT, DEFAULT_CHUNK_SIZE, new_header, check_cipher,
+                           key_check_value, encrypt_chunk, decrypt_chunk)
+
+MANIFEST_NAME = '.rjc-manifest.jsonl'
+PENDING_PER_WORKER = 4 # Chunks queued per worker; bounds memory however many chunks a job has
+
+# Cipher for the current worker process, set by _init_worker
+_worker_cipher = None
+
+def _init_worker(cipher: Rijndael) -> None:
+    global _worker_cipher
+    _worker_cipher = cipher
+
+# Reads chunk idx from the input file, converts it and writes it at its place in the output file
+def _run_chunk(cipher: Rijndael, decrypt: bool, src: str, dst: str, header_bytes: bytes, idx: int) -> int:
+    header = ContainerHeader.unpack(header_bytes)
+    with open(src, 'rb') as f_in, open(dst, 'r+b') as f_out:
+        if decrypt:
+            f_in.seek(header.offset(idx))
+            f_out.seek(idx * header.chunk_size)
+            f_out.write(decrypt_chunk(cipher, header, idx, f_in.read(header.cipher_size(idx))))
+        else:
+            f_in.seek(idx * header.chunk_size)
+            f_out.seek(header.offset(idx))
+            f_out.write(encrypt_chunk(cipher, header, idx, f_in.read(header.plain_size(idx))))
+    return header.plain_size(idx)
+
+def _worker_run_chunk(*args) -> int:
+    return _run_chunk(_worker_cipher, *args)
+
+# One input file of a job
+class FileJob:
+    def __init__(self, src: str, dst: str, name: str):
+        self.src = src
+        self.dst = dst
+        self.name = name # Output path relative to the output directory, used in the manifest
+        self.header: ContainerHeader = None
+        self.done: set[int] = set() # Completed chunk indices
+        self.error: str = None
+
+    def __repr__(self):
+        return f"{type(self)}, {self.name=}, done={len(self.done)}"
+
+# Size and modification time of an input file, recorded to detect inputs changed between runs
+def _source_stamp(path: str) -> list[int]:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+# Completed chunks per output file, appended as JSON lines: {"file", "header", "source", "kcv"} when a file is
+# started (container header, input size and mtime, key check value) and {"file", "chunk"} for each chunk written
+class Manifest:
+    def __init__(self, path: str):
+        self.path = path
+        self.files: dict[str, dict] = {} # Start entry per file
+        self.chunks: dict[str, set[int]] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue # A line cut short by the interruption
+                    if 'header' in entry:
+                        # A new header means the file was restarted; earlier chunks are invalid
+                        self.files[entry['file']] = entry
+                        self.chunks[entry['file']] = set()
+                    elif entry['file'] in self.chunks:
+                        self.chunks[entry['file']].add(entry['chunk'])
+        self._f = open(path, 'a')
+
+    def start_file(self, name: str, header: ContainerHeader, source: list[int], kcv: str) -> None:
+        entry = {'file': name, 'header': header.pack().hex(), 'source': source, 'kcv': kcv}
+        self.files[name] = entry
+        self._write(entry)
+
+    def chunk_done(self, name: str, idx: int) -> None:
+        self._write({'file': name, 'chunk': idx})
+
+    def close(self, remove: bool=False) -> None:
+        self._f.close()
+        if remove:
+            os.remove(self.path)
+
+    def _write(self, entry: dict) -> None:
+        self._f.write(json.dumps(entry) + '\n')
+        self._f.flush()
+
+class ContainerJobRunner:
+    # cipher: Rijndael with the key and mode to use; it is handed to every worker through the pool initializer,
+    # so the key is expanded once. workers: processes; 1 runs everything in this process, None uses all cores.
+    # progress: optional callback(bytes_done, bytes_total) called after each chunk
+    def __init__(self, cipher: Rijndael, workers: int | None=None, chunk_size: int=DEFAULT_CHUNK_SIZE,
+                 progress=None):
+        if chunk_size <= 0 or chunk_size % 16:
+            raise ValueError(f'{type(self).__name__}: Chunk size must be a positive multiple of 16 ({chunk_size})')
+        self.cipher = cipher
+        self.workers = default_workers() if workers is None else workers
+        if self.workers < 1:
+            raise ValueError(f'{type(self).__name__}: Worker count must be at least 1 ({self.workers})')
+        self.chunk_size = chunk_size
+        self.progress = progress
+
+    # Encrypts every file under src_dir into dst_dir/<relative path>.rjc; returns the file jobs
+    def encrypt_tree(self, src_dir: str, dst_dir: str) -> list[FileJob]:
+        return self._run(src_dir, dst_dir, decrypt=False)
+
+    # Decrypts every .rjc file under src_dir into dst_dir, removing the extension
+    def decrypt_tree(self, src_dir: str, dst_dir: str) -> list[FileJob]:
+        return self._run(src_dir, dst_dir, decrypt=True)
+
+    def collect(self, src_dir: str, dst_dir: str, decrypt: bool) -> list[FileJob]:
+        jobs = []
+        dst_root = os.path.abspath(dst_dir)
+        for root, dirs, files in os.walk(src_dir):
+            # Never descend into the output directory if it is inside the input
+            dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) != dst_root)
+            for name in sorted(files):
+                if name == MANIFEST_NAME or (decrypt and not name.endswith(CONTAINER_EXT)):
+                    continue
+                src = os.path.join(root, name)
+                rel = os.path.relpath(src, src_dir)
+                rel = rel[:-len(CONTAINER_EXT)] if decrypt else rel + CONTAINER_EXT
+                jobs.append(FileJob(src, os.path.join(dst_dir, rel), rel))
+        return jobs
+
+    def _run(self, src_dir: str, dst_dir: str, decrypt: bool) -> list[FileJob]:
+        if not os.path.isdir(src_dir):
+            raise FileNotFoundError(f'No such directory ({src_dir})')
+        jobs = self.collect(src_dir, dst_dir, decrypt)
+        os.makedirs(dst_dir, exist_ok=True)
+        kcv = key_check_value(self.cipher)
+        manifest = Manifest(os.path.join(dst_dir, MANIFEST_NAME))
+        completed = False
+        try:
+            for job in jobs:
+                try:
+                    self._prepare(job, manifest, decrypt, kcv)
+                except (OSError, ValueError) as e:
+                    job.error = str(e)
+            self._run_chunks(jobs, manifest, decrypt)
+            completed = all(job.error is None for job in jobs)
+        finally:
+            # Kept after an interruption or failure so the next run can resume
+            manifest.close(remove=completed)
+        return jobs
+
+    # Reads or creates the header and output file of a job. It resumes from the manifest only if the output still
+    # starts as recorded and the input (size and mtime) and key (check value) are the ones it was started with
+    def _prepare(self, job: FileJob, manifest: Manifest, decrypt: bool, kcv: str) -> None:
+        source = _source_stamp(job.src)
+        recorded = manifest.files.get(job.name)
+        if recorded is not None and (recorded.get('source') != source or recorded.get('kcv') != kcv
+                                     or not os.path.exists(job.dst)):
+            recorded = None
+        if decrypt:
+            with open(job.src, 'rb') as f:
+                header = ContainerHeader.read(f)
+            check_cipher(self.cipher, header)
+            output_size = header.length
+        else:
+            header = None
+            if recorded is not None:
+                header = ContainerHeader.unpack(bytes.fromhex(recorded['header']))
+                with open(job.dst, 'rb') as f:
+                    on_disk = f.read(len(recorded['header']) // 2)
+                if on_disk.hex() != recorded['header'] or header.chunk_size != self.chunk_size:
+                    header = None
+            if header is None:
+                header = new_header(self.cipher, source[0], self.chunk_size)
+            output_size = header.container_size()
+        job.header = header
+        if recorded is not None and recorded['header'] == header.pack().hex():
+            job.done = set(manifest.chunks.get(job.name, ()))
+            return
+        dst_dir = os.path.dirname(job.dst)
+        if dst_dir:
+            os.makedirs(dst_dir, exist_ok=True)
+        with open(job.dst, 'wb') as f:
+            if not decrypt:
+                f.write(header.pack())
+            f.truncate(output_size)
+        manifest.start_file(job.name, header, source, kcv)
+
+    def _run_chunks(self, jobs: list[FileJob], manifest: Manifest, decrypt: bool) -> None:
+        tasks = [(job, idx) for job in jobs if job.error is None
+                 for idx in range(job.header.chunk_count()) if idx not in job.done]
+        total = sum(job.header.length for job in jobs if job.error is None)
+        done = total - sum(job.header.plain_size(idx) for job, idx in tasks)
+
+        def finished(job: FileJob, idx: int, size: int) -> None:
+            nonlocal done
+            job.done.add(idx)
+            manifest.chunk_done(job.name, idx)
+            done += size
+            if self.progress is not None:
+                self.progress(done, total)
+
+        if self.workers == 1:
+            for job, idx in tasks:
+                if job.error is not None:
+                    continue
+                try:
+                    size = _run_chunk(self.cipher, decrypt, job.src, job.dst, job.header.pack(), idx)
+                except (OSError, ValueError) as e:
+                    job.error = str(e)
+                    continue
+                finished(job, idx, size)
+            return
+
+        from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.cipher,)) as executor:
+            pending = {}
+            task_iter = iter(tasks)
+            while True:
+                # Keep a bounded number of chunks queued
+                for job, idx in task_iter:
+                    if job.error is not None:
+                        continue
+                    future = executor.submit(_worker_run_chunk, decrypt, job.src, job.dst, job.header.pack(), idx)
+                    pending[future] = (job, idx)
+                    if len(pending) >= self.workers * PENDING_PER_WORKER:
+                        break
+                if not pending:
+                    return
+                completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    job, idx = pending.pop(future)
+                    try:
+                        finished(job, idx, future.result())
+                    except (OSError, ValueError) as e:
+                        job.error = str(e)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m src.jobs',
+                                     description='Encrypt a directory tree into chunked containers, or back')
+    parser.add_argument('command', choices=('encrypt', 'decrypt'))
+    parser.add_argument('src', help='input directory')
+    parser.add_argument('dst', help='output directory; an interrupted job is resumed when run again')
+    key = parser.add_mutually_exclusive_group(required=True)
+    key.add_argument('-k', '--key', help='key as UTF-8 text (16, 24 or 32 bytes)')
+    key.add_argument('-x', '--key-hex', help='key as hex (32, 48 or 64 digits)')
+    parser.add_argument('-m', '--mode', choices=MODES, default='ctr', help='mode of operation (default: ctr)')
+    parser.add_argument('-e', '--engine', choices=list(ENGINES), default='ttable', help='engine (default: ttable)')
+    parser.add_argument('-c', '--chunk-size', type=parse_size, default=DEFAULT_CHUNK_SIZE,
+                        help='plaintext bytes per chunk when encrypting, e.g. 64k or 1m (default: 1m)')
+    parser.add_argument('-j', '--jobs', type=int, default=default_workers(),
+                        help='worker processes (default: all cores)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not report progress')
+    args = parser.parse_args(argv)
+    decrypt = args.command == 'decrypt'
+
+    def progress(done: int, total: int) -> None:
+        print(f'\r{done / 1e6:.1f}/{total / 1e6:.1f} MB', end='', file=sys.stderr, flush=True)
+
+    try:
+        cipher = Rijndael(parse_key(args.key, args.key_hex), engine=args.engine, mode=args.mode)
+        runner = ContainerJobRunner(cipher, args.jobs, args.chunk_size, None if args.quiet else progress)
+        start = time.perf_counter()
+        jobs = runner.decrypt_tree(args.src, args.dst) if decrypt else runner.encrypt_tree(args.src, args.dst)
+    except (OSError, ValueError) as e:
+        print(f'error: {e}', file=sys.stderr)
+        return 2
+    elapsed = time.perf_counter() - start
+    failed = [job for job in jobs if job.error is not None]
+    for job in failed:
+        print(f'\nerror: {job.src}: {job.error}', file=sys.stderr)
+    if not args.quiet:
+        size = sum(job.header.length for job in jobs if job.header is not None and job.error is None)
+        rate = f'{size / 1e6 / elapsed:.2f} MB/s' if elapsed > 0 else 'n/a'
+        print(f'\n{args.command}ed {len(jobs) - len(failed)}/{len(jobs)} files, {size} bytes, {elapsed:.3f} s, '
+              f'{rate}', file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
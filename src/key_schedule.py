@@ -1,4 +1,9 @@
-from src.sbox import compute_forward_sbox
+import struct
+import threading
+from collections import OrderedDict
+from src.galois_math import mul_table
+from src.constants import RCON
+from src.sbox import forward_sbox
 from src.byte_matrix import ByteMatrix16
 
 # Constants for acceptable key sizes and round keys
@@ -7,49 +12,40 @@ _KEY_ROUND_SIZES = {
     24: 13,
     32: 15
 }
-_RCON = {
-    1: 0x01000000,
-    2: 0x02000000,
-    3: 0x04000000,
-    4: 0x08000000,
-    5: 0x10000000,
-    6: 0x20000000,
-    7: 0x40000000,
-    8: 0x80000000,
-    9: 0x1b000000,
-    10: 0x36000000
-}
+# Round constant words for rounds 1-10; the constant sits in the high byte
+_RCON = {i: rc << 24 for i, rc in enumerate(RCON, 1)}
 
 # One byte left circular shift for int32s
 def _l_rot32(x: int) -> int:
     return ((x << 8) | (x >> 24)) & 0xFFFFFFFF
 
-# Converts 4 element bytearray to int32
-def _array_to_num32(x: bytearray) -> int:
-    out = 0
-    for n in x: # Add byte then shift result by one byte
-        out += n
-        out <<= 8
-    return out >> 8 # Reverse last shift from the loop
-
-# Converts int32 to 4 element bytearray
-def _num32_to_array(x: int) -> bytearray:
-    out = bytearray()
-    mask = 0xFF000000
-    for i in range(3, -1, -1):
-        # Use mask to get each byte from num, then shift to be byte sized
-        out.append((x & mask) >> (i * 8))
-        mask >>= 8 # Shift mask to next byte
-    return out
+_COLUMNS = struct.Struct('>4I') # Round key as four big-endian column words
+
+# InvMixColumns as four tables of 32-bit words, one per input byte of the column; built on first use
+_INV_MIX_TABLES = None
+
+def _inv_mix_tables() -> tuple:
+    global _INV_MIX_TABLES
+    if _INV_MIX_TABLES is None:
+        rows = ((14, 11, 13, 9), (9, 14, 11, 13), (13, 9, 14, 11), (11, 13, 9, 14))
+        _INV_MIX_TABLES = tuple(
+            tuple(sum(mul_table(row[k])[b] << (24 - 8 * r) for r, row in enumerate(rows)) for b in range(256))
+            for k in range(4))
+    return _INV_MIX_TABLES
+
+# Applies InvMixColumns to a column word, used to build round keys for the equivalent inverse cipher
+def inv_mix_word(word: int) -> int:
+    t0, t1, t2, t3 = _inv_mix_tables()
+    return t0[word >> 24] ^ t1[(word >> 16) & 0xFF] ^ t2[(word >> 8) & 0xFF] ^ t3[word & 0xFF]
 
 class KeySchedule:
-    _SBOX: list = None
+    __slots__ = ('_sbox', 'key_bytes', 'key_size', 'rounds', 'key_words', 'round_keys', 'zeroized',
+                 '_words', '_flat', '_dec_words', '_dec_flat', '_derived')
 
     def __init__(self, key: str | bytearray, sbox=None):
 
-        # Get precalculated S-Box from user if needed & provided
-        if self._SBOX is None:
-            self._SBOX = compute_forward_sbox() if sbox is None else sbox
+        # Get precalculated S-Box from user if provided
+        self._sbox = forward_sbox() if sbox is None else sbox
 
         self.key_bytes: bytearray = bytearray(key, 'utf-8') if isinstance(key, str) else key
 
@@ -63,6 +59,8 @@ class KeySchedule:
 
         # Key expansion
         self.round_keys = self._generate_round_keys()
+        self.zeroized = False
+        self._clear_layouts()
 
     def __getitem__(self, idx):
         return self.round_keys[idx]
@@ -73,6 +71,64 @@ class KeySchedule:
     def __repr__(self):
         return f"{type(self)}, {self.key_size=}, {self.key_bytes=}"
 
+    # Best-effort clearing: overwrites the key bytes and the ByteMatrix16 round keys with zeros and drops the cached
+    # layouts, and the schedule can't be used afterwards. Copies elsewhere are not touched: the immutable word
+    # tuples and bytes already built (until garbage collected), and the round keys engines hold in their own
+    # form (T-table words, NumPy arrays, bitsliced planes). It limits how long key material lingers; it doesn't
+    # guarantee none is left in memory
+    def zeroize(self) -> None:
+        self.key_bytes[:] = bytes(len(self.key_bytes))
+        self.key_words = [0] * len(self.key_words)
+        for rk in self.round_keys:
+            rk.data[:] = bytes(16)
+        # Cached layouts are immutable and can't be overwritten; dropping them is the best that can be done
+        self._clear_layouts()
+        self.zeroized = True
+
+    # Alternative round key layouts for the engines, each built on first use and cached
+
+    # Round keys as tuples of four big-endian column words
+    @property
+    def words(self) -> tuple[tuple[int, ...], ...]:
+        if self._words is None:
+            self._words = tuple(_COLUMNS.unpack(rk.data) for rk in self.round_keys)
+        return self._words
+
+    # All round keys back to back, 16 bytes each
+    @property
+    def flat(self) -> bytes:
+        if self._flat is None:
+            self._flat = b''.join(bytes(rk.data) for rk in self.round_keys)
+        return self._flat
+
+    # Column words for the equivalent inverse cipher (FIPS-197 5.3.5): reversed order, with InvMixColumns
+    # applied to every key but the first and last, so decryption rounds have the same structure as encryption
+    @property
+    def dec_words(self) -> tuple[tuple[int, ...], ...]:
+        if self._dec_words is None:
+            words = self.words
+            middle = tuple(tuple(inv_mix_word(w) for w in rk) for rk in reversed(words[1:-1]))
+            self._dec_words = (words[-1],) + middle + (words[0],)
+        return self._dec_words
+
+    # Equivalent inverse cipher keys back to back
+    @property
+    def dec_flat(self) -> bytes:
+        if self._dec_flat is None:
+            self._dec_flat = b''.join(_COLUMNS.pack(*rk) for rk in self.dec_words)
+        return self._dec_flat
+
+    # Other per-key data (e.g. GHASH tables for GCM) cached under name; factory() builds it on first use
+    def derived(self, name: str, factory):
+        value = self._derived.get(name)
+        if value is None:
+            value = self._derived[name] = factory()
+        return value
+
+    def _clear_layouts(self) -> None:
+        self._words = self._flat = self._dec_words = self._dec_flat = None
+        self._derived = {}
+
     def print_keys(self):
         print(f'{self}\nRound keys: ')
         for i, n in enumerate(self.round_keys):
@@ -80,17 +136,14 @@ class KeySchedule:
 
     # Converts array to list of int32s that key expansion can operate on
     def _get_words(self) -> list[int]:
-        words = []
-        for idx in range(0, len(self.key_bytes), 4):
-            words.append(_array_to_num32(self.key_bytes[idx: idx + 4]))
-        return words
+        return [int.from_bytes(self.key_bytes[idx: idx + 4]) for idx in range(0, len(self.key_bytes), 4)]
 
     # Applies S-Box to each byte of an int32
     def _sub_word(self, word: int) -> int:
         out = 0
         for shift in range(0, 32, 8):
             mask = 0xFF << shift
-            out += self._SBOX[(word & mask) >> shift] << shift
+            out += self._sbox[(word & mask) >> shift] << shift
         return out
 
     # Performs key expansion; can use 128, 192 and 256-bit keys
@@ -114,9 +167,90 @@ class KeySchedule:
                 else:
                     word = words[i - k_word_num] ^ words[i - 1]
                 words.append(word)
-                round_words += _num32_to_array(word)
+                round_words += word.to_bytes(4)
 
             #Every 4 words generated, create new 16 byte round key
             round_keys.append(ByteMatrix16(round_words))
 
         return round_keys
+
+
+# Bounded LRU cache of expanded key schedules keyed by key bytes (and S-Box, if not the standard one).
+# Schedules are zeroized (best-effort, see KeySchedule.zeroize) when evicted or cleared. Rijndael and GCM
+# instances notice an evicted schedule and fetch it again before their next call, but one evicted while a call is
+# running on another thread is cleared under it, so size the cache above the number of keys in concurrent use
+class KeyScheduleCache:
+    def __init__(self, maxsize: int=64):
+        if maxsize < 1:
+            raise ValueError(f'{type(self).__name__}: maxsize must be at least 1 ({maxsize})')
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._schedules: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._schedules)
+
+    def __contains__(self, key):
+        return self._cache_key(key, None) in self._schedules
+
+    def __repr__(self):
+        return f"{type(self)}, {self.maxsize=}, {self.stats()}"
+
+    # Returns the cached schedule for key, expanding and caching it on a miss
+    def get(self, key: str | bytearray | bytes, sbox=None) -> KeySchedule:
+        cache_key = self._cache_key(key, sbox)
+        with self._lock:
+            schedule = self._schedules.get(cache_key)
+            if schedule is not None:
+                self.hits += 1
+                self._schedules.move_to_end(cache_key)
+                return schedule
+            self.misses += 1
+        # Expand outside the lock; the key is copied so zeroizing never touches the caller's buffer
+        schedule = KeySchedule(bytearray(cache_key[0]), sbox)
+        with self._lock:
+            existing = self._schedules.get(cache_key)
+            if existing is not None:
+                # Another thread expanded the same key meanwhile; keep its schedule so only one is ever handed out
+                schedule.zeroize()
+                self._schedules.move_to_end(cache_key)
+                return existing
+            self._schedules[cache_key] = schedule
+            self._schedules.move_to_end(cache_key)
+            while len(self._schedules) > self.maxsize:
+                self._schedules.popitem(last=False)[1].zeroize()
+                self.evictions += 1
+        return schedule
+
+    # Removes and zeroizes the schedule for key; returns whether one was cached
+    def evict(self, key: str | bytearray | bytes, sbox=None) -> bool:
+        with self._lock:
+            schedule = self._schedules.pop(self._cache_key(key, sbox), None)
+            if schedule is None:
+                return False
+            schedule.zeroize()
+            self.evictions += 1
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            for schedule in self._schedules.values():
+                schedule.zeroize()
+            self.evictions += len(self._schedules)
+            self._schedules.clear()
+
+    def stats(self) -> dict:
+        return {'size': len(self._schedules), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    @staticmethod
+    def _cache_key(key, sbox) -> tuple:
+        key_bytes = bytes(key, 'utf-8') if isinstance(key, str) else bytes(key)
+        if sbox is None or tuple(sbox) == forward_sbox():
+            return key_bytes, None
+        return key_bytes, tuple(sbox)
+
+# Shared cache for callers that want schedules reused across Rijndael instances
+KEY_SCHEDULE_CACHE = KeyScheduleCache()
@@ -0,0 +1,97 @@
+# Load test for src.server: concurrent clients send encrypt requests and latency percentiles are reported.
+#     python -m src.loadtest --requests 2000 --concurrency 32 --size 4k
+# Without --tcp/--unix a local server instance is started in this process with a throwaway key
+import argparse
+import asyncio
+import os
+import sys
+import time
+from src.server import EncryptionServer, AsyncClient
+from src.modes import MODES, IV_MODES
+from src.cli import parse_size
+
+LOAD_KEY_ID = 'load'
+
+# Nearest-rank percentile of sorted values
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return float('nan')
+    rank = max(1, -(-len(values) * pct // 100))
+    return values[int(rank) - 1]
+
+async def _client_loop(client: AsyncClient, key_id: str, mode: str, data: bytes, count: int,
+                       latencies: list[float]) -> None:
+    iv = os.urandom(16) if mode in IV_MODES else None
+    for _ in range(count):
+        start = time.perf_counter()
+        await client.encrypt(key_id, data, mode, iv)
+        latencies.append(time.perf_counter() - start)
+
+# Runs `requests` requests spread over `concurrency` concurrent tasks sharing `connections` connections.
+# Returns (sorted latencies in seconds, wall time in seconds)
+async def run_load(connect, key_id: str, requests: int, concurrency: int, connections: int, size: int,
+                   mode: str='ecb') -> tuple[list[float], float]:
+    clients = [await connect() for _ in range(connections)]
+    data = os.urandom(size)
+    latencies = []
+    try:
+        await clients[0].encrypt(key_id, data, mode, os.urandom(16) if mode in IV_MODES else None) # Warm up
+        per_task = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+        start = time.perf_counter()
+        await asyncio.gather(*(_client_loop(clients[i % connections], key_id, mode, data, n, latencies)
+                               for i, n in enumerate(per_task) if n))
+        elapsed = time.perf_counter() - start
+    finally:
+        for client in clients:
+            await client.close()
+    return sorted(latencies), elapsed
+
+def report(latencies: list[float], elapsed: float, size: int) -> str:
+    lines = [f'{len(latencies)} requests of {size} bytes in {elapsed:.3f} s: '
+             f'{len(latencies) / elapsed:.1f} req/s, {len(latencies) * size / 1e6 / elapsed:.2f} MB/s']
+    lines.append('latency ms: ' + ', '.join(f'p{p:g} {percentile(latencies, p) * 1e3:.2f}'
+                                            for p in (50, 90, 99, 99.9)) + f', max {latencies[-1] * 1e3:.2f}')
+    return '\n'.join(lines)
+
+async def _main(args) -> None:
+    server = None
+    key_id = args.key_id
+    if args.tcp:
+        host, _, port = args.tcp.rpartition(':')
+        connect = lambda: AsyncClient.connect_tcp(host, int(port))
+    elif args.unix:
+        connect = lambda: AsyncClient.connect_unix(args.unix)
+    else:
+        key_id = LOAD_KEY_ID
+        server = EncryptionServer({key_id: os.urandom(16)}, args.engine, args.workers, args.max_in_flight)
+        host, port = (await server.start_tcp('127.0.0.1', 0))[:2]
+        connect = lambda: AsyncClient.connect_tcp(host, port)
+    try:
+        latencies, elapsed = await run_load(connect, key_id, args.requests, args.concurrency,
+                                            args.connections, args.size, args.mode)
+    finally:
+        if server is not None:
+            await server.close()
+    print(report(latencies, elapsed, args.size))
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m src.loadtest', description='Load test for src.server')
+    parser.add_argument('--tcp', metavar='HOST:PORT', help='running server to test')
+    parser.add_argument('--unix', metavar='PATH', help='running server to test over a Unix socket')
+    parser.add_argument('--key-id', default=LOAD_KEY_ID, help='key ID registered on the running server')
+    parser.add_argument('-n', '--requests', type=int, default=1000)
+    parser.add_argument('-c', '--concurrency', type=int, default=16, help='concurrent requests in flight')
+    parser.add_argument('--connections', type=int, default=4, help='connections shared by the concurrent requests')
+    parser.add_argument('-s', '--size', type=parse_size, default=1024, help='payload size, e.g. 16, 4k, 1m')
+    parser.add_argument('-m', '--mode', choices=MODES, default='ctr')
+    parser.add_argument('-e', '--engine', default='ttable', help='engine of the local server')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='executor processes of the local server')
+    parser.add_argument('--max-in-flight', type=int, default=64, help='in-flight limit of the local server')
+    args = parser.parse_args(argv)
+    if args.concurrency < 1 or args.connections < 1 or args.requests < 1:
+        parser.error('--requests, --concurrency and --connections must be at least 1')
+    asyncio.run(_main(args))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
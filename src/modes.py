@@ -0,0 +1,75 @@
+# Block cipher modes of operation built on an engine's encrypt_blocks/decrypt_blocks
+# See https://en.wikipedia.org/wiki/Block_cipher_mode_of_operation
+
+MODES = ('ecb', 'cbc', 'ctr')
+PADDED_MODES = ('ecb', 'cbc') # CTR is a stream mode; output length equals input length
+IV_MODES = ('cbc', 'ctr')
+
+# XORs two equal length byte strings as big ints; much faster than a per-byte loop
+def xor_bytes(a: bytes | bytearray, b: bytes | bytearray) -> bytes:
+    return (int.from_bytes(a) ^ int.from_bytes(b)).to_bytes(len(a))
+
+def check_iv(mode: str, iv: bytes | bytearray) -> None:
+    if mode == 'cbc' and len(iv) != 16:
+        raise ValueError(f'CBC IV must be 16 bytes ({len(iv)})')
+    if mode == 'ctr' and len(iv) not in (12, 16):
+        raise ValueError(f'CTR nonce must be 12 or 16 bytes ({len(iv)})')
+
+# ECB: every block independent
+def ecb_encrypt(engine, data: bytes | bytearray) -> bytearray:
+    return engine.encrypt_blocks(data)
+
+def ecb_decrypt(engine, data: bytes | bytearray) -> bytearray:
+    return engine.decrypt_blocks(data)
+
+# CBC: each plaintext block is XORed with the previous ciphertext block before encryption (sequential)
+def cbc_encrypt(engine, data: bytes | bytearray, iv: bytes | bytearray) -> bytearray:
+    out = bytearray(len(data))
+    prev = iv
+    for idx in range(0, len(data), 16):
+        prev = engine.encrypt_blocks(xor_bytes(data[idx : idx + 16], prev))
+        out[idx : idx + 16] = prev
+    return out
+
+# CBC decryption only needs the ciphertext, so all blocks are decrypted in one batch then XORed
+def cbc_decrypt(engine, data: bytes | bytearray, iv: bytes | bytearray) -> bytearray:
+    if not data:
+        return bytearray()
+    decrypted = engine.decrypt_blocks(data)
+    return bytearray(xor_bytes(decrypted, bytes(iv) + bytes(data[:-16])))
+
+# Counter blocks; a 16 byte IV is a 128-bit counter, a 12 byte nonce is followed by a
+# 32-bit counter starting at 1 that wraps without touching the nonce (as in GCM)
+def counter_blocks(iv: bytes | bytearray, start: int, count: int) -> bytes:
+    if len(iv) == 12:
+        prefix, counter, mask = int.from_bytes(iv) << 32, 1, 0xFFFFFFFF
+    else:
+        prefix, counter, mask = 0, int.from_bytes(iv), (1 << 128) - 1
+    return b''.join((prefix | ((counter + n) & mask)).to_bytes(16) for n in range(start, start + count))
+
+# Keystream for blocks [start, start + count). Blocks are independent, so any range can be
+# generated separately (in batches or in parallel) and concatenated
+def ctr_keystream(engine, iv: bytes | bytearray, start: int, count: int) -> bytearray:
+    return engine.encrypt_blocks(counter_blocks(iv, start, count))
+
+# CTR encryption and decryption are the same operation. start is the block offset of data in the message
+def ctr_crypt(engine, data: bytes | bytearray, iv: bytes | bytearray, start: int=0) -> bytearray:
+    if not data:
+        return bytearray()
+    keystream = ctr_keystream(engine, iv, start, (len(data) + 15) // 16)
+    return bytearray(xor_bytes(data, keystream[:len(data)]))
+
+# Mode dispatch. For CBC, iv is the previous ciphertext block; for CTR, start is the block offset
+def mode_encrypt(engine, mode: str, data, iv=None, start: int=0) -> bytearray:
+    if mode == 'cbc':
+        return cbc_encrypt(engine, data, iv)
+    if mode == 'ctr':
+        return ctr_crypt(engine, data, iv, start)
+    return ecb_encrypt(engine, data)
+
+def mode_decrypt(engine, mode: str, data, iv=None, start: int=0) -> bytearray:
+    if mode == 'cbc':
+        return cbc_decrypt(engine, data, iv)
+    if mode == 'ctr':
+        return ctr_crypt(engine, data, iv, start)
+    return ecb_decrypt(engine, data)
@@ -0,0 +1,157 @@
+# Batch API for many small records that each have their own key (e.g. per-tenant keys). Instead of a Rijndael
+# instance per record, key expansion runs once for all keys of a size as NumPy operations over a (K, words, 4)
+# array, and every block of every record goes through the rounds together, each row XORed with its own
+# record's round keys. Requires NumPy.
+#     batch = BatchCipher(mode='cbc')
+#     ciphertexts = batch.encrypt(keys, messages, ivs=ivs)
+#     plaintexts = batch.decrypt(keys, ciphertexts, ivs=ivs)
+# Output is identical to Rijndael(key, mode=mode, iv=iv).encrypt(message) for each record
+from src.block_view import BlockView
+from src.constants import RCON
+from src.key_schedule import _KEY_ROUND_SIZES
+from src.modes import MODES, PADDED_MODES, IV_MODES, check_iv, counter_blocks
+from src.sbox import forward_sbox, inverse_sbox
+from src import numpy_engine
+from src.numpy_engine import NumpyRounds
+
+# Expands K keys of the same size at once: keys is a (K, key size) uint8 array, the result is (K, rounds, 16)
+# with the same round keys as KeySchedule, one row of round keys per key
+def expand_keys(keys, sbox) -> 'numpy.ndarray':
+    np = numpy_engine.np
+    n_keys, key_size = keys.shape
+    nk = key_size // 4
+    rounds = _KEY_ROUND_SIZES[key_size]
+    words = np.empty((n_keys, 4 * rounds, 4), dtype=np.uint8)
+    words[:, :nk] = keys.reshape(n_keys, nk, 4)
+    for i in range(nk, 4 * rounds):
+        temp = words[:, i - 1]
+        if i % nk == 0:
+            temp = sbox[temp[:, [1, 2, 3, 0]]] # SubWord(RotWord(w))
+            temp[:, 0] ^= RCON[i // nk - 1]
+        elif nk > 6 and i % nk == 4:
+            temp = sbox[temp]
+        words[:, i] = words[:, i - nk] ^ temp
+    return words.reshape(n_keys, rounds, 16)
+
+class BatchCipher:
+    # mode: 'ecb', 'cbc' or 'ctr'; IVs are given per record to encrypt/decrypt
+    def __init__(self, mode: str='ecb', sbox_f=None, sbox_i=None):
+        if mode not in MODES:
+            raise ValueError(f'{type(self).__name__}: Unknown mode ({mode})')
+        self.mode = mode
+        self._rounds = NumpyRounds(forward_sbox() if sbox_f is None else sbox_f,
+                                   inverse_sbox() if sbox_i is None else sbox_i)
+        self._np = numpy_engine.np
+
+    # Encrypts messages[i] with keys[i] (and ivs[i] for CBC and CTR); returns the ciphertexts in order.
+    # Padding works as in Rijndael.encrypt
+    def encrypt(self, keys, messages, add_padding=True, ivs=None) -> list[bytearray]:
+        return self._run(keys, messages, ivs, decrypt=False, padding=add_padding)
+
+    def decrypt(self, keys, messages, remove_padding=True, ivs=None) -> list[bytearray]:
+        return self._run(keys, messages, ivs, decrypt=True, padding=remove_padding)
+
+    # Equivalent inverse cipher keys (see KeySchedule.dec_words) for (K, rounds, 16) round keys
+    def _decryption_keys(self, round_keys):
+        n_keys, rounds, _ = round_keys.shape
+        dec = self._np.empty_like(round_keys)
+        dec[:, 0] = round_keys[:, -1]
+        dec[:, -1] = round_keys[:, 0]
+        middle = round_keys[:, -2:0:-1].reshape(-1, 16)
+        dec[:, 1:-1] = self._rounds.mix_columns_inv(middle).reshape(n_keys, rounds - 2, 16)
+        return dec
+
+    def _run(self, keys, messages, ivs, decrypt: bool, padding: bool) -> list[bytearray]:
+        if len(keys) != len(messages):
+            raise ValueError(f'{type(self).__name__}: {len(keys)} keys for {len(messages)} messages')
+        if self.mode in IV_MODES:
+            if ivs is None or len(ivs) != len(messages):
+                raise ValueError(f'{type(self).__name__}: {self.mode.upper()} mode needs one IV per message')
+            for iv in ivs:
+                check_iv(self.mode, iv)
+        # Records are grouped by key size, since the number of rounds differs
+        groups: dict[int, list[int]] = {}
+        for idx, key in enumerate(keys):
+            key = bytes(key, 'utf-8') if isinstance(key, str) else bytes(key)
+            if len(key) not in _KEY_ROUND_SIZES:
+                raise ValueError(f'{type(self).__name__}: Incompatible key length ({len(key)} bytes, record {idx})')
+            groups.setdefault(len(key), []).append(idx)
+        out: list[bytearray] = [None] * len(messages)
+        for key_size, indices in groups.items():
+            key_bytes = b''.join(bytes(keys[i], 'utf-8') if isinstance(keys[i], str) else bytes(keys[i])
+                                 for i in indices)
+            round_keys = expand_keys(self._np.frombuffer(key_bytes, dtype=self._np.uint8).reshape(-1, key_size),
+                                     self._rounds._sbox_f)
+            group_ivs = [ivs[i] for i in indices] if ivs is not None else None
+            results = self._run_group(round_keys, [messages[i] for i in indices], group_ivs, decrypt, padding)
+            for idx, result in zip(indices, results):
+                out[idx] = result
+        return out
+
+    # Runs one key size group; round_keys is (K, rounds, 16)
+    def _run_group(self, round_keys, messages: list, ivs: list, decrypt: bool, padding: bool) -> list[bytearray]:
+        np = self._np
+        mode = self.mode
+        messages = [m.encode('utf-8') if isinstance(m, str) else m for m in messages] # Lengths below are in bytes
+        blocks = [self._prepare(m, decrypt, padding) for m in messages]
+        counts = np.array([len(b) // 16 for b in blocks], dtype=np.intp)
+        rows = np.repeat(np.arange(len(blocks)), counts) # Record of each block row
+        data = np.frombuffer(b''.join(blocks), dtype=np.uint8).reshape(-1, 16)
+
+        if mode == 'ctr':
+            counters = b''.join(counter_blocks(iv, 0, int(n)) for iv, n in zip(ivs, counts))
+            keystream = self._encrypt_rows(np.frombuffer(counters, dtype=np.uint8).reshape(-1, 16),
+                                           round_keys[rows])
+            result = data ^ keystream
+        elif mode == 'cbc' and not decrypt:
+            result = self._cbc_encrypt(round_keys, data, counts, ivs)
+        elif decrypt:
+            dec_keys = self._decryption_keys(round_keys)
+            result = self._rounds.decrypt_array(data, dec_keys[rows].transpose(1, 0, 2))
+            if mode == 'cbc':
+                # Each block is XORed with the ciphertext block before it, or the IV for a record's first block
+                prev = np.empty_like(data)
+                prev[1:] = data[:-1]
+                starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[counts > 0]
+                prev[starts] = np.frombuffer(b''.join(bytes(iv) for iv, n in zip(ivs, counts) if n),
+                                             dtype=np.uint8).reshape(-1, 16)
+                result = result ^ prev
+        else:
+            result = self._encrypt_rows(data, round_keys[rows])
+
+        flat = result.tobytes()
+        out = []
+        offset = 0
+        for message, n in zip(messages, counts):
+            size = 16 * int(n)
+            record = bytearray(flat[offset : offset + size])
+            offset += size
+            if mode not in PADDED_MODES:
+                del record[len(message):] # CTR output has the input length
+            elif decrypt and padding and record:
+                BlockView(record).unpad()
+            out.append(record)
+        return out
+
+    # Whole blocks for one record: PKCS#7 padding for padded modes when encrypting, otherwise a final partial
+    # block is filled with null bytes like State does
+    def _prepare(self, message, decrypt: bool, padding: bool) -> bytearray:
+        return BlockView.from_data(message, padding and not decrypt and self.mode in PADDED_MODES).buffer
+
+    # Encrypts rows of data, each with its own (rounds, 16) round keys from row_keys (N, rounds, 16)
+    def _encrypt_rows(self, data, row_keys):
+        return self._rounds.encrypt_array(data, row_keys.transpose(1, 0, 2))
+
+    # CBC encryption is sequential within a record, so it steps through block positions: step j encrypts
+    # block j of every record that has one, all together
+    def _cbc_encrypt(self, round_keys, data, counts, ivs):
+        np = self._np
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        prev = np.frombuffer(b''.join(bytes(iv) for iv in ivs), dtype=np.uint8).reshape(-1, 16).copy()
+        result = np.empty_like(data)
+        for j in range(int(counts.max()) if len(counts) else 0):
+            active = np.nonzero(counts > j)[0]
+            pos = starts[active] + j
+            prev[active] = self._encrypt_rows(data[pos] ^ prev[active], round_keys[active])
+            result[pos] = prev[active]
+        return result
@@ -0,0 +1,94 @@
+# Batch engine: N blocks are held as an (N, 16) uint8 array and every AES step is one vectorized
+# operation over all of them. Requires NumPy, which is optional for the rest of the project. NumPy is only
+# imported when the first NumpyEngine is created, so it costs nothing at startup for the other engines
+from importlib.util import find_spec
+from src.galois_math import mul_table
+from src.key_schedule import KeySchedule
+from src.state import SHIFT_ROWS, SHIFT_ROWS_INV
+
+NUMPY_AVAILABLE = find_spec('numpy') is not None
+np = None # The numpy module, once imported by _import_numpy
+
+def _import_numpy() -> None:
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+
+
+def _mul_table(n: int):
+    return np.array(mul_table(n), dtype=np.uint8)
+
+# Vectorized AES rounds over an (N, 16) array of blocks, with the round keys passed in. A round key is either
+# one (16,) key broadcast over every block or an (N, 16) array with a key per block (see multikey.py)
+class NumpyRounds:
+    def __init__(self, sbox_f: list, sbox_i: list):
+        if not NUMPY_AVAILABLE:
+            raise ImportError(f'{type(self).__name__} requires numpy')
+        _import_numpy()
+        self._sbox_f = np.array(sbox_f, dtype=np.uint8)
+        self._sbox_i = np.array(sbox_i, dtype=np.uint8)
+        self._mul = {n: _mul_table(n) for n in (2, 3, 9, 11, 13, 14)}
+
+    # MixColumns over all blocks; columns are rows of the (N, 4, 4) view
+    def mix_columns(self, s):
+        c = s.reshape(-1, 4, 4)
+        a0, a1, a2, a3 = c[:, :, 0], c[:, :, 1], c[:, :, 2], c[:, :, 3]
+        m2, m3 = self._mul[2], self._mul[3]
+        out = np.empty_like(c)
+        out[:, :, 0] = m2[a0] ^ m3[a1] ^ a2 ^ a3
+        out[:, :, 1] = a0 ^ m2[a1] ^ m3[a2] ^ a3
+        out[:, :, 2] = a0 ^ a1 ^ m2[a2] ^ m3[a3]
+        out[:, :, 3] = m3[a0] ^ a1 ^ a2 ^ m2[a3]
+        return out.reshape(-1, 16)
+
+    # InvMixColumns over all blocks; also turns round keys into equivalent inverse cipher keys (see multikey.py)
+    def mix_columns_inv(self, s):
+        c = s.reshape(-1, 4, 4)
+        a0, a1, a2, a3 = c[:, :, 0], c[:, :, 1], c[:, :, 2], c[:, :, 3]
+        m9, m11, m13, m14 = self._mul[9], self._mul[11], self._mul[13], self._mul[14]
+        out = np.empty_like(c)
+        out[:, :, 0] = m14[a0] ^ m11[a1] ^ m13[a2] ^ m9[a3]
+        out[:, :, 1] = m9[a0] ^ m14[a1] ^ m11[a2] ^ m13[a3]
+        out[:, :, 2] = m13[a0] ^ m9[a1] ^ m14[a2] ^ m11[a3]
+        out[:, :, 3] = m11[a0] ^ m13[a1] ^ m9[a2] ^ m14[a3]
+        return out.reshape(-1, 16)
+
+    # Encrypts the (N, 16) array s; keys[i] is round key i
+    def encrypt_array(self, s, keys):
+        s = s ^ keys[0]
+        for key_idx in range(1, len(keys)):
+            s = self._sbox_f[s] # SubBytes
+            s = s[:, SHIFT_ROWS] # ShiftRows
+            if key_idx != len(keys) - 1:
+                s = self.mix_columns(s)
+            s ^= keys[key_idx] # AddRoundKey, broadcast over all blocks
+        return s
+
+    # Decrypts s with the equivalent inverse cipher, which has the same round structure as encryption;
+    # keys are the equivalent inverse cipher keys (KeySchedule.dec_flat)
+    def decrypt_array(self, s, keys):
+        s = s ^ keys[0]
+        for key_idx in range(1, len(keys)):
+            s = self._sbox_i[s] # InvSubBytes
+            s = s[:, SHIFT_ROWS_INV] # InvShiftRows
+            if key_idx != len(keys) - 1:
+                s = self.mix_columns_inv(s)
+            s ^= keys[key_idx]
+        return s
+
+class NumpyEngine(NumpyRounds):
+    def __init__(self, round_keys: KeySchedule, sbox_f: list, sbox_i: list):
+        super().__init__(sbox_f, sbox_i)
+        self._keys = np.frombuffer(round_keys.flat, dtype=np.uint8).reshape(-1, 16)
+        self._dec_keys = np.frombuffer(round_keys.dec_flat, dtype=np.uint8).reshape(-1, 16)
+
+    # Encrypts data made of whole 16 byte blocks
+    def encrypt_blocks(self, data: bytes | bytearray) -> bytearray:
+        s = np.frombuffer(data, dtype=np.uint8).reshape(-1, 16)
+        return bytearray(self.encrypt_array(s, self._keys).tobytes())
+
+    # Decrypts data made of whole 16 byte blocks
+    def decrypt_blocks(self, data: bytes | bytearray) -> bytearray:
+        s = np.frombuffer(data, dtype=np.uint8).reshape(-1, 16)
+        return bytearray(self.decrypt_array(s, self._dec_keys).tobytes())
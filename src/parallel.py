@@ -0,0 +1,73 @@
+# Multi-core block processing. Input is split into large segments that are dispatched to a process pool;
+# each worker builds its engine once from the key schedule and S-Boxes passed to the pool initializer
+import os
+from src.key_schedule import KeySchedule
+from src.modes import mode_encrypt, mode_decrypt
+
+MIN_SEGMENT_SIZE = 64 * 1024 # Smallest segment worth sending to another process. Must be divisible by 16
+SEGMENTS_PER_WORKER = 4 # More segments than workers evens out uneven worker speeds
+
+# Engine for the current worker process, created by _init_worker
+_worker_engine = None
+
+def _init_worker(engine_cls, round_keys: KeySchedule, sbox_f: list, sbox_i: list) -> None:
+    global _worker_engine
+    _worker_engine = engine_cls(round_keys, sbox_f, sbox_i)
+
+def _encrypt_segment(mode: str, data: bytes, iv, start: int) -> bytearray:
+    return mode_encrypt(_worker_engine, mode, data, iv, start)
+
+def _decrypt_segment(mode: str, data: bytes, iv, start: int) -> bytearray:
+    return mode_decrypt(_worker_engine, mode, data, iv, start)
+
+# Whether blocks of this mode can be processed independently of each other
+def is_parallel(mode: str, decrypt: bool) -> bool:
+    return mode in ('ecb', 'ctr') or (mode == 'cbc' and decrypt)
+
+class BlockPool:
+    def __init__(self, workers: int, engine_cls, round_keys: KeySchedule, sbox_f: list, sbox_i: list):
+        self.workers = workers
+        # Imported here; the process pool machinery is slow to import and unused by single-process runs
+        from concurrent.futures import ProcessPoolExecutor
+        self._executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                             initargs=(engine_cls, round_keys, sbox_f, sbox_i))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    # Segment boundaries for data of the given length; every boundary but the last is block aligned
+    def segments(self, length: int) -> list[tuple[int, int]]:
+        size = -(-length // (self.workers * SEGMENTS_PER_WORKER)) # Ceiling division
+        size = max(MIN_SEGMENT_SIZE, size + (-size % 16))
+        return [(idx, min(idx + size, length)) for idx in range(0, length, size)]
+
+    # Same results as mode_encrypt/mode_decrypt, reassembled in input order
+    def encrypt(self, mode: str, data, iv=None, start: int=0) -> bytearray:
+        return self._run(_encrypt_segment, mode, data, iv, start)
+
+    def decrypt(self, mode: str, data, iv=None, start: int=0) -> bytearray:
+        return self._run(_decrypt_segment, mode, data, iv, start)
+
+    def _run(self, func, mode: str, data, iv, start: int) -> bytearray:
+        futures = []
+        segments = self.segments(len(data))
+        for seg_start, seg_end in segments:
+            seg_iv = iv
+            if mode == 'cbc' and seg_start:
+                # CBC decryption of a segment only needs the ciphertext block before it
+                seg_iv = bytes(data[seg_start - 16 : seg_start])
+            futures.append(self._executor.submit(func, mode, bytes(data[seg_start : seg_end]), seg_iv,
+                                                 start + seg_start // 16))
+        out = bytearray(len(data))
+        for (seg_start, seg_end), future in zip(segments, futures):
+            out[seg_start:seg_end] = future.result()
+        return out
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
@@ -0,0 +1,100 @@
+# Opt-in per-stage profiling. While profile_stages() is active, the AES step methods of State, key expansion,
+# block packing/unpacking, padding and every engine's block functions are wrapped with timers. Outside of it
+# nothing is wrapped, so there is no overhead when profiling is off. Wrapping is process-wide
+import contextlib
+import functools
+import json
+import time
+from src import rijndael
+from src.state import State
+from src.key_schedule import KeySchedule
+from src.block_view import BlockView
+
+# (owner, attribute, stage name) for each timed function
+_STATE_STAGES = (
+    (State, 'sub_bytes', 'sub_bytes'),
+    (State, 'shift_rows', 'shift_rows'),
+    (State, 'shift_rows_inv', 'shift_rows_inv'),
+    (State, 'mix_columns', 'mix_columns'),
+    (State, 'mix_columns_inv', 'mix_columns_inv'),
+    (State, 'ixor_round_key', 'add_round_key'),
+    (KeySchedule, '_generate_round_keys', 'key_expansion'),
+    # Copying messages into block buffers, and blocks into and out of the State the state engine works on
+    (BlockView, 'from_data', 'pack_states'),
+    (BlockView, 'load_state', 'pack_states'),
+    (BlockView, 'store_state', 'unpack_states'),
+    (rijndael, 'pad_pkcs7', 'padding'),
+    (rijndael, 'unpad_pkcs7', 'padding'),
+)
+
+def _targets() -> list[tuple]:
+    targets = list(_STATE_STAGES)
+    for name, engine in rijndael.ENGINES.items():
+        targets.append((engine, 'encrypt_blocks', f'{name}.encrypt_blocks'))
+        targets.append((engine, 'decrypt_blocks', f'{name}.decrypt_blocks'))
+    return targets
+
+# Call counts and cumulative nanoseconds per stage
+class StageStats:
+    def __init__(self):
+        self.stages: dict[str, list[int]] = {}
+
+    def __repr__(self):
+        return f"{type(self)}, {self.to_dict()}"
+
+    def record(self, stage: str, ns: int) -> None:
+        entry = self.stages.get(stage)
+        if entry is None:
+            self.stages[stage] = [1, ns]
+        else:
+            entry[0] += 1
+            entry[1] += ns
+
+    def reset(self) -> None:
+        self.stages.clear()
+
+    def to_dict(self) -> dict:
+        return {stage: {'calls': calls, 'ns': ns} for stage, (calls, ns) in self.stages.items()}
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.to_dict(), **kwargs)
+
+    # Stages sorted by total time. Engine stages include the time of the stages they call
+    def table(self) -> str:
+        lines = [f'{"stage":<24}{"calls":>10}{"total ms":>12}{"avg us":>10}']
+        for stage, (calls, ns) in sorted(self.stages.items(), key=lambda item: -item[1][1]):
+            lines.append(f'{stage:<24}{calls:>10}{ns / 1e6:>12.3f}{ns / calls / 1e3:>10.2f}')
+        return '\n'.join(lines)
+
+def _timed(stats: StageStats, stage: str, func):
+    perf_counter_ns = time.perf_counter_ns
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = perf_counter_ns()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats.record(stage, perf_counter_ns() - start)
+    return wrapper
+
+# Profiles everything run inside the with block:
+#     with profile_stages() as stats:
+#         Rijndael(key).encrypt(data)
+#     print(stats.table())
+@contextlib.contextmanager
+def profile_stages(stats: StageStats=None):
+    stats = StageStats() if stats is None else stats
+    originals = []
+    try:
+        for owner, attr, stage in _targets():
+            func = owner.__dict__[attr] if isinstance(owner, type) else getattr(owner, attr)
+            originals.append((owner, attr, func))
+            if isinstance(func, classmethod):
+                setattr(owner, attr, classmethod(_timed(stats, stage, func.__func__)))
+            else:
+                setattr(owner, attr, _timed(stats, stage, func))
+        yield stats
+    finally:
+        for owner, attr, func in reversed(originals):
+            setattr(owner, attr, func)
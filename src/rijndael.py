@@ -1,90 +1,547 @@
+import contextlib
+import mmap
+import os
 from src.byte_matrix import ByteMatrix16
 from src.state import State
-from src.key_schedule import KeySchedule
-from src.sbox import compute_forward_sbox, compute_inverse_sbox
+from src.block_view import BlockView, pkcs7_padding_length
+from src.key_schedule import KeySchedule, KeyScheduleCache
+from src.sbox import forward_sbox, inverse_sbox
+from src.ttable import TTableEngine
+from src.numpy_engine import NumpyEngine, NUMPY_AVAILABLE
+from src.bitslice import BitsliceEngine
+from src.modes import MODES, PADDED_MODES, IV_MODES, check_iv, mode_encrypt, mode_decrypt
+from src.parallel import BlockPool, MIN_SEGMENT_SIZE, SEGMENTS_PER_WORKER, default_workers, is_parallel
 
-# Converts str into list of 4x4 byte matrices that can be operated on by AES
+# Converts str into list of 4x4 byte matrices that can be operated on by AES. Engines iterate a BlockView
+# instead; this builds one State per block and is kept for callers that want them all at once
 def array_to_states(text_bytes: bytearray, padding: bool=True) -> list[State]:
-    mxs = []
-    if padding:
-        print('Padding text...')
-        # Padding text to 16 bytes
-        padding = 16 - (len(text_bytes) % 16)
-        text_bytes += (bytearray(padding.to_bytes(1)) * padding)
-    for chunk16_idx in range(0, len(text_bytes), 16): # Split plaintext to 16 byte blocks
-        # Final block may be <16 bytes, remainder will be sized with null bytes on instantiation
-        mx = State(text_bytes[chunk16_idx : chunk16_idx + 16])
-        mxs.append(mx)
-    return mxs
+    blocks = BlockView.from_data(text_bytes, padding)
+    return [State(bytearray(block)) for block in blocks]
 
 def states_to_array(mxs: list, remove_padding: bool=False) -> bytearray:
-    text_bytes = bytearray()
-    for state in mxs:
-        text_bytes += state.data
+    text_bytes = bytearray().join(state.data for state in mxs)
     if remove_padding:
-        print('Removing padding...')
-        padding = text_bytes[-1]
-        text_bytes = text_bytes[:-padding]
+        return BlockView(text_bytes).unpad()
     return text_bytes
 
-# Main Rijndael class
-class Rijndael:
-    _SBOX_FORWARD = None
-    _SBOX_INVERSE = None
-    def __init__(self, key: str | bytearray, sbox_f=None, sbox_i=None):
-        self._SBOX_FORWARD = compute_forward_sbox() if sbox_f is None else sbox_f
-        self._SBOX_INVERSE = compute_inverse_sbox() if sbox_i is None else sbox_i
+# Final block may be <16 bytes; sizes it with null bytes like State instantiation does
+def _fill_block(text_bytes: bytearray) -> bytearray:
+    remain = len(text_bytes) % 16
+    return text_bytes + bytearray(16 - remain) if remain else text_bytes
 
-        self.key = bytearray(key, 'utf-8') if isinstance(key, str) else key
+# Default read size for the streaming API. Must be divisible by 16
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def _check_chunk_size(chunk_size: int) -> None:
+    if chunk_size <= 0 or chunk_size % 16:
+        raise ValueError(f'Chunk size must be a positive multiple of 16 ({chunk_size})')
+
+class StreamCancelled(Exception):
+    pass
+
+# Reads reader to the end in chunk_size pieces. progress(bytes_read) is called once the previous chunk has been
+# processed; cancel is checked before every read
+def _read_chunks(reader, chunk_size: int, progress=None, cancel=None):
+    done = 0
+    while True:
+        if cancel is not None and cancel.is_set():
+            raise StreamCancelled('Stream cancelled')
+        chunk = reader.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+        done += len(chunk)
+        if progress is not None:
+            progress(done)
+
+# Flat byte view of str or any buffer-protocol object; str is encoded as UTF-8
+def _byte_view(data) -> memoryview:
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return memoryview(data).cast('B')
+
+def _check_output(dst: memoryview, size: int) -> None:
+    if dst.readonly:
+        raise TypeError('Output buffer must be writable')
+    if len(dst) < size:
+        raise ValueError(f'Output buffer too small ({len(dst)} bytes, {size} needed)')
+
+# Read-only map of an open file; mmap can't map empty files
+def _map_input(f, length: int):
+    if not length:
+        return contextlib.nullcontext(b'')
+    return mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ)
+
+# Output files are truncated before the input is read, so they can't be the same file
+def _check_distinct_files(src_path: str, dst_path: str) -> None:
+    if os.path.exists(dst_path) and os.path.samefile(src_path, dst_path):
+        raise ValueError(f'Input and output are the same file ({src_path})')
+
+# Deletes the output file f (opened at path) if the block raises, so a failed conversion (e.g. bad padding from a
+# wrong key) doesn't leave a preallocated, partly written file behind. Entered only once both files are open, so
+# an input that can't be read never costs an existing output. f is closed first; open files can't be removed on
+# Windows
+@contextlib.contextmanager
+def _remove_on_error(path: str, f):
+    try:
+        yield
+    except BaseException:
+        f.close()
+        with contextlib.suppress(OSError):
+            os.remove(path)
+        raise
+
+# PKCS#7 padding; always adds 1-16 bytes so the padding length can be read back from the last byte
+def pad_pkcs7(text_bytes: bytes | bytearray) -> bytearray:
+    return BlockView.from_data(text_bytes, padding=True).buffer
+
+# Returns a copy of text_bytes without its padding; raises ValueError if the padding is invalid
+def unpad_pkcs7(text_bytes: bytes | bytearray) -> bytes | bytearray:
+    return text_bytes[:len(text_bytes) - pkcs7_padding_length(text_bytes)]
+
+# Trace callback that prints each traced step; pass as Rijndael(trace=print_trace) for the per-round view
+def print_trace(round_num: int, phase: str, state: bytes) -> None:
+    print(f'[Round {round_num:>2}] {phase:<16}{state.hex(" ", 4)}')
+
+# Reference engine operating on State objects; one method call per AES step.
+# If trace is set it is called as trace(round_num, phase, state_bytes) after every step
+class StateEngine:
+    TRACEABLE = True
 
-        self.round_keys = KeySchedule(self.key, self._SBOX_FORWARD)
+    def __init__(self, round_keys: KeySchedule, sbox_f: list, sbox_i: list, trace=None):
+        self.round_keys = round_keys
+        self._SBOX_FORWARD = sbox_f
+        self._SBOX_INVERSE = sbox_i
+        self.trace = trace
 
     # Full AES encryption as described at https://en.wikipedia.org/wiki/Advanced_Encryption_Standard#High-level_description_of_the_algorithm
-    def encrypt(self, plaintext: str | bytearray, add_padding=True) -> bytearray:
-        print(f"Beginning encryption with plaintext '{plaintext}' and key '{self.key}'")
-        plaintext_states = array_to_states(bytearray(plaintext, 'utf-8') if isinstance(plaintext, str) else plaintext, padding=add_padding)
-        encrypted_states = []
-        # Operates on each 16 byte state "block" individually
-        for plain_state in plaintext_states:
-            print(f'[Encryption] Encrypting state {plain_state}')
+    def encrypt_blocks(self, data: bytearray) -> bytearray:
+        trace = self.trace
+        last_round = len(self.round_keys) - 1
+        # Blocks are encrypted in place in the output buffer, one 16 byte state "block" at a time
+        blocks = BlockView.from_data(data)
+        for plain_state in blocks.states():
+            if trace is not None:
+                trace(0, 'input', bytes(plain_state.data))
             # Initialize state with key addition
-            state = plain_state ^ self.round_keys[0]
-            # 10-14 rounds based on key length
-            for key_idx in range(1, len(self.round_keys) - 1):
+            state = plain_state
+            state.ixor_round_key(self.round_keys[0])
+            if trace is not None:
+                trace(0, 'add_round_key', bytes(state.data))
+            # 10-14 rounds based on key length; final round doesn't include MixColumns
+            for key_idx in range(1, last_round + 1):
                 state.sub_bytes(self._SBOX_FORWARD)
+                if trace is not None:
+                    trace(key_idx, 'sub_bytes', bytes(state.data))
                 state.shift_rows()
-                state.mix_columns()
-                state ^= self.round_keys[key_idx]
-                print(f'[Encryption] Round {key_idx}: {state}')
-            # Final round (doesn't include MixColumns)
-            state.sub_bytes(self._SBOX_FORWARD)
-            state.shift_rows()
-            state ^= self.round_keys[-1]
-            print(f'[Encryption] Final Round ({len(self.round_keys) - 1}): {state}')
-            encrypted_states.append(state)
-        return states_to_array(encrypted_states)
+                if trace is not None:
+                    trace(key_idx, 'shift_rows', bytes(state.data))
+                if key_idx != last_round:
+                    state.mix_columns()
+                    if trace is not None:
+                        trace(key_idx, 'mix_columns', bytes(state.data))
+                state.ixor_round_key(self.round_keys[key_idx])
+                if trace is not None:
+                    trace(key_idx, 'add_round_key', bytes(state.data))
+        return blocks.buffer
 
     # Full AES decryption; identical to encryption except reversed + using inverse methods
-    def decrypt(self, ciphertext: str | bytearray, remove_padding=True) -> bytearray:
-        print(f"Beginning decryption with ciphertext '{ciphertext}' and key '{self.key}'")
-        encrypted_states = array_to_states(bytearray(ciphertext, 'utf-8') if isinstance(ciphertext, str) else ciphertext, padding=False)
-        decrypted_states = []
-        for e_state in encrypted_states:
-            print(f'[Decryption] Decrypting state {e_state}')
-            state = e_state ^ self.round_keys[-1]
-            state.shift_rows_inv()
-            state.sub_bytes(self._SBOX_INVERSE)
-            print(f'[Decryption] Round {len(self.round_keys) - 1}: {state}')
-            for key_idx in range(len(self.round_keys) - 2, 0, -1):
-                state ^= self.round_keys[key_idx]
-                state.mix_columns_inv()
+    def decrypt_blocks(self, data: bytearray) -> bytearray:
+        trace = self.trace
+        last_round = len(self.round_keys) - 1
+        blocks = BlockView.from_data(data)
+        for e_state in blocks.states():
+            if trace is not None:
+                trace(last_round, 'input', bytes(e_state.data))
+            state = e_state
+            state.ixor_round_key(self.round_keys[-1])
+            if trace is not None:
+                trace(last_round, 'add_round_key', bytes(state.data))
+            # Rounds run in reverse; first inverse round doesn't include InvMixColumns
+            for key_idx in range(last_round - 1, -1, -1):
                 state.shift_rows_inv()
+                if trace is not None:
+                    trace(key_idx + 1, 'inv_shift_rows', bytes(state.data))
                 state.sub_bytes(self._SBOX_INVERSE)
-                print(f'[Decryption] Round {key_idx}: {state}')
-            state ^= self.round_keys[0]
-            decrypted_states.append(state)
-        return states_to_array(decrypted_states, remove_padding=remove_padding)
+                if trace is not None:
+                    trace(key_idx + 1, 'inv_sub_bytes', bytes(state.data))
+                state.ixor_round_key(self.round_keys[key_idx])
+                if trace is not None:
+                    trace(key_idx, 'add_round_key', bytes(state.data))
+                if key_idx != 0:
+                    state.mix_columns_inv()
+                    if trace is not None:
+                        trace(key_idx, 'inv_mix_columns', bytes(state.data))
+        return blocks.buffer
+
+# Available round engines. All engines produce identical output; 'state' is the readable reference
+ENGINES = {
+    'state': StateEngine,
+    'ttable': TTableEngine,
+    'bitslice': BitsliceEngine
+}
+if NUMPY_AVAILABLE:
+    ENGINES['numpy'] = NumpyEngine
+
+# Main Rijndael class
+class Rijndael:
+    _SBOX_FORWARD = None
+    _SBOX_INVERSE = None
+    # mode: 'ecb', 'cbc' or 'ctr'. iv: 16 byte IV (CBC) or 16 byte counter block / 12 byte nonce (CTR) used by
+    #     every call that doesn't pass its own. When not given, each encryption without an IV generates a fresh
+    #     random one, readable afterwards from self.iv (decryption without an IV uses self.iv)
+    # trace: optional callback(round_num, phase, state_bytes) for engines that support it (see print_trace)
+    # workers: processes used for inputs large enough to split (ECB, CTR and CBC decryption); None uses all cores.
+    #     With more than one worker, call close() or use the instance as a context manager when done
+    # key_cache: optional KeyScheduleCache (e.g. KEY_SCHEDULE_CACHE) to reuse expanded keys across instances
+    def __init__(self, key: str | bytearray, sbox_f=None, sbox_i=None, engine: str='state', trace=None,
+                 mode: str='ecb', iv: bytes | bytearray=None, workers: int | None=1,
+                 key_cache: KeyScheduleCache=None):
+        self._SBOX_FORWARD = forward_sbox() if sbox_f is None else sbox_f
+        self._SBOX_INVERSE = inverse_sbox() if sbox_i is None else sbox_i
+
+        if engine not in ENGINES:
+            raise ValueError(f'{type(self).__name__}: Unknown engine ({engine})')
+        self.engine = engine
+        if trace is not None and not getattr(ENGINES[engine], 'TRACEABLE', False):
+            raise ValueError(f'{type(self).__name__}: Engine ({engine}) does not support tracing')
+        self.trace = trace
+
+        if mode not in MODES:
+            raise ValueError(f'{type(self).__name__}: Unknown mode ({mode})')
+        self.mode = mode
+        if iv is not None:
+            check_iv(mode, iv)
+        self.iv = iv
+        self._fixed_iv = iv is not None
+
+        self.workers = default_workers() if workers is None else workers
+        if self.workers < 1:
+            raise ValueError(f'{type(self).__name__}: Worker count must be at least 1 ({self.workers})')
+        self._pool = None
+
+        self.key_cache = key_cache
+        self.key = bytearray(key, 'utf-8') if isinstance(key, str) else key
+
+        self.round_keys = self._get_schedule()
+        self._engine = self._create_engine()
+
+    # plaintext may be a str or any buffer-protocol object (bytes, bytearray, memoryview, mmap, array).
+    # iv overrides self.iv for this call only. Padding is not used in CTR mode
+    def encrypt(self, plaintext, add_padding=True, iv: bytes | bytearray=None) -> bytearray:
+        with _byte_view(plaintext) as src:
+            out = bytearray(self.encrypted_size(len(src), add_padding))
+            self.encrypt_into(src, out, add_padding, iv)
+        return out
+
+    def decrypt(self, ciphertext, remove_padding=True, iv: bytes | bytearray=None) -> bytearray:
+        with _byte_view(ciphertext) as src:
+            out = bytearray(self.decrypted_size(len(src)))
+            size = self.decrypt_into(src, out, remove_padding, iv)
+        del out[size:] # Padding removal only trims the tail
+        return out
+
+    # Output size of encrypt/encrypt_into for an input of `length` bytes
+    def encrypted_size(self, length: int, add_padding=True) -> int:
+        if self.mode not in PADDED_MODES:
+            return length
+        if add_padding:
+            return (length // 16 + 1) * 16
+        return -(-length // 16) * 16
+
+    # Buffer size decrypt_into needs for `length` bytes of ciphertext (before padding removal)
+    def decrypted_size(self, length: int) -> int:
+        return self.encrypted_size(length, add_padding=False)
+
+    # Encrypts src into the writable buffer dst (at least encrypted_size(len(src)) bytes) without copying
+    # the input; blocks are read through memoryview slices. Returns the number of bytes written
+    def encrypt_into(self, src, dst, add_padding=True, iv: bytes | bytearray=None) -> int:
+        iv = self._get_encrypt_iv(iv)
+        with _byte_view(src) as src, _byte_view(dst) as dst:
+            size = self.encrypted_size(len(src), add_padding)
+            _check_output(dst, size)
+            padded = self.mode in PADDED_MODES
+            whole = len(src) - (len(src) % 16) if padded else len(src)
+            block_idx = 0
+            for start, end in self._chunks(whole):
+                out = self._encrypt_data(src[start:end], iv, block_idx)
+                dst[start:end] = out
+                iv, block_idx = self._next_chain(iv, out, block_idx, end - start)
+            if padded and size > whole:
+                # Only the final partial block is copied to be padded
+                tail = bytearray(src[whole:])
+                tail = _fill_block(pad_pkcs7(tail) if add_padding else tail)
+                dst[whole:size] = self._encrypt_data(tail, iv, block_idx)
+        return size
+
+    # Decrypts src into the writable buffer dst (at least decrypted_size(len(src)) bytes).
+    # Returns the plaintext length; any padding bytes beyond it are left in dst
+    def decrypt_into(self, src, dst, remove_padding=True, iv: bytes | bytearray=None) -> int:
+        iv = self._get_iv(iv)
+        with _byte_view(src) as src, _byte_view(dst) as dst:
+            size = self.decrypted_size(len(src))
+            _check_output(dst, size)
+            padded = self.mode in PADDED_MODES
+            whole = len(src) - (len(src) % 16) if padded else len(src)
+            block_idx = 0
+            for start, end in self._chunks(whole):
+                blocks = src[start:end]
+                dst[start:end] = self._decrypt_data(blocks, iv, block_idx)
+                iv, block_idx = self._next_chain(iv, blocks, block_idx, end - start)
+            if size > whole:
+                # Truncated ciphertext; final block is sized with null bytes like State instantiation does
+                dst[whole:size] = self._decrypt_data(_fill_block(bytearray(src[whole:])), iv, block_idx)
+            if padded and remove_padding and size:
+                # Padding is at most one block; copying it out means no view of dst is held if it is rejected
+                size -= pkcs7_padding_length(bytes(dst[size - 16 : size]))
+        return size
+
+    # Incremental encryption of one message, e.g. one arriving in network chunks of any size:
+    #     enc = cipher.encryptor()
+    #     send(enc.iv)
+    #     for chunk in chunks:
+    #         send(enc.update(chunk))
+    #     send(enc.finalize())
+    # Output is identical to encrypt() over the whole message. Like encrypt(), each encryptor gets a fresh random
+    # IV unless one is given here or to the constructor; it is readable from enc.iv
+    def encryptor(self, add_padding=True, iv: bytes | bytearray=None) -> 'RijndaelEncryptor':
+        return RijndaelEncryptor(self, self._get_encrypt_iv(iv), add_padding)
+
+    def decryptor(self, remove_padding=True, iv: bytes | bytearray=None) -> 'RijndaelDecryptor':
+        return RijndaelDecryptor(self, self._get_iv(iv), remove_padding)
+
+    # Encrypts everything read from reader into writer, chunk_size bytes at a time. Memory use stays at
+    # about one chunk regardless of input size; returns the number of bytes written.
+    # progress: optional callback(bytes_read) called after each chunk. cancel: optional threading.Event (or any
+    # object with is_set()) checked before each read; when set, StreamCancelled is raised
+    def encrypt_stream(self, reader, writer, chunk_size: int=STREAM_CHUNK_SIZE, add_padding=True,
+                       iv: bytes | bytearray=None, progress=None, cancel=None) -> int:
+        _check_chunk_size(chunk_size)
+        return _run_stream(self.encryptor(add_padding, iv), reader, writer, chunk_size, progress, cancel)
+
+    # Decrypts everything read from reader into writer; counterpart of encrypt_stream
+    def decrypt_stream(self, reader, writer, chunk_size: int=STREAM_CHUNK_SIZE, remove_padding=True,
+                       iv: bytes | bytearray=None, progress=None, cancel=None) -> int:
+        _check_chunk_size(chunk_size)
+        return _run_stream(self.decryptor(remove_padding, iv), reader, writer, chunk_size, progress, cancel)
+
+    # Encrypts the file at src_path into dst_path. The input is memory-mapped, and the output is preallocated to
+    # its final size, memory-mapped, and written in place, so files larger than RAM work. Returns the output size
+    def encrypt_file(self, src_path: str, dst_path: str, add_padding=True, iv: bytes | bytearray=None) -> int:
+        _check_distinct_files(src_path, dst_path)
+        with open(src_path, 'rb') as f_in, open(dst_path, 'w+b') as f_out, _remove_on_error(dst_path, f_out):
+            length = os.fstat(f_in.fileno()).st_size
+            size = self.encrypted_size(length, add_padding)
+            f_out.truncate(size)
+            if size:
+                with _map_input(f_in, length) as src, mmap.mmap(f_out.fileno(), size) as dst:
+                    self.encrypt_into(src, dst, add_padding, iv)
+        return size
+
+    # Decrypts the file at src_path into dst_path the same way; output is truncated by the padding length.
+    # Invalid padding raises ValueError and the output file is removed
+    def decrypt_file(self, src_path: str, dst_path: str, remove_padding=True, iv: bytes | bytearray=None) -> int:
+        _check_distinct_files(src_path, dst_path)
+        with open(src_path, 'rb') as f_in, open(dst_path, 'w+b') as f_out, _remove_on_error(dst_path, f_out):
+            length = os.fstat(f_in.fileno()).st_size
+            size = self.decrypted_size(length)
+            f_out.truncate(size)
+            if size:
+                with _map_input(f_in, length) as src, mmap.mmap(f_out.fileno(), size) as dst:
+                    self.decrypt_into(src, dst, remove_padding=False, iv=iv)
+                # Checked once the maps are closed: an exception raised while they are open keeps views of them
+                # alive in its traceback, so they couldn't be closed
+                if remove_padding and self.mode in PADDED_MODES:
+                    f_out.seek(size - 16)
+                    size -= pkcs7_padding_length(f_out.read(16))
+                f_out.truncate(size)
+        return size
 
     def change_key(self, new_key: bytearray | str):
         self.key = bytearray(new_key, 'utf-8') if isinstance(new_key, str) else new_key
-        self.round_keys = KeySchedule(self.key, self._SBOX_FORWARD)
+        self.round_keys = self._get_schedule()
+        self._engine = self._create_engine()
+        # Workers hold the old key schedule
+        self.close()
+
+    # Shuts down worker processes, if any were started
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _get_schedule(self) -> KeySchedule:
+        if self.key_cache is not None:
+            return self.key_cache.get(self.key, self._SBOX_FORWARD)
+        return KeySchedule(self.key, self._SBOX_FORWARD)
+
+    # A cached schedule may have been evicted (and zeroized) since this instance fetched it
+    def _check_schedule(self) -> None:
+        if self.round_keys.zeroized:
+            self.round_keys = self._get_schedule()
+            self._engine = self._create_engine()
+            self.close()
+
+    def _create_engine(self):
+        engine = ENGINES[self.engine](self.round_keys, self._SBOX_FORWARD, self._SBOX_INVERSE)
+        if self.trace is not None:
+            engine.trace = self.trace
+        return engine
+
+    # Runs the mode over data, splitting it across worker processes when that is possible and worthwhile
+    def _encrypt_data(self, data, iv, block_idx: int=0) -> bytearray:
+        self._check_schedule()
+        if self._use_pool(data, decrypt=False):
+            return self._get_pool().encrypt(self.mode, data, iv, block_idx)
+        return mode_encrypt(self._engine, self.mode, data, iv, block_idx)
+
+    def _decrypt_data(self, data, iv, block_idx: int=0) -> bytearray:
+        self._check_schedule()
+        if self._use_pool(data, decrypt=True):
+            return self._get_pool().decrypt(self.mode, data, iv, block_idx)
+        return mode_decrypt(self._engine, self.mode, data, iv, block_idx)
+
+    def _use_pool(self, data, decrypt: bool) -> bool:
+        # Tracing callbacks can't run in other processes
+        return (self.workers > 1 and self.trace is None and len(data) >= 2 * MIN_SEGMENT_SIZE
+                and is_parallel(self.mode, decrypt))
+
+    def _get_pool(self) -> BlockPool:
+        if self._pool is None:
+            self._pool = BlockPool(self.workers, ENGINES[self.engine], self.round_keys,
+                                   self._SBOX_FORWARD, self._SBOX_INVERSE)
+        return self._pool
+
+    # Chunk boundaries for the *_into methods; large enough for the process pool to split when enabled
+    def _chunks(self, length: int):
+        chunk = STREAM_CHUNK_SIZE
+        if self.workers > 1:
+            chunk = self.workers * SEGMENTS_PER_WORKER * MIN_SEGMENT_SIZE
+        return ((idx, min(idx + chunk, length)) for idx in range(0, length, chunk))
+
+    def _get_iv(self, iv):
+        if iv is None:
+            if self.iv is None and self.mode in IV_MODES:
+                raise ValueError(f'{type(self).__name__}: {self.mode.upper()} mode needs an IV')
+            return self.iv
+        check_iv(self.mode, iv)
+        return iv
+
+    # IV for one encryption: without a fixed IV (given here or to the constructor) every call gets a fresh one,
+    # so no two messages share a CBC IV or CTR keystream. The generated IV is returned directly rather than read
+    # back from self.iv, which another thread encrypting on this instance may have replaced meanwhile
+    def _get_encrypt_iv(self, iv):
+        if iv is None and self.mode in IV_MODES and not self._fixed_iv:
+            iv = os.urandom(16)
+            self.iv = iv
+            return iv
+        return self._get_iv(iv)
+
+    # Chaining values after processing `length` bytes; ciphertext is the last processed ciphertext chunk
+    def _next_chain(self, iv, ciphertext, block_idx: int, length: int) -> tuple:
+        if self.mode == 'cbc':
+            return bytes(ciphertext[-16:]), block_idx
+        return iv, block_idx + length // 16
+
+# Feeds reader through an encryptor or decryptor into writer; returns the number of bytes written
+def _run_stream(context: '_CipherContext', reader, writer, chunk_size: int, progress, cancel) -> int:
+    written = 0
+    for chunk in _read_chunks(reader, chunk_size, progress, cancel):
+        out = context.update(chunk)
+        if out:
+            writer.write(out)
+            written += len(out)
+    out = context.finalize()
+    if out:
+        writer.write(out)
+        written += len(out)
+    return written
+
+# Incremental encryption or decryption of one message. update() processes every whole block it can and holds
+# back only the trailing partial block (under 16 bytes), so its cost is proportional to the chunk passed in
+# and memory stays bounded however long the message is. The CBC chaining value and CTR block offset are
+# carried between calls; PKCS#7 padding is handled by finalize()
+class _CipherContext:
+    # Whether update() holds back the last whole block when padding is removed (input so far ends on a block
+    # boundary, so that block may be the final one)
+    _HOLD_LAST = False
+
+    def __init__(self, cipher: Rijndael, iv, padding: bool):
+        self._cipher = cipher
+        self.iv = None if iv is None else bytes(iv) # IV or nonce of this message
+        self._iv = iv # Chaining value: IV or last ciphertext block (CBC), initial counter (CTR)
+        self._block_idx = 0 # CTR block offset of the next block
+        self._padding = padding and cipher.mode in PADDED_MODES
+        self._pending = bytearray() # Input not yet processed
+        self._finalized = False
+
+    def update(self, data) -> bytearray:
+        self._check_open()
+        with _byte_view(data) as src:
+            pending = self._pending
+            total = len(pending) + len(src)
+            whole = total - total % 16
+            if whole == total and self._HOLD_LAST and self._padding:
+                whole -= 16
+            if whole <= 0:
+                pending += src
+                return bytearray()
+            if pending:
+                # At most one block of held back input is joined to the start of the new data
+                blocks = pending + src[:whole - len(pending)]
+            else:
+                blocks = src[:whole]
+            out = self._process(blocks)
+            self._pending = bytearray(src[whole - len(pending):])
+        return out
+
+    def _check_open(self) -> None:
+        if self._finalized:
+            raise ValueError(f'{type(self).__name__}: Already finalized')
+
+    # Carries the chaining state past `length` bytes; ciphertext is the last ciphertext processed
+    def _advance(self, ciphertext, length: int) -> None:
+        self._iv, self._block_idx = self._cipher._next_chain(self._iv, ciphertext, self._block_idx, length)
+
+class RijndaelEncryptor(_CipherContext):
+    def _process(self, blocks) -> bytearray:
+        out = self._cipher._encrypt_data(blocks, self._iv, self._block_idx)
+        self._advance(out, len(blocks))
+        return out
+
+    # Encrypts the remaining partial block, padded in ECB and CBC (or filled with null bytes without padding)
+    def finalize(self) -> bytearray:
+        self._check_open()
+        self._finalized = True
+        tail = self._pending
+        if self._cipher.mode in PADDED_MODES:
+            tail = _fill_block(pad_pkcs7(tail) if self._padding else tail)
+        return self._process(tail) if tail else bytearray()
+
+class RijndaelDecryptor(_CipherContext):
+    # The last block holds the padding, so it is kept until finalize()
+    _HOLD_LAST = True
+
+    def _process(self, blocks) -> bytearray:
+        out = self._cipher._decrypt_data(blocks, self._iv, self._block_idx)
+        self._advance(blocks, len(blocks))
+        return out
+
+    # Decrypts the held back block and removes its padding, raising ValueError if the padding is invalid.
+    # A truncated final block is filled with null bytes like decrypt() does
+    def finalize(self) -> bytearray:
+        self._check_open()
+        self._finalized = True
+        tail = self._pending
+        if not tail:
+            return bytearray()
+        if self._cipher.mode in PADDED_MODES:
+            tail = _fill_block(tail)
+        out = self._process(tail)
+        return unpad_pkcs7(out) if self._padding else out
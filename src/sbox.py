@@ -1,6 +1,7 @@
 # Code for generating the Rijndael substitution box
 
-from src.galois_math import find_galois_inverse
+from src.galois_math import g_inverse
+from src.constants import SBOX, INV_SBOX
 
 def l_rot8(a, bits) -> int:  # Circular shift left for bytes
     return ((a << bits) | (a >> (8 - bits))) & 0xFF
@@ -18,7 +19,7 @@ def compute_forward_sbox() -> list:
     table[0] = 0x63 # Special case for 0 because it has no inverse
     for i in range(1, 256):
         if i not in checked:
-            inverse = find_galois_inverse(i) # Because inverse(inverse) = i, we have found the inverse of two elements
+            inverse = g_inverse(i) # Because inverse(inverse) = i, we have found the inverse of two elements
             table[i], table[inverse] = affine_transform(inverse), affine_transform(i)
             checked.add(i)
             checked.add(inverse)
@@ -30,5 +31,13 @@ def compute_inverse_sbox() -> list:
     for i in range(0, 256):
         if i != 0x63:
             inv_affine = inverse_affine_transform(i)
-            table[i] = find_galois_inverse(inv_affine)
-    return table
\ No newline at end of file
+            table[i] = g_inverse(inv_affine)
+    return table
+
+# The standard S-Boxes as immutable tuples. They come precomputed from constants.py (generated from the
+# functions above), so no GF(2^8) arithmetic runs at startup
+def forward_sbox() -> tuple:
+    return SBOX
+
+def inverse_sbox() -> tuple:
+    return INV_SBOX
@@ -0,0 +1,342 @@
+# Local encryption service over TCP or a Unix socket, built on asyncio.
+#     python -m src.server --tcp 127.0.0.1:7010 --key main=000102030405060708090a0b0c0d0e0f
+# Keys are registered at startup by ID and expanded once; clients only ever send key IDs. Block processing runs
+# in an executor (worker processes by default) so the event loop only parses frames and moves bytes.
+#
+# Framing (all integers big-endian). A connection can pipeline requests; responses carry the request ID and may
+# arrive out of order.
+#     Request:  REQUEST header, then key ID (UTF-8), IV, payload
+#     Response: RESPONSE header, then the output, or a UTF-8 error message when status is STATUS_ERROR
+import argparse
+import asyncio
+import itertools
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from src.rijndael import Rijndael, ENGINES
+from src.key_schedule import KeyScheduleCache
+from src.modes import MODES, IV_MODES
+from src.parallel import default_workers
+
+# payload length, request ID, op, mode index (into MODES), flags, key ID length, IV length
+REQUEST = struct.Struct('>IIBBBBB')
+# payload length, request ID, status
+RESPONSE = struct.Struct('>IIB')
+OP_ENCRYPT = 1
+OP_DECRYPT = 2
+FLAG_PADDING = 0x01 # Add/remove PKCS#7 padding (ECB and CBC)
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+MAX_PAYLOAD = 16 * 1024 * 1024
+DEFAULT_MAX_IN_FLIGHT = 64
+
+# Ciphers for the current executor worker, keyed by (key ID, mode); set by _init_worker
+_worker_ciphers = None
+
+# One cipher per (key ID, mode), all sharing one expansion of each key through key_cache
+def _build_ciphers(keys: dict, engine: str, key_cache: KeyScheduleCache) -> dict:
+    # The IV is always given per request
+    return {(key_id, mode): Rijndael(key, engine=engine, mode=mode, key_cache=key_cache)
+            for key_id, key in keys.items() for mode in MODES}
+
+# Worker processes get the raw keys and expand them themselves: a cipher holding a KeyScheduleCache (and its
+# lock) can't be pickled, which the spawn and forkserver start methods need. The thread executor passes the
+# ciphers already built in the server process instead
+def _init_worker(keys: dict, engine: str, ciphers: dict=None) -> None:
+    global _worker_ciphers
+    if ciphers is None:
+        ciphers = _build_ciphers(keys, engine, KeyScheduleCache(maxsize=len(keys)))
+    _worker_ciphers = ciphers
+
+# Runs in the executor
+def _process(key_id: str, op: int, mode: str, padding: bool, iv: bytes | None, payload: bytes) -> bytes:
+    cipher = _worker_ciphers[(key_id, mode)]
+    if op == OP_ENCRYPT:
+        return bytes(cipher.encrypt(payload, padding, iv))
+    return bytes(cipher.decrypt(payload, padding, iv))
+
+class ServerError(Exception):
+    pass
+
+class EncryptionServer:
+    # keys: {key ID: 16, 24 or 32 byte key}. workers: executor processes; 0 runs block processing on one
+    # background thread in this process, which avoids copying payloads between processes for small requests.
+    # max_in_flight: requests being processed at once across all connections; further frames are not read until
+    # a slot frees up, so clients see TCP backpressure instead of the server buffering without bound
+    def __init__(self, keys: dict, engine: str='ttable', workers: int | None=None,
+                 max_in_flight: int=DEFAULT_MAX_IN_FLIGHT, max_payload: int=MAX_PAYLOAD):
+        if not keys:
+            raise ValueError(f'{type(self).__name__}: At least one key is required')
+        if max_in_flight < 1:
+            raise ValueError(f'{type(self).__name__}: max_in_flight must be at least 1 ({max_in_flight})')
+        self.workers = default_workers() if workers is None else workers
+        self.max_in_flight = max_in_flight
+        self.max_payload = max_payload
+        # Every key is expanded once here, which also rejects bad keys before any worker starts; the cache is
+        # sized so none are ever evicted
+        self.key_cache = KeyScheduleCache(maxsize=len(keys))
+        ciphers = _build_ciphers(keys, engine, self.key_cache)
+        self.key_ids = frozenset(keys)
+        if self.workers > 0:
+            keys = {key_id: bytes(key, 'utf-8') if isinstance(key, str) else bytes(key) for key_id, key in keys.items()}
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                 initargs=(keys, engine))
+            # Start the workers now: forked later, they would inherit client sockets and keep closed
+            # connections open
+            self._executor.submit(int).result()
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=1, initializer=_init_worker,
+                                                initargs=(keys, engine, ciphers))
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._servers = []
+        self._connections: dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self.requests = 0
+        self.errors = 0
+
+    async def start_tcp(self, host: str='127.0.0.1', port: int=0) -> tuple:
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        self._servers.append(server)
+        return server.sockets[0].getsockname()
+
+    async def start_unix(self, path: str) -> str:
+        server = await asyncio.start_unix_server(self._handle_connection, path)
+        self._servers.append(server)
+        return path
+
+    async def serve_forever(self) -> None:
+        await asyncio.gather(*(server.serve_forever() for server in self._servers))
+
+    async def close(self) -> None:
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers.clear()
+        # Closing the sockets ends each connection's read loop; handlers finish once running requests are answered
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        self._executor.shutdown(cancel_futures=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        write_lock = asyncio.Lock()
+        tasks = set()
+        connection = asyncio.current_task()
+        self._connections[connection] = writer
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(REQUEST.size)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                length, request_id, op, mode_idx, flags, key_id_len, iv_len = REQUEST.unpack(header)
+                if length > self.max_payload:
+                    # The oversized payload is never read, so the stream can't be resynchronised; close it
+                    await self._respond(writer, write_lock, request_id, STATUS_ERROR,
+                                        f'Payload too large ({length} > {self.max_payload} bytes)'.encode())
+                    break
+                # Wait for a free slot before reading the payload, so a flooding client is held back by the
+                # socket buffers; idle connections don't hold a slot
+                await self._in_flight.acquire()
+                try:
+                    key_id = (await reader.readexactly(key_id_len)).decode('utf-8', 'replace')
+                    iv = await reader.readexactly(iv_len)
+                    payload = await reader.readexactly(length)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    self._in_flight.release()
+                    break
+                task = asyncio.create_task(self._run_request(writer, write_lock, request_id, op, mode_idx, flags,
+                                                             key_id, iv, payload))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            del self._connections[connection]
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _run_request(self, writer, write_lock, request_id: int, op: int, mode_idx: int, flags: int,
+                           key_id: str, iv: bytes, payload: bytes) -> None:
+        try:
+            self.requests += 1
+            try:
+                mode, iv = self._check_request(op, mode_idx, key_id, iv)
+                loop = asyncio.get_running_loop()
+                out = await loop.run_in_executor(self._executor, _process, key_id, op, mode,
+                                                 bool(flags & FLAG_PADDING), iv, payload)
+                status = STATUS_OK
+            except Exception as e: # Reported to the client; a failed request must not leave it waiting
+                self.errors += 1
+                out, status = str(e).encode(), STATUS_ERROR
+        finally:
+            self._in_flight.release()
+        await self._respond(writer, write_lock, request_id, status, out)
+
+    def _check_request(self, op: int, mode_idx: int, key_id: str, iv: bytes) -> tuple:
+        if op not in (OP_ENCRYPT, OP_DECRYPT):
+            raise ValueError(f'Unknown operation ({op})')
+        if mode_idx >= len(MODES):
+            raise ValueError(f'Unknown mode ({mode_idx})')
+        if key_id not in self.key_ids:
+            raise ValueError(f'Unknown key ID ({key_id})')
+        mode = MODES[mode_idx]
+        if mode in IV_MODES:
+            if not iv:
+                raise ValueError(f'{mode.upper()} requires an IV')
+            return mode, iv
+        return mode, None
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, write_lock: asyncio.Lock, request_id: int, status: int,
+                       payload: bytes) -> None:
+        async with write_lock:
+            if writer.is_closing():
+                return
+            writer.write(RESPONSE.pack(len(payload), request_id, status))
+            writer.write(payload)
+            try:
+                # Waits while the client isn't reading its responses
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+# Async client; one connection can carry many concurrent requests
+#     async with await AsyncClient.connect_tcp('127.0.0.1', 7010) as client:
+#         ciphertext = await client.encrypt('main', data, mode='cbc', iv=iv)
+class AsyncClient:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        self._ids = itertools.count(1)
+        self._waiting: dict[int, asyncio.Future] = {}
+        self._write_lock = asyncio.Lock()
+        self._receiver = asyncio.create_task(self._receive())
+
+    @classmethod
+    async def connect_tcp(cls, host: str, port: int):
+        return cls(*await asyncio.open_connection(host, port))
+
+    @classmethod
+    async def connect_unix(cls, path: str):
+        return cls(*await asyncio.open_unix_connection(path))
+
+    async def encrypt(self, key_id: str, data: bytes, mode: str='ecb', iv: bytes=None, padding: bool=True) -> bytes:
+        return await self.request(OP_ENCRYPT, key_id, data, mode, iv, padding)
+
+    async def decrypt(self, key_id: str, data: bytes, mode: str='ecb', iv: bytes=None, padding: bool=True) -> bytes:
+        return await self.request(OP_DECRYPT, key_id, data, mode, iv, padding)
+
+    async def request(self, op: int, key_id: str, data: bytes, mode: str='ecb', iv: bytes=None,
+                      padding: bool=True) -> bytes:
+        if mode not in MODES:
+            raise ValueError(f'{type(self).__name__}: Unknown mode ({mode})')
+        if self._receiver.done():
+            raise ConnectionError('Connection to server closed')
+        key_id_bytes = key_id.encode('utf-8')
+        iv = b'' if iv is None else bytes(iv)
+        request_id = next(self._ids) & 0xFFFFFFFF
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[request_id] = future
+        try:
+            async with self._write_lock:
+                self._writer.write(REQUEST.pack(len(data), request_id, op, MODES.index(mode),
+                                                FLAG_PADDING if padding else 0, len(key_id_bytes), len(iv)))
+                self._writer.write(key_id_bytes + iv)
+                self._writer.write(data)
+                await self._writer.drain()
+            return await future
+        finally:
+            self._waiting.pop(request_id, None)
+
+    async def close(self) -> None:
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+        self._receiver.cancel()
+        try:
+            await self._receiver
+        except asyncio.CancelledError:
+            pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # Matches responses to waiting requests by request ID
+    async def _receive(self) -> None:
+        error = ConnectionError('Connection to server closed')
+        try:
+            while True:
+                length, request_id, status = RESPONSE.unpack(await self._reader.readexactly(RESPONSE.size))
+                payload = await self._reader.readexactly(length)
+                future = self._waiting.get(request_id)
+                if future is None or future.done():
+                    continue
+                if status == STATUS_OK:
+                    future.set_result(payload)
+                else:
+                    future.set_exception(ServerError(payload.decode('utf-8', 'replace')))
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            error = ConnectionError(f'Connection to server closed ({e})')
+        finally:
+            for future in self._waiting.values():
+                if not future.done():
+                    future.set_exception(error)
+
+# Parses ID=HEX key arguments
+def parse_keys(items: list[str]) -> dict:
+    keys = {}
+    for item in items:
+        key_id, sep, hex_key = item.partition('=')
+        if not sep or not key_id:
+            raise ValueError(f'Key must be given as ID=HEX ({item})')
+        keys[key_id] = bytes.fromhex(hex_key)
+    return keys
+
+async def _serve(args) -> None:
+    server = EncryptionServer(parse_keys(args.key), args.engine, args.workers, args.max_in_flight)
+    async with server:
+        if args.unix:
+            print(f'Listening on {await server.start_unix(args.unix)}', file=sys.stderr)
+        if args.tcp or not args.unix:
+            host, _, port = (args.tcp or '127.0.0.1:7010').rpartition(':')
+            print(f'Listening on {await server.start_tcp(host, int(port))}', file=sys.stderr)
+        await server.serve_forever()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m src.server', description='Local Rijndael encryption service')
+    parser.add_argument('--tcp', metavar='HOST:PORT', help='TCP address (default 127.0.0.1:7010 if --unix is not given)')
+    parser.add_argument('--unix', metavar='PATH', help='Unix socket path')
+    parser.add_argument('--key', action='append', required=True, metavar='ID=HEX',
+                        help='register a key; may be repeated')
+    parser.add_argument('-e', '--engine', choices=list(ENGINES), default='ttable', help='engine (default: ttable)')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='executor processes (default: all cores; 0 uses a thread in the server process)')
+    parser.add_argument('--max-in-flight', type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                        help=f'requests processed at once (default {DEFAULT_MAX_IN_FLIGHT})')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_serve(args))
+    except ValueError as e:
+        print(f'error: {e}', file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,33 +1,37 @@
 from src.byte_matrix import ByteMatrix16
-from src.galois_math import g_mul
+from src.galois_math import mul_table
 
 # Matrix constants for MixColumns
 MIX_FORWARD = [[2, 3, 1, 1], [1, 2, 3, 1], [1, 1, 2, 3], [3, 1, 1, 2]]
 MIX_INVERSE = [[14, 11, 13, 9], [9, 14, 11, 13], [13, 9, 14, 11], [11, 13, 9, 14]]
+# Same matrices with each coefficient replaced by its 256 entry multiplication table
+_MIX_FORWARD_TABLES = [[mul_table(n) for n in row] for row in MIX_FORWARD]
+_MIX_INVERSE_TABLES = [[mul_table(n) for n in row] for row in MIX_INVERSE]
+# Byte index permutations for ShiftRows on a column-major state: new[4c + r] = old[4((c + r) % 4) + r]
+SHIFT_ROWS = [4 * ((c + r) % 4) + r for c in range(4) for r in range(4)]
+SHIFT_ROWS_INV = [4 * ((c - r) % 4) + r for c in range(4) for r in range(4)]
 
 # Applies permutation to column. Matrix constants from https://en.wikipedia.org/wiki/Rijndael_MixColumns#Matrix_representation
 def _mix_column(col: bytearray, inv=False) -> bytearray:
     # Get matrix constant
-    mix = MIX_INVERSE if inv else MIX_FORWARD
+    mix = _MIX_INVERSE_TABLES if inv else _MIX_FORWARD_TABLES
     new = bytearray(4)
-    # Multiply column bytes as coordinate vector with matrix, using Galois field
+    # Multiply column bytes as coordinate vector with matrix, using Galois field multiplication tables
     for mix_row in range(4):
-        res = 0
-        for mix_col in range(4):
-            res ^= g_mul(col[mix_col], mix[mix_row][mix_col])
-        new[mix_row] = res
+        t0, t1, t2, t3 = mix[mix_row]
+        new[mix_row] = t0[col[0]] ^ t1[col[1]] ^ t2[col[2]] ^ t3[col[3]]
     return new
 
-# Byte matrix with methods for the AES state structure
+# Byte matrix with methods for the AES state structure. All steps modify self.data in place
 class State(ByteMatrix16):
-    def __init__(self, text_bytes:bytearray=bytearray(16)):
+    __slots__ = ()
+
+    def __init__(self, text_bytes:bytearray=None):
         super().__init__(text_bytes)
 
-    def __xor__(self, other):
-        res = bytearray(0)
-        for i, n in enumerate(self.data):
-            res.append(n ^ other.data[i])
-        return State(res)
+    # AddRoundKey step, in place
+    def ixor_round_key(self, round_key: ByteMatrix16) -> None:
+        self.ixor(round_key)
 
     def sub_bytes(self, sbox: list):
         for i in range(16):
@@ -35,24 +39,34 @@ class State(ByteMatrix16):
 
     # MixColumns step; applies permutation to all columns in the state
     def mix_columns(self):
-        for idx, col in enumerate(self.columns()):
-            self.set_column(idx, _mix_column(col))
+        self._mix_columns(_MIX_FORWARD_TABLES)
 
     # Inverse of MixColumns
     def mix_columns_inv(self):
-        for idx, col in enumerate(self.columns()):
-            self.set_column(idx, _mix_column(col, inv=True))
+        self._mix_columns(_MIX_INVERSE_TABLES)
+
+    # Multiplies each column by the mix matrix in place; all four products are read before writing back
+    def _mix_columns(self, mix: list):
+        data = self.data
+        (m00, m01, m02, m03), (m10, m11, m12, m13), (m20, m21, m22, m23), (m30, m31, m32, m33) = mix
+        for i in range(0, 16, 4):
+            a0, a1, a2, a3 = data[i], data[i + 1], data[i + 2], data[i + 3]
+            data[i] = m00[a0] ^ m01[a1] ^ m02[a2] ^ m03[a3]
+            data[i + 1] = m10[a0] ^ m11[a1] ^ m12[a2] ^ m13[a3]
+            data[i + 2] = m20[a0] ^ m21[a1] ^ m22[a2] ^ m23[a3]
+            data[i + 3] = m30[a0] ^ m31[a1] ^ m32[a2] ^ m33[a3]
 
-    # ShiftRows step; cyclically shifts rows to the left by increasing offset
+    # ShiftRows step; cyclically shifts rows to the left by increasing offset.
+    # Row r is bytes r, r + 4, r + 8, r + 12 (column-major), permuted in place
     def shift_rows(self):
-        for idx, row in enumerate(self.rows(start=1)):
-            offset = idx + 1
-            new: bytearray = row[offset:] + row[:offset]
-            self.set_row(offset, new)
+        d = self.data
+        d[1], d[5], d[9], d[13] = d[5], d[9], d[13], d[1]
+        d[2], d[6], d[10], d[14] = d[10], d[14], d[2], d[6]
+        d[3], d[7], d[11], d[15] = d[15], d[3], d[7], d[11]
 
     # ShiftRows inverse
     def shift_rows_inv(self):
-        for idx, row in enumerate(self.rows(start=1)):
-            offset = 3 - idx
-            new: bytearray = row[offset:] + row[:offset]
-            self.set_row(idx + 1, new)
+        d = self.data
+        d[1], d[5], d[9], d[13] = d[13], d[1], d[5], d[9]
+        d[2], d[6], d[10], d[14] = d[10], d[14], d[2], d[6]
+        d[3], d[7], d[11], d[15] = d[7], d[11], d[15], d[3]
@@ -1,16 +1,26 @@
-from tkinter import Tk, W, StringVar
+from tkinter import Tk, W, EW, StringVar
 from tkinter import ttk
 from tkinter import filedialog
+import contextlib
 import os
+import queue
+import threading
+import time
 from src.key_schedule import _KEY_ROUND_SIZES
-from src.rijndael import Rijndael
-from src.sbox import compute_forward_sbox, compute_inverse_sbox
+from src.rijndael import Rijndael, StreamCancelled
+from src.sbox import forward_sbox, inverse_sbox
 
 # Default output directory
 OUT_DIR = os.path.dirname(__file__)
 ENCRYPT_OUT = os.path.join(OUT_DIR, 'encrypt_out')
 DECRYPT_OUT = os.path.join(OUT_DIR, 'decrypt_out')
-FILE_CHUNK_SIZE = 128 # Must be divisible by 16
+FILE_CHUNK_SIZE = 64 * 1024 # Must be divisible by 16; progress is reported once per chunk
+POLL_MS = 100 # How often the GUI checks for worker thread events
+
+# Removes a partial output; failing to do so must not stop the worker thread, which would stall the queue
+def _remove_output(path):
+    with contextlib.suppress(OSError):
+        os.remove(path)
 
 # Validates user inputted file extension
 def validate_extension(ext):
@@ -30,9 +40,9 @@ class ActionInput:
         ttk.Label(self.main_frame, text=label_txt).grid(row=0, column=0, sticky=W)
         self.input_frame = ttk.Frame(self.main_frame, padding=(0, 0, 0, 15))
 
-        self.user_file = ""
+        self.user_files = ()
         # Browse file button
-        self.file_browse = ttk.Button(self.input_frame, text="Browse File", command=self.select_file)
+        self.file_browse = ttk.Button(self.input_frame, text="Browse Files", command=self.select_file)
         self.file_lbl = ttk.Label(self.input_frame, text=self._get_file_label())
         self.file_browse.grid(row=0, column=0, sticky=W)
         self.file_lbl.grid(row=0, column=1, sticky=W)
@@ -56,13 +66,17 @@ class ActionInput:
     def grid(self, row=0, column=0):
         self.main_frame.grid(row=row, column=column, sticky=W)
 
-    # Prompts user for file name and saves selection
+    # Prompts user for one or more file names and saves selection
     def select_file(self):
-        self.user_file = filedialog.askopenfilename(filetypes=[('Text Files', '*.txt'), ('All Files', '*.*')])
+        self.user_files = filedialog.askopenfilenames(filetypes=[('Text Files', '*.txt'), ('All Files', '*.*')])
         self.file_lbl.config(text=self._get_file_label())
 
     def _get_file_label(self) -> str:
-        return "No file selected" if self.user_file == "" else os.path.basename(self.user_file)
+        if not self.user_files:
+            return "No file selected"
+        if len(self.user_files) == 1:
+            return os.path.basename(self.user_files[0])
+        return f'{len(self.user_files)} files selected'
 
 # Panel for user inputted encryption/decryption key
 class KeyInput:
@@ -127,8 +141,8 @@ class KeyInput:
 # Main GUI class. Starts window on init
 class RijndaelGui:
     def __init__(self, sbox=None, i_sbox=None):
-        self.sbox = compute_forward_sbox() if sbox is None else sbox
-        self.i_sbox = compute_inverse_sbox() if i_sbox is None else i_sbox
+        self.sbox = forward_sbox() if sbox is None else sbox
+        self.i_sbox = inverse_sbox() if i_sbox is None else i_sbox
         self.root = Tk()
         self.root.title("AES Implementation")
         self.main_frame = ttk.Frame(self.root, padding=(10, 10, 10, 10))
@@ -147,7 +161,7 @@ class RijndaelGui:
                                            func=lambda : self.start_AES(
                                                   'e',
                                                   self.plaintext_input,
-                                                  ENCRYPT_OUT + self.plaintext_input.extension_options.get()
+                                                  ENCRYPT_OUT
                                               ),
                                            label_txt="Plaintext file (*.txt, etc)",
                                            button_txt='Encrypt'
@@ -160,7 +174,7 @@ class RijndaelGui:
                                             lambda : self.start_AES(
                                                 'd',
                                                 self.ciphertext_input,
-                                                DECRYPT_OUT + self.ciphertext_input.extension_options.get()
+                                                DECRYPT_OUT
                                             ),
                                             label_txt="Ciphertext file (*.txt, etc)",
                                             button_txt="Decrypt"
@@ -171,10 +185,20 @@ class RijndaelGui:
         self.notebook.add(self.plaintext_input.main_frame, text="Encryption")
         self.notebook.add(self.ciphertext_input.main_frame, text="Decryption")
         self.notebook.grid(row=2, column=0, sticky=W)
+
+        # Jobs run on a worker thread so the window stays responsive; it reports back through self.events,
+        # which the main thread polls (Tk widgets must only be used from the main thread)
+        self.jobs = queue.Queue() # Jobs waiting for the worker thread
+        self.events = queue.Queue() # (kind, job, value) from the worker thread
+        self.pending: list[CipherJob] = [] # Queued or running jobs, in order
+        self.worker = None
+        self.progress = ProgressPanel(self.main_frame, self.cancel_jobs)
+        self.progress.grid(row=3, column=0)
+        self.root.after(POLL_MS, self._poll_events)
         self.root.mainloop()
 
-    # Runs AES algorithm with given user inputs
-    def start_AES(self, mode: str, text_input, out_file):
+    # Validates user inputs and queues a job for each selected file
+    def start_AES(self, mode: str, text_input, out_base: str):
         status_message = text_input.message
         extension = text_input.extension_options.get()
         # Revalidate all user entries
@@ -184,23 +208,135 @@ class RijndaelGui:
         if not self.key_input.ready:
             status_message.config(text='Invalid key', foreground='red')
             return
-        if not os.path.exists(text_input.user_file):
+        if not text_input.user_files or not all(os.path.exists(f) for f in text_input.user_files):
             status_message.config(text='Invalid file selected', foreground='red')
             return
-        status_message.config(text="Working...", foreground='blue')
-        status_message.update()
-        # Start process
+        files = text_input.user_files
+        for idx, src in enumerate(files, 1):
+            # Several files get numbered outputs so they don't overwrite each other
+            dst = out_base + (f'_{idx}' if len(files) > 1 else '') + extension
+            job = CipherJob(mode, bytearray(self.key_input.key), src, dst, status_message)
+            self.pending.append(job)
+            self.jobs.put(job)
+        status_message.config(text=f'Queued {len(files)} file{"s" if len(files) > 1 else ""}', foreground='blue')
+        self.progress.show_queue(len(self.pending))
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._run_jobs, daemon=True)
+            self.worker.start()
+
+    # Stops the running job and drops everything queued
+    def cancel_jobs(self):
+        for job in self.pending:
+            job.cancel.set()
+
+    # Worker thread: runs queued jobs one at a time and reports back through self.events; never touches widgets
+    def _run_jobs(self):
+        while True:
+            job = self.jobs.get()
+            if job.cancel.is_set():
+                self.events.put(('cancelled', job, None))
+                continue
+            opened = False # Whether job.dst was created, so a failed job can remove its partial output
+            try:
+                size = os.path.getsize(job.src)
+                self.events.put(('start', job, size))
+                r = Rijndael(job.key, sbox_f=self.sbox, sbox_i=self.i_sbox, engine='ttable')
+                action = r.encrypt_stream if job.mode == 'e' else r.decrypt_stream
+                with open(job.src, 'rb') as f_in, open(job.dst, 'wb') as f_out:
+                    opened = True
+                    action(f_in, f_out, chunk_size=FILE_CHUNK_SIZE,
+                           progress=lambda done: self.events.put(('progress', job, done)), cancel=job.cancel)
+                self.events.put(('done', job, None))
+            except StreamCancelled:
+                _remove_output(job.dst)
+                self.events.put(('cancelled', job, None))
+            except FileNotFoundError as e:
+                self.events.put(('error', job, f"Couldn't open file ({e})"))
+            except Exception as e:
+                if opened:
+                    _remove_output(job.dst)
+                self.events.put(('error', job, f'Something went wrong ({e})'))
+
+    # Main thread: applies worker events to the widgets, then reschedules itself
+    def _poll_events(self):
         try:
-            r = Rijndael(self.key_input.key, sbox_f=self.sbox, sbox_i=self.i_sbox)
-            action = r.encrypt if mode == 'e' else r.decrypt
-            with open(text_input.user_file, 'rb') as f_in, open(out_file, 'wb') as f_out:
-                file_bytes = bytearray(f_in.read())
-                action_bytes = action(file_bytes)
-                f_out.write(action_bytes)
-            status_message.config(text=f'{"Cipher" if mode == 'e' else "Plain"}text outputted to {out_file}',
-                                      foreground='black'
-                                      )
-        except FileNotFoundError as e:
-            status_message.config(text=f"Couldn't open file ({e})", foreground='red')
-        except Exception as e:
-            status_message.config(text=f'Something went wrong ({e})', foreground='red')
+            while True:
+                kind, job, value = self.events.get_nowait()
+                if kind == 'start':
+                    self.progress.start(job, value, len(self.pending))
+                elif kind == 'progress':
+                    self.progress.update(value)
+                else:
+                    self.pending.remove(job)
+                    self.progress.finish(len(self.pending))
+                    if kind == 'done':
+                        job.message.config(text=f'{"Cipher" if job.mode == "e" else "Plain"}text outputted to {job.dst}',
+                                           foreground='black')
+                    elif kind == 'cancelled':
+                        job.message.config(text='Cancelled', foreground='red')
+                    else:
+                        job.message.config(text=value, foreground='red')
+        except queue.Empty:
+            pass
+        self.root.after(POLL_MS, self._poll_events)
+
+# One file to encrypt ('e') or decrypt ('d'); message is the status label of the panel that queued it
+class CipherJob:
+    def __init__(self, mode: str, key: bytearray, src: str, dst: str, message):
+        self.mode = mode
+        self.key = key
+        self.src = src
+        self.dst = dst
+        self.message = message
+        self.cancel = threading.Event()
+
+# Progress bar, transfer statistics and Cancel button for the job being run
+class ProgressPanel:
+    def __init__(self, master, cancel_func):
+        self.main_frame = ttk.Frame(master, padding=(10, 0, 10, 10))
+        self.file_lbl = ttk.Label(self.main_frame, text='Idle')
+        self.bar = ttk.Progressbar(self.main_frame, orient='horizontal', mode='determinate', length=300)
+        self.stats_lbl = ttk.Label(self.main_frame, text='')
+        self.cancel_button = ttk.Button(self.main_frame, text='Cancel', command=cancel_func, state='disabled')
+
+        self.file_lbl.grid(row=0, column=0, columnspan=2, sticky=W)
+        self.bar.grid(row=1, column=0, sticky=EW)
+        self.cancel_button.grid(row=1, column=1, padx=(10, 0))
+        self.stats_lbl.grid(row=2, column=0, columnspan=2, sticky=W)
+
+        self.size = 0
+        self.start_time = 0.0
+
+    def grid(self, row=0, column=0):
+        self.main_frame.grid(row=row, column=column, sticky=EW)
+
+    def show_queue(self, pending: int):
+        self.cancel_button.config(state='normal' if pending else 'disabled')
+        if pending and self.size == 0 and self.start_time == 0.0:
+            self.file_lbl.config(text=f'{pending} queued')
+
+    def start(self, job: CipherJob, size: int, pending: int):
+        self.size = size
+        self.start_time = time.perf_counter()
+        queued = f' ({pending - 1} more queued)' if pending > 1 else ''
+        self.file_lbl.config(text=f'{"Encrypting" if job.mode == "e" else "Decrypting"} '
+                                  f'{os.path.basename(job.src)}{queued}')
+        self.bar.config(maximum=max(size, 1), value=0)
+        self.cancel_button.config(state='normal')
+        self.update(0)
+
+    # Bytes done, MB/s and estimated time remaining for the current file
+    def update(self, done: int):
+        self.bar.config(value=done)
+        elapsed = time.perf_counter() - self.start_time
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = f'{(self.size - done) / rate:.1f} s' if rate > 0 else '--'
+        self.stats_lbl.config(text=f'{done / 1e6:.2f} / {self.size / 1e6:.2f} MB, {rate / 1e6:.2f} MB/s, ETA {eta}')
+
+    def finish(self, pending: int):
+        self.size = 0
+        self.start_time = 0.0
+        self.bar.config(value=0)
+        self.stats_lbl.config(text='')
+        self.file_lbl.config(text=f'{pending} queued' if pending else 'Idle')
+        self.cancel_button.config(state='normal' if pending else 'disabled')
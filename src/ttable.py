@@ -0,0 +1,113 @@
+# T-table round engine: each round is 16 lookups into precomputed 32-bit word tables plus XORs
+# Tables combine SubBytes + MixColumns, see https://en.wikipedia.org/wiki/Advanced_Encryption_Standard#Optimization_of_the_cipher
+
+import functools
+import struct
+from src.galois_math import mul_table
+from src.key_schedule import KeySchedule
+
+_BLOCK = struct.Struct('>4I') # One state as four big-endian column words
+
+# One byte right circular shift for int32s
+def _r_rot32(x: int) -> int:
+    return ((x >> 8) | (x << 24)) & 0xFFFFFFFF
+
+# Builds the four tables for a MixColumns matrix column (2, 1, 1, 3) or (14, 9, 13, 11) applied after the S-Box
+def _compute_tables(sbox: list, coefficients: tuple) -> tuple:
+    m0, m1, m2, m3 = (mul_table(c) for c in coefficients)
+    t0 = []
+    for n in range(256):
+        s = sbox[n]
+        t0.append((m0[s] << 24) | (m1[s] << 16) | (m2[s] << 8) | m3[s])
+    # Remaining tables are the first table rotated by one byte each
+    t1 = [_r_rot32(w) for w in t0]
+    t2 = [_r_rot32(w) for w in t1]
+    t3 = [_r_rot32(w) for w in t2]
+    return t0, t1, t2, t3
+
+def compute_forward_tables(sbox: list) -> tuple:
+    return _compute_tables(sbox, (2, 1, 1, 3))
+
+def compute_inverse_tables(i_sbox: list) -> tuple:
+    return _compute_tables(i_sbox, (14, 9, 13, 11))
+
+# Tables per S-Box (forward and inverse), shared by every engine instance; building them costs far more than a
+# key expansion. Bounded, so custom S-Boxes don't keep their tables for the life of the process
+_TABLE_CACHE_SIZE = 8
+
+@functools.lru_cache(maxsize=_TABLE_CACHE_SIZE)
+def _tables_for(compute, sbox: tuple) -> tuple:
+    return compute(sbox)
+
+def _cached_tables(sbox: list, compute) -> tuple:
+    return _tables_for(compute, tuple(sbox))
+
+class TTableEngine:
+    def __init__(self, round_keys: KeySchedule, sbox_f: list, sbox_i: list):
+        self._sbox_f = sbox_f
+        self._sbox_i = sbox_i
+        self._te = _cached_tables(sbox_f, compute_forward_tables)
+        self._td = _cached_tables(sbox_i, compute_inverse_tables)
+        # Round keys as column words; decryption uses the equivalent inverse cipher keys
+        self._enc_keys = round_keys.words
+        self._dec_keys = round_keys.dec_words
+
+    # Encrypts data made of whole 16 byte blocks
+    def encrypt_blocks(self, data: bytes | bytearray) -> bytearray:
+        te0, te1, te2, te3 = self._te
+        sbox = self._sbox_f
+        keys = self._enc_keys
+        k_first, k_last, k_mid = keys[0], keys[-1], keys[1:-1]
+        unpack, pack_into = _BLOCK.unpack_from, _BLOCK.pack_into
+        out = bytearray(len(data)) # Blocks are written in place into the preallocated output
+        for idx in range(0, len(data), 16):
+            s0, s1, s2, s3 = unpack(data, idx)
+            s0 ^= k_first[0]
+            s1 ^= k_first[1]
+            s2 ^= k_first[2]
+            s3 ^= k_first[3]
+            for k0, k1, k2, k3 in k_mid:
+                s0, s1, s2, s3 = (
+                    te0[s0 >> 24] ^ te1[(s1 >> 16) & 0xFF] ^ te2[(s2 >> 8) & 0xFF] ^ te3[s3 & 0xFF] ^ k0,
+                    te0[s1 >> 24] ^ te1[(s2 >> 16) & 0xFF] ^ te2[(s3 >> 8) & 0xFF] ^ te3[s0 & 0xFF] ^ k1,
+                    te0[s2 >> 24] ^ te1[(s3 >> 16) & 0xFF] ^ te2[(s0 >> 8) & 0xFF] ^ te3[s1 & 0xFF] ^ k2,
+                    te0[s3 >> 24] ^ te1[(s0 >> 16) & 0xFF] ^ te2[(s1 >> 8) & 0xFF] ^ te3[s2 & 0xFF] ^ k3,
+                )
+            # Final round (SubBytes + ShiftRows only)
+            pack_into(out, idx,
+                ((sbox[s0 >> 24] << 24) | (sbox[(s1 >> 16) & 0xFF] << 16) | (sbox[(s2 >> 8) & 0xFF] << 8) | sbox[s3 & 0xFF]) ^ k_last[0],
+                ((sbox[s1 >> 24] << 24) | (sbox[(s2 >> 16) & 0xFF] << 16) | (sbox[(s3 >> 8) & 0xFF] << 8) | sbox[s0 & 0xFF]) ^ k_last[1],
+                ((sbox[s2 >> 24] << 24) | (sbox[(s3 >> 16) & 0xFF] << 16) | (sbox[(s0 >> 8) & 0xFF] << 8) | sbox[s1 & 0xFF]) ^ k_last[2],
+                ((sbox[s3 >> 24] << 24) | (sbox[(s0 >> 16) & 0xFF] << 16) | (sbox[(s1 >> 8) & 0xFF] << 8) | sbox[s2 & 0xFF]) ^ k_last[3],
+            )
+        return out
+
+    # Decrypts data made of whole 16 byte blocks using the equivalent inverse cipher
+    def decrypt_blocks(self, data: bytes | bytearray) -> bytearray:
+        td0, td1, td2, td3 = self._td
+        sbox = self._sbox_i
+        keys = self._dec_keys
+        k_first, k_last, k_mid = keys[0], keys[-1], keys[1:-1]
+        unpack, pack_into = _BLOCK.unpack_from, _BLOCK.pack_into
+        out = bytearray(len(data)) # Blocks are written in place into the preallocated output
+        for idx in range(0, len(data), 16):
+            s0, s1, s2, s3 = unpack(data, idx)
+            s0 ^= k_first[0]
+            s1 ^= k_first[1]
+            s2 ^= k_first[2]
+            s3 ^= k_first[3]
+            for k0, k1, k2, k3 in k_mid:
+                s0, s1, s2, s3 = (
+                    td0[s0 >> 24] ^ td1[(s3 >> 16) & 0xFF] ^ td2[(s2 >> 8) & 0xFF] ^ td3[s1 & 0xFF] ^ k0,
+                    td0[s1 >> 24] ^ td1[(s0 >> 16) & 0xFF] ^ td2[(s3 >> 8) & 0xFF] ^ td3[s2 & 0xFF] ^ k1,
+                    td0[s2 >> 24] ^ td1[(s1 >> 16) & 0xFF] ^ td2[(s0 >> 8) & 0xFF] ^ td3[s3 & 0xFF] ^ k2,
+                    td0[s3 >> 24] ^ td1[(s2 >> 16) & 0xFF] ^ td2[(s1 >> 8) & 0xFF] ^ td3[s0 & 0xFF] ^ k3,
+                )
+            # Final round (InvSubBytes + InvShiftRows only)
+            pack_into(out, idx,
+                ((sbox[s0 >> 24] << 24) | (sbox[(s3 >> 16) & 0xFF] << 16) | (sbox[(s2 >> 8) & 0xFF] << 8) | sbox[s1 & 0xFF]) ^ k_last[0],
+                ((sbox[s1 >> 24] << 24) | (sbox[(s0 >> 16) & 0xFF] << 16) | (sbox[(s3 >> 8) & 0xFF] << 8) | sbox[s2 & 0xFF]) ^ k_last[1],
+                ((sbox[s2 >> 24] << 24) | (sbox[(s1 >> 16) & 0xFF] << 16) | (sbox[(s0 >> 8) & 0xFF] << 8) | sbox[s3 & 0xFF]) ^ k_last[2],
+                ((sbox[s3 >> 24] << 24) | (sbox[(s2 >> 16) & 0xFF] << 16) | (sbox[(s1 >> 8) & 0xFF] << 8) | sbox[s0 & 0xFF]) ^ k_last[3],
+            )
+        return out
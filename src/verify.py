@@ -0,0 +1,364 @@
+# Verification harness: known-answer tests (FIPS-197, AESAVS-style and GCM vectors in src/vectors), Monte Carlo
+# tests, and a differential fuzzer comparing every engine and mode against the State-based reference.
+# Run with: python -m src.verify --help
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+from src.rijndael import Rijndael, ENGINES
+from src.modes import MODES, IV_MODES
+from src.gcm import GCM, InvalidTag
+from src import constants, gen_constants
+from src.sbox import compute_forward_sbox, compute_inverse_sbox
+from src.galois_math import compute_rcon
+from src.numpy_engine import NUMPY_AVAILABLE
+from src.container import HEADER, ContainerHeader, read_chunk, read_range
+from src.jobs import ContainerJobRunner
+
+VECTOR_DIR = os.path.join(os.path.dirname(__file__), 'vectors')
+KAT_FILES = ('FIPS197.rsp', 'ECBGFSbox128.rsp',
+             'ECBVarTxt128.rsp', 'ECBVarTxt192.rsp', 'ECBVarTxt256.rsp',
+             'ECBVarKey128.rsp', 'ECBVarKey192.rsp', 'ECBVarKey256.rsp')
+MCT_FILES = ('ECBMCT128.rsp', 'ECBMCT192.rsp', 'ECBMCT256.rsp')
+GCM_FILES = ('GCM.rsp',)
+REFERENCE_ENGINE = 'state'
+
+# Parses a .rsp file into {section: [record, ...]}; COUNT (or Count) starts a new record, other values are hex
+def load_rsp(path: str) -> dict[str, list[dict]]:
+    sections: dict[str, list[dict]] = {}
+    records = None
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('['):
+                records = sections.setdefault(line.strip('[]'), [])
+                continue
+            name, value = (part.strip() for part in line.split('=', 1))
+            if name.upper() == 'COUNT':
+                records.append({'COUNT': int(value)})
+            else:
+                records[-1][name] = bytes.fromhex(value)
+    return sections
+
+# Checks the precomputed tables in constants.py against the functions that generate them
+def check_constants() -> list[str]:
+    failures = []
+    for name, expected in (('SBOX', compute_forward_sbox()), ('INV_SBOX', compute_inverse_sbox()),
+                           ('RCON', compute_rcon())):
+        if getattr(constants, name) != tuple(expected):
+            failures.append(f'{name} differs from its generator')
+    with open(gen_constants.CONSTANTS_PATH) as f:
+        if f.read() != gen_constants.render():
+            failures.append('constants.py is out of date; run python -m src.gen_constants')
+    return failures
+
+# Checks single-block encryption and decryption of every record; returns failure descriptions
+def check_kat(engine: str, path: str) -> list[str]:
+    failures = []
+    name = os.path.basename(path)
+    for section, records in load_rsp(path).items():
+        for rec in records:
+            r = Rijndael(rec['KEY'], engine=engine)
+            if section == 'ENCRYPT' and r.encrypt(rec['PLAINTEXT'], add_padding=False) != rec['CIPHERTEXT']:
+                failures.append(f'{name} encrypt COUNT={rec["COUNT"]}')
+            if r.decrypt(rec['CIPHERTEXT'], remove_padding=False) != rec['PLAINTEXT']:
+                failures.append(f'{name} {section.lower()} (decrypt) COUNT={rec["COUNT"]}')
+    return failures
+
+# AESAVS Monte Carlo test: 1000 chained block operations per record; the next key is the old key XORed with
+# the last 128, 192 or 256 bits of output. Only the first `iterations` records are run
+def check_mct(engine: str, path: str, iterations: int=100) -> list[str]:
+    failures = []
+    name = os.path.basename(path)
+    for section, records in load_rsp(path).items():
+        encrypt = section == 'ENCRYPT'
+        in_name, out_name = ('PLAINTEXT', 'CIPHERTEXT') if encrypt else ('CIPHERTEXT', 'PLAINTEXT')
+        key, block = records[0]['KEY'], records[0][in_name]
+        for rec in records[:iterations]:
+            if key != rec['KEY'] or block != rec[in_name]:
+                failures.append(f'{name} {section.lower()} COUNT={rec["COUNT"]} inputs diverged')
+                break
+            r = Rijndael(key, engine=engine)
+            action = r.encrypt if encrypt else r.decrypt
+            prev = block
+            for _ in range(1000):
+                prev, block = block, action(block, False)
+            if block != rec[out_name]:
+                failures.append(f'{name} {section.lower()} COUNT={rec["COUNT"]}')
+                break
+            tail = {16: block, 24: prev[8:] + block, 32: prev + block}[len(key)]
+            key = bytes(a ^ b for a, b in zip(key, tail))
+    return failures
+
+# Checks one-shot and incremental GCM against every record, that a changed tag, ciphertext or AAD is rejected
+# and that str input is treated as its UTF-8 bytes
+def check_gcm(engine: str, path: str) -> list[str]:
+    failures = []
+    name = os.path.basename(path)
+    rng = random.Random(0)
+    for section, records in load_rsp(path).items():
+        for rec in records:
+            case = f'{name} [{section}] COUNT={rec["COUNT"]}'
+            gcm = GCM(rec['Key'], engine=engine, tag_length=len(rec['Tag']))
+            iv, pt, aad, ct, tag = rec['IV'], rec['PT'], rec['AAD'], rec['CT'], rec['Tag']
+            if gcm.encrypt(iv, pt, aad) != (ct, tag):
+                failures.append(f'{case} encrypt')
+            try:
+                if gcm.decrypt(iv, ct, tag, aad) != pt:
+                    failures.append(f'{case} decrypt')
+            except InvalidTag:
+                failures.append(f'{case} decrypt rejected a valid tag')
+            # Same message fed in random pieces
+            step = rng.randrange(1, 40)
+            enc, dec = gcm.encryptor(iv), gcm.decryptor(iv)
+            for idx in range(0, len(aad), step):
+                enc.update_aad(aad[idx : idx + step])
+                dec.update_aad(aad[idx : idx + step])
+            out, plain = bytearray(), bytearray()
+            for idx in range(0, len(pt), step):
+                out += enc.update(pt[idx : idx + step])
+                plain += dec.update(ct[idx : idx + step])
+            out += enc.finalize()
+            try:
+                plain += dec.finalize(tag)
+            except InvalidTag:
+                failures.append(f'{case} decryptor rejected a valid tag')
+            if out != ct or enc.tag != tag or plain != pt:
+                failures.append(f'{case} incremental')
+            forgeries = [(ct, bytes([tag[0] ^ 1]) + tag[1:], aad), (ct, tag, aad + b'\x00')]
+            if ct:
+                forgeries.append((bytes([ct[0] ^ 0x80]) + ct[1:], tag, aad))
+            for forged_ct, forged_tag, forged_aad in forgeries:
+                try:
+                    gcm.decrypt(iv, forged_ct, forged_tag, forged_aad)
+                    failures.append(f'{case} forgery accepted')
+                except InvalidTag:
+                    pass
+    # str payload and AAD are encoded as UTF-8; the AAD length in the tag is its byte length
+    gcm, text, note = GCM(bytes(16), engine=engine), 'Grüße, 世界', 'Äad'
+    ct, tag = gcm.encrypt(bytes(12), text, note)
+    if (ct, tag) != gcm.encrypt(bytes(12), text.encode(), note.encode()):
+        failures.append(f'{name} str input')
+    elif gcm.decrypt(bytes(12), ct, tag, note) != text.encode():
+        failures.append(f'{name} str decrypt')
+    return failures
+
+# Runs random keys, modes, IVs and inputs through every engine and API and compares against the reference engine
+def fuzz(engines, iterations: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    failures = []
+    for i in range(iterations):
+        key = rng.randbytes(rng.choice((16, 24, 32)))
+        mode = rng.choice(MODES)
+        iv = rng.randbytes(rng.choice((12, 16)) if mode == 'ctr' else 16) if mode != 'ecb' else None
+        data = rng.randbytes(rng.choice((0, 1, 15, 16, 17, rng.randrange(256), rng.randrange(4096))))
+        padding = rng.random() < 0.8
+        chunk_size = 16 * rng.randrange(1, 64)
+        case = f'case {i} (mode={mode}, key={len(key) * 8}, len={len(data)}, padding={padding})'
+        expected = Rijndael(key, engine=REFERENCE_ENGINE, mode=mode, iv=iv).encrypt(data, add_padding=padding)
+        for engine in engines:
+            r = Rijndael(key, engine=engine, mode=mode, iv=iv)
+            ciphertext = r.encrypt(data, add_padding=padding)
+            if ciphertext != expected:
+                failures.append(f'{engine} encrypt {case}')
+                continue
+            plaintext = r.decrypt(ciphertext, remove_padding=padding)
+            if padding or mode == 'ctr':
+                if plaintext != data:
+                    failures.append(f'{engine} decrypt {case}')
+            elif plaintext[:len(data)] != data:
+                failures.append(f'{engine} decrypt {case}')
+            out = io.BytesIO()
+            r.encrypt_stream(io.BytesIO(data), out, chunk_size, add_padding=padding)
+            if out.getvalue() != expected:
+                failures.append(f'{engine} encrypt_stream {case}')
+            # Incremental objects fed in random sized pieces, including empty ones
+            enc = r.encryptor(add_padding=padding)
+            if b''.join(enc.update(piece) for piece in _split(rng, data)) + enc.finalize() != expected:
+                failures.append(f'{engine} encryptor {case}')
+            dec = r.decryptor(remove_padding=padding)
+            if b''.join(dec.update(piece) for piece in _split(rng, expected)) + dec.finalize() != plaintext:
+                failures.append(f'{engine} decryptor {case}')
+    return failures
+
+# Splits data into random sized pieces (0 to 40 bytes)
+def _split(rng: random.Random, data: bytes) -> list[bytes]:
+    pieces = []
+    idx = 0
+    while idx < len(data):
+        size = rng.randrange(41)
+        pieces.append(data[idx : idx + size])
+        idx += size
+    return pieces
+
+# Encrypting twice with an instance that was given no IV must not reuse the IV: the CBC first blocks and the
+# CTR keystreams (ciphertext XOR plaintext) of the two messages must differ, and each must decrypt
+def check_fresh_iv() -> list[str]:
+    failures = []
+    data = bytes(64)
+    for mode in IV_MODES:
+        r = Rijndael(os.urandom(16), engine='ttable', mode=mode)
+        first, first_iv = r.encrypt(data), r.iv
+        second, second_iv = r.encrypt(data), r.iv
+        if first_iv == second_iv or first[:16] == second[:16]:
+            failures.append(f'{mode} reuses the IV across encrypt() calls')
+        if r.decrypt(first, iv=first_iv) != data or r.decrypt(second) != data:
+            failures.append(f'{mode} decrypt with the generated IV')
+        first, second = r.encryptor(), r.encryptor()
+        if first.iv == second.iv or first.update(data) == second.update(data):
+            failures.append(f'{mode} reuses the IV across encryptors')
+    return failures
+
+# Decrypting blocks that don't end in valid PKCS#7 padding must raise ValueError, never return a bad size
+def check_bad_padding() -> list[str]:
+    failures = []
+    tails = (b'\x00', b'\x11', b'\xff', b'\x01\x02', b'\x03\x03')
+    for mode in ('ecb', 'cbc'):
+        r = Rijndael(os.urandom(16), engine='ttable', mode=mode, iv=bytes(16))
+        for tail in tails:
+            ciphertext = r.encrypt(bytes(16 - len(tail)) + tail, add_padding=False)
+            try:
+                r.decrypt(ciphertext)
+                failures.append(f'{mode} accepted padding ending {tail.hex()}')
+            except ValueError:
+                pass
+            dec = r.decryptor()
+            try:
+                dec.update(ciphertext)
+                dec.finalize()
+                failures.append(f'{mode} decryptor accepted padding ending {tail.hex()}')
+            except ValueError:
+                pass
+    return failures
+
+# Runs random batches of (key, message) records through BatchCipher and compares every record against the
+# reference engine
+def check_batch(iterations: int, seed: int) -> list[str]:
+    from src.multikey import BatchCipher
+    rng = random.Random(seed)
+    failures = []
+    for i in range(iterations):
+        mode = rng.choice(MODES)
+        padding = rng.random() < 0.8
+        keys = [rng.randbytes(rng.choice((16, 24, 32))) for _ in range(rng.randrange(1, 20))]
+        messages = [rng.randbytes(rng.choice((0, 1, 16, 17, rng.randrange(100)))) for _ in keys]
+        # A str record whose UTF-8 encoding is longer than the string
+        keys.append(rng.randbytes(16))
+        messages.append('Grüße, 世界'[:rng.randrange(1, 10)])
+        ivs = None
+        if mode != 'ecb':
+            ivs = [rng.randbytes(rng.choice((12, 16)) if mode == 'ctr' else 16) for _ in keys]
+        batch = BatchCipher(mode)
+        ciphertexts = batch.encrypt(keys, messages, add_padding=padding, ivs=ivs)
+        plaintexts = batch.decrypt(keys, ciphertexts, remove_padding=padding, ivs=ivs)
+        for idx, (key, message) in enumerate(zip(keys, messages)):
+            r = Rijndael(key, engine=REFERENCE_ENGINE, mode=mode, iv=ivs[idx] if ivs else None)
+            expected = r.encrypt(message, add_padding=padding)
+            if ciphertexts[idx] != expected:
+                failures.append(f'encrypt case {i} record {idx} (mode={mode}, key={len(key) * 8}, len={len(message)})')
+            elif plaintexts[idx] != r.decrypt(expected, remove_padding=padding):
+                failures.append(f'decrypt case {i} record {idx} (mode={mode}, key={len(key) * 8}, len={len(message)})')
+    return failures
+
+# Encrypts a small random tree into containers with the job runner (every mode), then checks the container
+# bodies against the reference engine, random access reads and the decrypted tree
+def check_containers(seed: int) -> list[str]:
+    rng = random.Random(seed)
+    chunk_size = 16 * rng.randrange(1, 64)
+    sizes = [0, 1, 15, 16, chunk_size, chunk_size + 1, rng.randrange(10 * chunk_size)]
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        src_dir = os.path.join(tmp, 'plain')
+        os.makedirs(os.path.join(src_dir, 'sub'))
+        files = {}
+        for i, size in enumerate(sizes):
+            name = os.path.join('sub' if i % 2 else '', f'file{i}')
+            files[name] = rng.randbytes(size)
+            with open(os.path.join(src_dir, name), 'wb') as f:
+                f.write(files[name])
+        for mode in MODES:
+            key = rng.randbytes(rng.choice((16, 24, 32)))
+            cipher = Rijndael(key, engine='ttable', mode=mode)
+            enc_dir, dec_dir = os.path.join(tmp, f'{mode}.enc'), os.path.join(tmp, f'{mode}.dec')
+            runner = ContainerJobRunner(cipher, workers=1, chunk_size=chunk_size)
+            runner.encrypt_tree(src_dir, enc_dir)
+            runner.decrypt_tree(enc_dir, dec_dir)
+            for name, data in files.items():
+                case = f'{mode} {len(data)} bytes, chunk size {chunk_size}'
+                path = os.path.join(enc_dir, name + '.rjc')
+                with open(path, 'rb') as f:
+                    container = f.read()
+                header = ContainerHeader.unpack(container)
+                reference = Rijndael(key, engine=REFERENCE_ENGINE, mode=mode)
+                for idx in range(header.chunk_count()):
+                    chunk = data[idx * chunk_size : (idx + 1) * chunk_size]
+                    iv = None
+                    if mode == 'cbc':
+                        iv = reference.encrypt((int.from_bytes(header.iv) ^ idx).to_bytes(16), False, bytes(16))
+                    elif mode == 'ctr':
+                        iv = ((int.from_bytes(header.iv) + idx * chunk_size // 16) % (1 << 128)).to_bytes(16)
+                    start = header.offset(idx)
+                    if container[start : start + header.cipher_size(idx)] != reference.encrypt(chunk, False, iv):
+                        failures.append(f'{case}: chunk {idx} differs from the reference')
+                    if read_chunk(cipher, path, idx) != chunk:
+                        failures.append(f'{case}: read_chunk({idx})')
+                start = rng.randrange(len(data) + 1)
+                if read_range(cipher, path, start, 3 * chunk_size // 2) != data[start : start + 3 * chunk_size // 2]:
+                    failures.append(f'{case}: read_range({start})')
+                if len(container) != header.container_size() or len(container) < HEADER.size:
+                    failures.append(f'{case}: container size')
+                with open(os.path.join(dec_dir, name), 'rb') as f:
+                    if f.read() != data:
+                        failures.append(f'{case}: decrypted file differs')
+    return failures
+
+def _report(title: str, failures: list[str]) -> bool:
+    print(f'{"PASS" if not failures else "FAIL"}  {title}')
+    for failure in failures[:10]:
+        print(f'      {failure}')
+    if len(failures) > 10:
+        print(f'      ... {len(failures) - 10} more')
+    return not failures
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m src.verify', description='Rijndael verification harness')
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES),
+                        help=f'engines to verify (default: all available: {", ".join(ENGINES)})')
+    parser.add_argument('--mct', type=int, default=10, metavar='N',
+                        help='Monte Carlo records per file and direction, 0-100 (default 10; 100 is the full test)')
+    parser.add_argument('--fuzz', type=int, default=200, metavar='N', help='differential fuzz cases (default 200)')
+    parser.add_argument('--seed', type=int, default=None, help='fuzzer seed (default: random)')
+    args = parser.parse_args(argv)
+    unknown = [e for e in args.engines if e not in ENGINES]
+    if unknown:
+        parser.error(f'unknown or unavailable engine(s): {", ".join(unknown)}')
+
+    ok = _report('constants.py tables', check_constants())
+    ok &= _report('fresh IV per encryption', check_fresh_iv())
+    ok &= _report('invalid padding rejected', check_bad_padding())
+    for engine in args.engines:
+        for name in KAT_FILES:
+            ok &= _report(f'{engine:<8} KAT {name}', check_kat(engine, os.path.join(VECTOR_DIR, name)))
+        if args.mct:
+            for name in MCT_FILES:
+                ok &= _report(f'{engine:<8} MCT {name} ({args.mct} records)',
+                              check_mct(engine, os.path.join(VECTOR_DIR, name), args.mct))
+        for name in GCM_FILES:
+            ok &= _report(f'{engine:<8} GCM {name}', check_gcm(engine, os.path.join(VECTOR_DIR, name)))
+    if args.fuzz:
+        seed = random.randrange(2 ** 32) if args.seed is None else args.seed
+        ok &= _report(f'fuzz {args.fuzz} cases against {REFERENCE_ENGINE} (seed {seed})',
+                      fuzz(args.engines, args.fuzz, seed))
+        ok &= _report(f'chunked containers, all modes (seed {seed})', check_containers(seed))
+        if NUMPY_AVAILABLE:
+            batches = max(1, args.fuzz // 10)
+            ok &= _report(f'multi-key batches {batches} cases against {REFERENCE_ENGINE} (seed {seed})',
+                          check_batch(batches, seed))
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())